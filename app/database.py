@@ -1,27 +1,142 @@
-from sqlalchemy import create_engine
+import os
+import time
+from contextvars import ContextVar
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker, declarative_base
 from dotenv import load_dotenv
-import os
 
 # Load .env file
 load_dotenv()
 
 SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL")
+# Optional streaming replica for read-only routes (listings, lookups, analytics, exports)
+SQLALCHEMY_REPLICA_URL = os.getenv("DATABASE_REPLICA_URL")
+# After a request writes, the same client reads from the primary for this long (covers replica lag)
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", "5"))
+READ_PRIMARY_COOKIE = "read_primary_until"
+READ_PRIMARY_HEADER = "x-read-primary-until"
+
+
+def _engine(url: str, role: str):
+    """Pool size per role: DB_WRITE_POOL_SIZE / DB_WRITE_MAX_OVERFLOW, DB_READ_POOL_SIZE / DB_READ_MAX_OVERFLOW."""
+    options = {}
+    if not url.startswith("sqlite"):
+        options = {
+            "pool_size": int(os.getenv(f"DB_{role}_POOL_SIZE", "5")),
+            "max_overflow": int(os.getenv(f"DB_{role}_MAX_OVERFLOW", "10")),
+            "pool_pre_ping": True,
+        }
+    return create_engine(url, **options)
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+
+engine = _engine(SQLALCHEMY_DATABASE_URL, "WRITE")
+# Without a replica, reads share the primary engine (and its pool)
+read_engine = _engine(SQLALCHEMY_REPLICA_URL, "READ") if SQLALCHEMY_REPLICA_URL else engine
 
 SessionLocal = sessionmaker(
     autocommit=False,
     autoflush=False,
     bind=engine
 )
+ReadSessionLocal = sessionmaker(
+    autocommit=False,
+    autoflush=False,
+    bind=read_engine
+)
 
 Base = declarative_base()
 
-# Dependency
+def insert_for(db):
+    """Returns the dialect-specific insert() so bulk writes can use ON CONFLICT upserts."""
+    if db.get_bind().dialect.name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        from sqlalchemy.dialects.postgresql import insert
+    return insert
+
+# --- READ-YOUR-WRITES ---
+# Per request: {"pinned": reads must go to the primary, "wrote": this request committed}
+_routing = ContextVar("db_routing", default=None)
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _note_write(session):
+    state = _routing.get()
+    if state is not None:
+        state["wrote"] = True
+
+
+class ReadYourWritesMiddleware:
+    """
+    Pure ASGI. A request that commits on the primary gets a `read_primary_until`
+    cookie and an X-Read-Primary-Until header (epoch seconds); requests that carry
+    either within that window have their get_read_db sessions sent to the primary,
+    so a client never reads back older data than it just wrote. Clients that
+    do not keep cookies echo the header.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    @staticmethod
+    def _until(scope) -> float:
+        headers = dict(scope["headers"])
+        value = headers.get(READ_PRIMARY_HEADER.encode())
+        if value is None:
+            for part in headers.get(b"cookie", b"").decode("latin-1").split(";"):
+                name, _, cookie = part.strip().partition("=")
+                if name == READ_PRIMARY_COOKIE:
+                    value = cookie.encode()
+        try:
+            return float(value) if value else 0.0
+        except ValueError:
+            return 0.0
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or read_engine is engine:
+            return await self.app(scope, receive, send)
+
+        state = {"pinned": self._until(scope) > time.time(), "wrote": False}
+        token = _routing.set(state)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and state["wrote"]:
+                until = f"{time.time() + READ_YOUR_WRITES_SECONDS:.3f}"
+                message["headers"] = list(message.get("headers", [])) + [
+                    (READ_PRIMARY_HEADER.encode(), until.encode()),
+                    (b"set-cookie", f"{READ_PRIMARY_COOKIE}={until}; Max-Age={int(READ_YOUR_WRITES_SECONDS) + 1}; "
+                                    f"Path=/; HttpOnly; SameSite=Lax".encode()),
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _routing.reset(token)
+
+
+def read_session():
+    """Replica session, or a primary one while the caller is inside its read-your-writes window."""
+    state = _routing.get()
+    if state is not None and state["pinned"]:
+        return SessionLocal()
+    return ReadSessionLocal()
+
+# Dependencies
 def get_db():
+    """Primary session: every route that writes, and reads that must see the latest commit."""
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+get_write_db = get_db
+
+def get_read_db():
+    """Read-only routes: the replica when DATABASE_REPLICA_URL is set, else the primary."""
+    db = read_session()
+    try:
+        yield db
+    finally:
+        db.close()
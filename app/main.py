@@ -1,18 +1,38 @@
+import logging
+import os
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware # Missing import
-from app.database import engine, Base
 
-# 1. IMPORT ALL MODELS FIRST (Must be before create_all)
-from app.models.cell import Cell
-from app.models.template import BatteryTemplate 
-from app.models.battery import BatteryPack, PackTestResult
-from app.models.grading import GradingStepResult
+# 1. REGISTER ALL MODELS (relationship("...") strings resolve against the full registry)
+from app import models  # noqa: F401
 
 # 2. IMPORT ROUTERS
-from app.routers import cell_router, template_router, battery_router
+# Upload parsers import pandas/openpyxl on first use, so starting a worker stays cheap
+from app.routers import (
+    cell_router, template_router, battery_router, job_router, dashboard_router, analytics_router, export_router,
+    dispatch_router, event_router,
+)
+from app.services.dashboard_service import DashboardService
+from app.services.event_bus import EventBus, EventContextMiddleware
+from app.services.job_queue import JobQueue
+from app.services.metrics import REGISTRY, MetricsMiddleware
+from app.services.sql_profiler import SQLProfiler, SQLProfilerMiddleware
+from app.services.uploads import UploadLimitMiddleware
+from app.database import ReadSessionLocal, ReadYourWritesMiddleware, SessionLocal, engine, read_engine
+from app.services.process_pool import shutdown_parse_pool
+
+logging.basicConfig(
+    level=os.getenv("LOG_LEVEL", "INFO"),
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+)
 
-# 3. CREATE TABLES
-Base.metadata.create_all(bind=engine)
+# 3. SCHEMA
+# Managed by versioned migrations (`python -m app.migrate`), run once per deploy
+# rather than by every worker. AUTO_MIGRATE=1 applies them here for local dev.
+if os.getenv("AUTO_MIGRATE") == "1":
+    from app.migrate import migrate
+    migrate()
 
 app = FastAPI(title="Maxvolt Energy Production Portal")
 
@@ -24,6 +44,25 @@ app.add_middleware(
     allow_methods=["*"],  # This enables OPTIONS, POST, GET, etc.
     allow_headers=["*"],
 )
+# Oversized bodies (MAX_UPLOAD_MB) get a 413 before they are spooled to disk
+app.add_middleware(UploadLimitMiddleware)
+# Tags events raised by a request with the X-Station header of the writing station
+app.add_middleware(EventContextMiddleware)
+# DATABASE_REPLICA_URL: clients that just wrote keep reading from the primary for a few seconds
+app.add_middleware(ReadYourWritesMiddleware)
+# Outermost, so latency covers CORS and the full (possibly streamed) response
+app.add_middleware(MetricsMiddleware)
+
+# Opt-in query profiling: SQL_PROFILE=1 adds X-Query-Count headers, slow-query
+# EXPLAIN logging and N+1 warnings (see app/services/sql_profiler.py)
+if SQLProfiler.enabled():
+    SQLProfiler.install(engine, SessionLocal)
+    if read_engine is not engine:
+        SQLProfiler.install(read_engine, ReadSessionLocal)
+    app.add_middleware(SQLProfilerMiddleware)
+
+# Write paths stage events on their session; they reach /events streams on commit
+EventBus.install(SessionLocal)
 
 # 5. INCLUDE ROUTERS
 # Note: Ensure the 'prefix' in your routers matches what the frontend calls.
@@ -31,7 +70,32 @@ app.add_middleware(
 app.include_router(cell_router.router)
 app.include_router(template_router.router)
 app.include_router(battery_router.router)
+app.include_router(job_router.router)
+app.include_router(dashboard_router.router)
+app.include_router(analytics_router.router)
+app.include_router(export_router.router)
+app.include_router(dispatch_router.router)
+app.include_router(event_router.router)
+
+# 6. BACKGROUND WORKERS (drain the ingest_jobs queue, reconcile dashboard counters, relay events)
+@app.on_event("startup")
+def start_background_workers():
+    JobQueue.start_workers()
+    DashboardService.start_reconciler()
+    EventBus.start_broker(engine)
+
+@app.on_event("shutdown")
+def stop_background_workers():
+    EventBus.stop_broker()
+    DashboardService.stop_reconciler()
+    JobQueue.stop_workers()
+    shutdown_parse_pool()
 
 @app.get("/")
 def home():
-    return {"message": "Maxvolt Backend is Live"}
\ No newline at end of file
+    return {"message": "Maxvolt Backend is Live"}
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """Prometheus scrape target: route latency, per-stage upload timings, row and failure counts."""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
\ No newline at end of file
@@ -0,0 +1,74 @@
+"""
+Schema migration runner. Run once per deploy, before the API starts:
+
+    python -m app.migrate            # apply pending migrations
+    python -m app.migrate --status   # list applied / pending versions
+
+The API process itself no longer touches the schema on startup.
+"""
+import sys
+from datetime import datetime
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, select, text
+from app.database import engine
+import app.models  # noqa: F401  (registers every table on Base.metadata)
+from app.migrations import discover
+
+# Arbitrary key for pg_advisory_lock so two deploys cannot migrate at once
+MIGRATION_LOCK_KEY = 7781_0001
+
+schema_version = Table(
+    "schema_version",
+    MetaData(),
+    Column("version", Integer, primary_key=True),
+    Column("name", String(200), nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+
+def applied_versions(conn) -> set:
+    return set(conn.execute(select(schema_version.c.version)).scalars())
+
+
+def migrate(bind=engine) -> list:
+    """Applies pending migrations in order; returns the versions applied."""
+    applied = []
+    with bind.connect() as lock_conn:
+        postgres = bind.dialect.name == "postgresql"
+        if postgres:
+            lock_conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": MIGRATION_LOCK_KEY})
+        try:
+            with bind.begin() as conn:
+                schema_version.create(conn, checkfirst=True)
+                done = applied_versions(conn)
+            for version, name, module in discover():
+                if version in done:
+                    continue
+                # One transaction per step: a failure leaves earlier steps recorded
+                with bind.begin() as conn:
+                    module.upgrade(conn)
+                    conn.execute(schema_version.insert().values(
+                        version=version, name=name, applied_at=datetime.now()
+                    ))
+                print(f"Applied migration {version:04d} {name}")
+                applied.append(version)
+        finally:
+            if postgres:
+                lock_conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": MIGRATION_LOCK_KEY})
+                lock_conn.commit()
+    return applied
+
+
+def status(bind=engine):
+    with bind.begin() as conn:
+        schema_version.create(conn, checkfirst=True)
+        done = applied_versions(conn)
+    for version, name, _ in discover():
+        print(f"{version:04d} {name:<40} {'applied' if version in done else 'PENDING'}")
+
+
+if __name__ == "__main__":
+    if "--status" in sys.argv[1:]:
+        status()
+    else:
+        applied = migrate()
+        print(f"Schema up to date ({len(applied)} migration(s) applied)")
@@ -0,0 +1,53 @@
+"""
+Versioned schema migrations, applied by `python -m app.migrate`.
+
+Each module here is named vNNNN_<description>.py and defines
+`upgrade(conn)`. Steps run in version order, each in its own transaction,
+and are recorded in the schema_version table. Because the baseline builds
+tables from the current models, later steps must be idempotent (use the
+helpers below, which check before they create).
+"""
+import importlib
+import pkgutil
+from sqlalchemy import inspect, text
+from app.database import Base
+
+
+def discover() -> list:
+    """[(version, name, module)] sorted by version."""
+    steps = []
+    for info in pkgutil.iter_modules(__path__):
+        if not info.name.startswith("v"):
+            continue
+        version, _, name = info.name[1:].partition("_")
+        steps.append((int(version), name, importlib.import_module(f"{__name__}.{info.name}")))
+    return sorted(steps, key=lambda step: step[0])
+
+
+def create_tables(conn, *names):
+    Base.metadata.create_all(conn, tables=[Base.metadata.tables[n] for n in names], checkfirst=True)
+
+
+def create_indexes(conn, *table_names):
+    """Creates every Index declared on the given models' tables that does not exist yet."""
+    for name in table_names:
+        existing = {ix["name"] for ix in inspect(conn).get_indexes(name)}
+        for index in Base.metadata.tables[name].indexes:
+            if index.name not in existing:
+                index.create(conn)
+
+
+def add_column(conn, table_name: str, column_name: str):
+    """ALTER TABLE ... ADD COLUMN for a model column missing from an older database."""
+    if column_name in {c["name"] for c in inspect(conn).get_columns(table_name)}:
+        return
+    column = Base.metadata.tables[table_name].c[column_name]
+    conn.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {column.name} {column.type.compile(conn.dialect)}"))
+
+
+def set_not_null(conn, table_name: str, column_name: str):
+    """ALTER COLUMN ... SET NOT NULL once the model says so (SQLite cannot alter columns; callers backfill)."""
+    column = next(c for c in inspect(conn).get_columns(table_name) if c["name"] == column_name)
+    if not column["nullable"] or conn.dialect.name == "sqlite":
+        return
+    conn.execute(text(f"ALTER TABLE {table_name} ALTER COLUMN {column_name} SET NOT NULL"))
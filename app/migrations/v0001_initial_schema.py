@@ -0,0 +1,12 @@
+"""Tables that existed when the schema was still built with create_all()."""
+from app.migrations import create_tables
+
+
+def upgrade(conn):
+    create_tables(
+        conn,
+        "battery_templates", "cells", "battery_packs", "pack_cell_mapping", "pack_test_results",
+        "pdi_checklists", "bms_inventory", "grading_step_results", "battery_dispatch",
+        "pdi_checkpoints", "pdi_sessions", "pdi_results",
+        "ingest_jobs", "cache_versions", "production_counters",
+    )
@@ -0,0 +1,10 @@
+"""
+Databases first built by create_all() got new tables but never the columns
+and indexes later added to existing tables (create_all only checks tables).
+"""
+from app.migrations import add_column, create_indexes
+
+
+def upgrade(conn):
+    add_column(conn, "pack_test_results", "tested_at")
+    create_indexes(conn, "cells", "battery_packs", "grading_step_results", "ingest_jobs")
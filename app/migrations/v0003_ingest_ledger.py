@@ -0,0 +1,6 @@
+"""SHA-256 ledger of ingested uploads (idempotent re-uploads)."""
+from app.migrations import create_tables
+
+
+def upgrade(conn):
+    create_tables(conn, "ingest_ledger")
@@ -0,0 +1,6 @@
+"""Invoice and customer lookup indexes for battery_dispatch."""
+from app.migrations import create_indexes
+
+
+def upgrade(conn):
+    create_indexes(conn, "battery_dispatch")
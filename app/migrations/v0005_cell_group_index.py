@@ -0,0 +1,6 @@
+"""(capacity_group, grading_date, cell_id) index for GET /cells filtered by group alone."""
+from app.migrations import create_indexes
+
+
+def upgrade(conn):
+    create_indexes(conn, "cells")
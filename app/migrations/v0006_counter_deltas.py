@@ -0,0 +1,6 @@
+"""Insert-only production_counter_deltas log the write paths append to instead of upserting counters."""
+from app.migrations import create_tables
+
+
+def upgrade(conn):
+    create_tables(conn, "production_counter_deltas")
@@ -0,0 +1,14 @@
+"""cells.grading_date NOT NULL, so the (grading_date, cell_id) keyset of GET /cells reaches every row."""
+from datetime import datetime
+from sqlalchemy import update
+from app.database import Base
+from app.migrations import set_not_null
+
+# Cells from before grading_date was always set; they sort after every dated cell
+UNKNOWN_GRADING_DATE = datetime(1970, 1, 1)
+
+
+def upgrade(conn):
+    cells = Base.metadata.tables["cells"]
+    conn.execute(update(cells).where(cells.c.grading_date.is_(None)).values(grading_date=UNKNOWN_GRADING_DATE))
+    set_not_null(conn, "cells", "grading_date")
@@ -3,3 +3,8 @@ from .cell import *
 from .grading import *
 from .pdi import *
 from .dispatch import *
+from .job import *
+from .cache_version import *
+from .dashboard import *
+from .template import *
+from .ingest_ledger import *
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, Boolean, String, Date, Numeric, ForeignKey, Table, DateTime
+from sqlalchemy import Column, Integer, Boolean, String, Date, Numeric, ForeignKey, Table, DateTime, Index
 from sqlalchemy.orm import relationship
 from app.database import Base
 from datetime import datetime
@@ -32,6 +32,13 @@ class BatteryPack(Base):
     # Link to the BMS unit
     bms_unit = relationship("BMSInventory", back_populates="mounted_pack")
 
+    # GET /battery-packs filters; each ends in the (assembly_date, battery_id) keyset
+    __table_args__ = (
+        Index("ix_packs_assembled", "assembly_date", "battery_id"),
+        Index("ix_packs_status_assembled", "final_status", "assembly_date", "battery_id"),
+        Index("ix_packs_model_assembled", "model_name", "assembly_date", "battery_id"),
+    )
+
 class PackTestResult(Base):
     __tablename__ = "pack_test_results"
     
@@ -47,6 +54,7 @@ class PackTestResult(Base):
     avg_voltage = Column(Numeric(10, 3))
 
     status = Column(String(50)) 
+    tested_at = Column(DateTime, default=datetime.now)  # Daily yield is bucketed on this
     battery = relationship("BatteryPack", back_populates="test_results")
 
 class BMSInventory(Base):
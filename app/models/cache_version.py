@@ -0,0 +1,10 @@
+from sqlalchemy import Column, Integer, String
+from app.database import Base
+
+
+class CacheVersion(Base):
+    """Version counter per cached table; bumping it invalidates that cache in every worker."""
+    __tablename__ = "cache_versions"
+
+    name = Column(String(100), primary_key=True)  # e.g. 'battery_templates'
+    version = Column(Integer, nullable=False, default=0)
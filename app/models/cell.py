@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Numeric, Boolean, DateTime
+from sqlalchemy import Column, String, Numeric, Boolean, DateTime, Index
 from sqlalchemy.orm import relationship
 from app.database import Base # Ensure this import is present!
 from datetime import datetime
@@ -7,7 +7,7 @@ class Cell(Base):
     __tablename__ = "cells"
 
     cell_id = Column(String(100), primary_key=True, index=True)
-    grading_date = Column(DateTime, default=datetime.now)
+    grading_date = Column(DateTime, nullable=False, default=datetime.now)  # GET /cells keyset
     
     # Use (10, 3) for high precision (e.g., 102.328 Ah)
     actual_cap_ah = Column(Numeric(10, 3))     
@@ -20,5 +20,16 @@ class Cell(Base):
     
     battery_packs = relationship("BatteryPack", secondary="pack_cell_mapping", back_populates="cells")
     grading_results = relationship("GradingStepResult", back_populates="cell", cascade="all, delete-orphan")
+
+    # Auto-fill scans unused cells in capacity order; the rest back GET /cells
+    # filters (group and/or is_used, either alone) and end in the (grading_date, cell_id) keyset
+    __table_args__ = (
+        Index("ix_cells_unused_capacity", "is_used", "actual_cap_ah"),
+        Index("ix_cells_graded", "grading_date", "cell_id"),
+        Index("ix_cells_used_graded", "is_used", "grading_date", "cell_id"),
+        Index("ix_cells_group_graded", "capacity_group", "grading_date", "cell_id"),
+        Index("ix_cells_group_used_graded", "capacity_group", "is_used", "grading_date", "cell_id"),
+    )
+
     def __repr__(self):
         return f"<Cell(id={self.cell_id}, capacity={self.actual_cap_ah})>"
\ No newline at end of file
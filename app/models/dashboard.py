@@ -0,0 +1,29 @@
+from sqlalchemy import Column, String, BigInteger, Integer
+from app.database import Base
+
+
+class ProductionCounter(Base):
+    """
+    Pre-aggregated floor dashboard numbers, folded in from production_counter_deltas.
+    metric: 'pack_status' | 'cells' | 'daily_test' | 'daily_pdi'
+    key:    status, 'group|used', or 'YYYY-MM-DD|model|PASS'
+    """
+    __tablename__ = "production_counters"
+
+    metric = Column(String(50), primary_key=True)
+    key = Column(String(200), primary_key=True)
+    value = Column(BigInteger, nullable=False, default=0)
+
+
+class ProductionCounterDelta(Base):
+    """
+    Insert-only change log the write paths append to inside their own
+    transaction, so no two writers ever wait on the same counter row.
+    The reconciler folds these into production_counters and deletes them.
+    """
+    __tablename__ = "production_counter_deltas"
+
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True)
+    metric = Column(String(50), nullable=False)
+    key = Column(String(200), nullable=False)
+    delta = Column(BigInteger, nullable=False)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Index
 from app.database import Base
 from datetime import datetime
 
@@ -12,3 +12,9 @@ class BatteryDispatch(Base):
     invoice_number = Column(String(100))
     sale_date = Column(DateTime, default=datetime.utcnow)
     sales_executive_signature = Column(String(100))
+
+    # GET /dispatch lookups; each ends in the (sale_date, sale_id) keyset
+    __table_args__ = (
+        Index("ix_dispatch_invoice_sold", "invoice_number", "sale_date", "sale_id"),
+        Index("ix_dispatch_customer_sold", "customer_name", "sale_date", "sale_id"),
+    )
@@ -7,7 +7,7 @@ class GradingStepResult(Base):
     __tablename__ = "grading_step_results"
 
     result_id = Column(Integer, primary_key=True, index=True)
-    cell_id = Column(String(100), ForeignKey("cells.cell_id"))
+    cell_id = Column(String(100), ForeignKey("cells.cell_id"), index=True)
     step_number = Column(Integer)
     step_type = Column(String(100))
     end_v = Column(Numeric(5, 3))
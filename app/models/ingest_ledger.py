@@ -0,0 +1,27 @@
+from sqlalchemy import Column, Integer, String, DateTime, JSON, UniqueConstraint
+from app.database import Base
+from datetime import datetime
+
+
+class IngestLedger(Base):
+    """
+    One row per distinct upload: SHA-256 of the file bytes plus what ingesting it produced.
+    scope separates uploads whose meaning depends on the request, e.g. the
+    battery_id a PDI checklist is posted against ('' when the file says it all).
+    """
+    __tablename__ = "ingest_ledger"
+
+    id = Column(Integer, primary_key=True)
+    kind = Column(String(50), nullable=False)                # 'grading', 'pack_test', 'pdi'
+    content_sha256 = Column(String(64), nullable=False)
+    scope = Column(String(100), nullable=False, default="")
+    status = Column(String(20), nullable=False)              # PROCESSING while claimed, then DONE
+    file_name = Column(String(255))
+    result = Column(JSON, nullable=True)                     # Response of the first successful ingest
+    hits = Column(Integer, nullable=False, default=0)        # Duplicate uploads answered from here
+    claimed_at = Column(DateTime, default=datetime.now)
+    finished_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        UniqueConstraint("kind", "content_sha256", "scope", name="uq_ingest_ledger_upload"),
+    )
@@ -0,0 +1,32 @@
+from sqlalchemy import Column, Integer, String, Text, DateTime, LargeBinary, JSON, Index
+from app.database import Base
+from datetime import datetime
+
+
+class IngestJob(Base):
+    """One queued upload (grading / pack test / PDI) waiting for a background worker."""
+    __tablename__ = "ingest_jobs"
+
+    job_id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String(50), nullable=False)            # 'grading', 'pack_test', 'pdi', 'pdi_batch'
+    status = Column(String(20), nullable=False, default="QUEUED")  # QUEUED / RUNNING / SUCCEEDED / FAILED
+    progress = Column(String(50), default="QUEUED")      # Stage inside a run: PARSING, WRITING, DONE
+
+    file_name = Column(String(255))
+    payload = Column(LargeBinary)                        # Raw upload, dropped once the job finishes
+    params = Column(JSON, default=dict)                  # e.g. {"battery_id": "..."} for PDI uploads
+
+    attempts = Column(Integer, default=0)
+    max_attempts = Column(Integer, default=3)
+    result = Column(JSON, nullable=True)
+    error = Column(Text, nullable=True)
+
+    created_at = Column(DateTime, default=datetime.now)
+    available_at = Column(DateTime, default=datetime.now)  # Pushed forward on retry (backoff)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+    # Workers claim the oldest available QUEUED job; status listing uses the same index
+    __table_args__ = (
+        Index("ix_ingest_jobs_status_available", "status", "available_at"),
+    )
@@ -0,0 +1,48 @@
+from datetime import datetime
+from typing import Literal, Optional
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.orm import Session
+from app.database import get_read_db
+from app.models.cell import Cell
+
+router = APIRouter(prefix="/analytics", tags=["Capacity Analytics"])
+
+
+@router.get("/cells")
+def cell_analytics(
+    capacity_group: Optional[str] = None,
+    is_used: Optional[bool] = None,
+    graded_from: Optional[datetime] = None,
+    graded_to: Optional[datetime] = None,
+    bins: int = Query(50, ge=1, le=500),
+    outlier_limit: int = Query(100, ge=0, le=1000),
+    db: Session = Depends(get_read_db)
+):
+    """Capacity distribution, per-group stats and OCV-vs-capacity outliers over graded cells."""
+    # NumPy is loaded on the first analytics call, not at worker start
+    from app.services.analytics_service import AnalyticsService
+
+    criteria = []
+    if capacity_group is not None:
+        criteria.append(Cell.capacity_group == capacity_group)
+    if is_used is not None:
+        criteria.append(Cell.is_used == is_used)
+    if graded_from is not None:
+        criteria.append(Cell.grading_date >= graded_from)
+    if graded_to is not None:
+        criteria.append(Cell.grading_date < graded_to)
+    return AnalyticsService.cell_report(db, criteria, bins, outlier_limit)
+
+
+@router.get("/templates/{model_name}")
+def template_analytics(
+    model_name: str,
+    scope: Literal["linked", "stock"] = "linked",
+    bins: int = Query(50, ge=1, le=500),
+    outlier_limit: int = Query(100, ge=0, le=1000),
+    db: Session = Depends(get_read_db)
+):
+    """Cp/Cpk against target_capacity_ah ± tolerance_ah for cells in this model's packs (or unused stock)."""
+    from app.services.analytics_service import AnalyticsService
+
+    return AnalyticsService.template_report(db, model_name, scope, bins, outlier_limit)
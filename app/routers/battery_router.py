@@ -1,21 +1,65 @@
-import io
-import pandas as pd
 from datetime import datetime
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Response, Query
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from app.database import get_db
-from app.models.battery import BatteryPack, PackTestResult
+from app.database import get_db, get_read_db
 from app.models.cell import Cell
-from app.models.template import BatteryTemplate
-from app.models.battery import BatteryPack, PackTestResult, BMSInventory
+from app.models.battery import BatteryPack, BMSInventory
+from app.schemas.battery import BulkCellLink
+from app.services.assembly_service import AssemblyService
+from app.services.battery_service import BatteryService
+from app.services.dashboard_service import DashboardService
+from app.services.dispatch_service import DISPATCHED_STATUS, PackDispatched
+from app.services.event_bus import EventBus
+from app.services.genealogy_service import GenealogyService
+from app.services.ingest_ledger import IngestLedgerService
+from app.services.job_queue import JobQueue
+from app.services.metrics import StageTimer, timed_parse
+from app.services.parser_registry import parse_upload
+from app.services.pagination import keyset_page, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from app.services.reservation_service import ReservationService
+from app.services.template_cache import TemplateCache
+from app.services.uploads import parse_slot, read_all, spooled
 
 router = APIRouter(prefix="/battery-packs", tags=["Phase 2 & 3: Assembly & Testing"])
 
+# --- PACK LISTING (keyset paginated, newest assembly first) ---
+
+@router.get("/")
+def list_packs(
+    final_status: Optional[str] = None,
+    model_name: Optional[str] = None,
+    assembled_from: Optional[datetime] = None,
+    assembled_to: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    db: Session = Depends(get_read_db)
+):
+    query = db.query(BatteryPack)
+    if final_status is not None:
+        query = query.filter(BatteryPack.final_status == final_status)
+    if model_name is not None:
+        query = query.filter(BatteryPack.model_name == model_name)
+    if assembled_from is not None:
+        query = query.filter(BatteryPack.assembly_date >= assembled_from)
+    if assembled_to is not None:
+        query = query.filter(BatteryPack.assembly_date < assembled_to)
+    return keyset_page(query, [BatteryPack.assembly_date, BatteryPack.battery_id], cursor, limit, descending=True)
+
+@router.get("/{battery_id}/genealogy")
+def get_pack_genealogy(battery_id: str, db: Session = Depends(get_read_db)):
+    """
+    Full trace for warranty claims: pack, template, BMS, every cell with its
+    grading steps, pack test results, PDI record and dispatch.
+    """
+    return GenealogyService.get(db, battery_id)
+
 # --- PHASE 2: ASSEMBLY ENDPOINTS ---
 
 @router.post("/start-assembly")
 def start_assembly(battery_id: str, model_name: str, db: Session = Depends(get_db)):
-    template = db.query(BatteryTemplate).filter_by(model_name=model_name).first()
+    template = TemplateCache.get(db, model_name)
     if not template:
         raise HTTPException(status_code=404, detail="Model template not found")
 
@@ -30,16 +74,17 @@ def start_assembly(battery_id: str, model_name: str, db: Session = Depends(get_d
         final_status="IN_PROGRESS"
     )
     db.add(new_pack)
-    db.commit()
+    DashboardService.pack_status_changed(db, None, "IN_PROGRESS")
+    EventBus.stage(db, "pack.started", {"battery_id": battery_id}, model=model_name)
+    ReservationService.commit_or_conflict(db, "Battery ID already exists")
     return {"status": "Success", "message": f"Pack {battery_id} initialized"}
 
 @router.post("/{battery_id}/link-cell/{cell_id}")
 def link_cell_to_pack(battery_id: str, cell_id: str, db: Session = Depends(get_db)):
-    pack = db.query(BatteryPack).filter_by(battery_id=battery_id).first()
-    if not pack:
-        raise HTTPException(status_code=404, detail="Battery Pack not found")
+    # Row lock on this pack only, so the slot count below cannot race another station
+    pack = AssemblyService.lock_open_pack(db, battery_id)
     
-    template = pack.template 
+    template = TemplateCache.get(db, pack.model_name)
     cell = db.query(Cell).filter_by(cell_id=cell_id).first()
     
     if not cell:
@@ -55,76 +100,86 @@ def link_cell_to_pack(battery_id: str, cell_id: str, db: Session = Depends(get_d
     if not (target - tolerance <= actual <= target + tolerance):
         raise HTTPException(status_code=400, detail="Capacity Tolerance Breach")
 
-    if len(pack.cells) >= template.cell_count_required:
+    # COUNT on the bridge table; len(pack.cells) would load every linked Cell
+    current = AssemblyService.linked_cell_count(db, battery_id)
+    if current >= template.cell_count_required:
         raise HTTPException(status_code=400, detail="Pack is full")
 
-    pack.cells.append(cell)
-    cell.is_used = True
-    db.commit()
-    return {"status": "Linked", "current_count": len(pack.cells)}
+    if not ReservationService.reserve_and_link(db, battery_id, [cell_id]):
+        db.rollback()
+        raise HTTPException(status_code=409, detail="Cell was claimed by another station")
+    DashboardService.cells_linked(db, [cell.capacity_group])
+    EventBus.stage(db, "pack.cells_linked", {
+        "battery_id": battery_id, "cell_ids": [cell_id], "current_count": current + 1
+    }, model=pack.model_name)
+    ReservationService.commit_or_conflict(db, "Cell was linked concurrently")
+    return {"status": "Linked", "current_count": current + 1}
+
+@router.post("/{battery_id}/link-cells")
+def link_cells_to_pack(battery_id: str, payload: BulkCellLink, db: Session = Depends(get_db)):
+    """
+    Links a whole scan list in one call. Valid cells are linked together;
+    the rest come back in 'rejected' with a reason.
+    """
+    if not payload.cell_ids:
+        raise HTTPException(status_code=400, detail="cell_ids is empty")
+    return AssemblyService.link_cells(db, battery_id, payload.cell_ids)
+
+@router.post("/{battery_id}/auto-fill")
+def auto_fill_pack(battery_id: str, balance_parallel: bool = True, db: Session = Depends(get_db)):
+    """
+    Picks the remaining cells for a pack from stock (tightest capacity spread
+    within the template tolerance), reserves and links them in one transaction.
+    """
+    return AssemblyService.auto_fill_pack(db, battery_id, balance_parallel)
 
 # --- PHASE 3: PACK GRADING (EXCEL PARSING) ---
 
 
 
 @router.post("/upload-pack-test")
-async def upload_pack_test(file: UploadFile = File(...), db: Session = Depends(get_db)):
-    # 1. Load Excel with multiple sheets
-    content = await file.read()
-    try:
-        excel_data = pd.ExcelFile(io.BytesIO(content))
-    except Exception:
-        raise HTTPException(status_code=400, detail="Invalid Excel file")
-
-    # 2. Extract Battery ID from 'Template Info' sheet (Header)
-    # The snippet shows Barcode is in the first row/cell
-    info_df = excel_data.parse("Template Info", header=None)
-    raw_barcode = str(info_df.iloc[0, 0]) 
-    battery_id = raw_barcode.replace("Barcode:", "").strip()
-
-    # 3. Extract Metrics from 'Step Layer' sheet
-    step_df = excel_data.parse("Step Layer")
-    
-    # We look for the 'Discharge' process as found in your Step Layer snippet
-    discharge_data = step_df[step_df['Process'] == 'Discharge']
-    if discharge_data.empty:
-        raise HTTPException(status_code=400, detail="No 'Discharge' step found in file")
-    
-    stats = discharge_data.iloc[0]
-    measured_cap = float(stats['Discharge Capacity(Ah)'])
-
-    # 4. Validation against DB
-    pack = db.query(BatteryPack).filter_by(battery_id=battery_id).first()
-    if not pack:
-        raise HTTPException(status_code=404, detail=f"Pack {battery_id} not registered in assembly")
-
-    template = pack.template
-    status = "PASS" if measured_cap >= float(template.target_capacity_ah) else "FAIL"
-
-    # 5. Create Test Result with enhanced attributes from Step Layer
-    test_result = PackTestResult(
-    battery_id=battery_id,
-    working_mode="Discharge",
-    cap_ah=float(measured_cap),  # <--- Convert here
-    end_v=float(stats['End Volt(V)']), # <--- Convert here
-    end_a=float(stats['Set Current(A)']), # <--- Convert here
-    energy_wh=float(stats.get('Discharge Energy(Wh)', 0)), # <--- Convert here
-    test_duration_min=float(stats.get('Step Time(Min)', 0)), # <--- Convert here
-    avg_voltage=float(stats.get('Discharge Mid Volt(V)', 0)), # <--- Convert here
-    status=status
-)
-    
-    pack.final_status = f"TESTED_{status}"
-    db.add(test_result)
-    db.commit()
+async def upload_pack_test(
+    response: Response,
+    file: UploadFile = File(...),
+    background: bool = False,
+    force: bool = False,
+    db: Session = Depends(get_db)
+):
+    """Re-uploading the same export returns the recorded verdict and adds no second PackTestResult."""
+    upload = spooled(file)
+    # Queue mode: accept now, a background worker parses and writes the result
+    if background:
+        duplicate = None if force else await run_in_threadpool(IngestLedgerService.seen, db, "pack_test", upload)
+        if duplicate:
+            return duplicate
+        timer = StageTimer("pack_test")
+        content = await file.read()
+        timer.lap("read")
+        job = await run_in_threadpool(JobQueue.enqueue, db, "pack_test", file.filename, content, {"force": force})
+        response.status_code = 202
+        return JobQueue.accepted(job)
+
+    def ingest():
+        with parse_slot():
+            try:
+                parsed = timed_parse("pack_test", parse_upload, "pack_test", upload)
+            except (ValueError, KeyError) as e:
+                raise HTTPException(status_code=400, detail=f"Pack test parsing failed: {e}")
+        return BatteryService.save_pack_test(db, parsed)
+
+    # Parsing and DB work are blocking; keep them off the event loop
+    return await run_in_threadpool(
+        IngestLedgerService.process, db, "pack_test", upload, ingest, file_name=file.filename, force=force
+    )
 
-    return {
-        "battery_id": battery_id,
-        "final_status": status,
-        "measured_ah": measured_cap,
-        "target_ah": template.target_capacity_ah,
-        "energy_wh": stats.get('Discharge Energy(Wh)')
-    }
+# Multi-channel testers: many exports (or one multi-channel workbook) per request
+@router.post("/upload-pack-test/batch")
+async def upload_pack_test_batch(files: List[UploadFile] = File(...), force: bool = False, db: Session = Depends(get_db)):
+    timer = StageTimer("pack_test_batch")
+    # Files stay spooled; each is read into bytes for a pool worker only when its parse is submitted
+    uploads = [(f.filename, spooled(f)) for f in files]
+    timer.lap("read")
+    return await run_in_threadpool(BatteryService.process_pack_test_batch, db, uploads, force)
 
 @router.post("/register-bms")
 def register_bms(bms_id: str, bms_model: str, db: Session = Depends(get_db)):
@@ -143,7 +198,7 @@ def register_bms(bms_id: str, bms_model: str, db: Session = Depends(get_db)):
         is_used=False
     )
     db.add(new_bms)
-    db.commit()
+    ReservationService.commit_or_conflict(db, "BMS ID already exists in inventory")
     return {"status": "Success", "message": f"BMS {bms_id} ({bms_model}) registered successfully"}
 
 
@@ -166,92 +221,94 @@ def mount_bms(battery_id: str, bms_id: str, db: Session = Depends(get_db)):
         raise HTTPException(status_code=400, detail="This BMS is already assigned to another pack")
     if pack.bms_id:
         raise HTTPException(status_code=400, detail=f"This pack already has a BMS mounted: {pack.bms_id}")
-
-    # 3. Perform the Link (Locking the BMS)
-    pack.bms_id = bms_id
-    bms.is_used = True
-    
-    db.commit()
+    if pack.final_status == DISPATCHED_STATUS:
+        raise PackDispatched(f"Pack {battery_id} has been dispatched, its BMS is final")
+
+    # 3. Perform the Link (Locking the BMS) - guarded updates, so a parallel mount gets a 409
+    bms_model = bms.bms_model
+    ReservationService.claim_bms(db, battery_id, bms_id)
+    EventBus.stage(db, "pack.bms_mounted", {"battery_id": battery_id, "bms_id": bms_id}, model=pack.model_name)
+    ReservationService.commit_or_conflict(db, "This BMS is already assigned to another pack")
     return {
         "status": "Success", 
         "message": f"BMS {bms_id} successfully mounted to {battery_id}",
-        "bms_model": bms.bms_model
-    }
-import io
-import pandas as pd
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
-from sqlalchemy.orm import Session
-from app.database import get_db
-from app.models.battery import BatteryPack, PDIChecklist
-
-# --- PDI PARSING UTILITY ---
-def parse_pdi_excel(file_content):
-    df = pd.read_excel(io.BytesIO(file_content))
-    
-    def check_status(checkpoint_name):
-        # Case-insensitive search for the checkpoint in the Excel
-        row = df[df['Checkpoint'].str.contains(checkpoint_name, case=False, na=False)]
-        if not row.empty:
-            val = str(row.iloc[0]['Status']).strip().lower()
-            return val in ['pass', 'ok', 'yes', 'true', '1']
-        return False
-
-    # Extract OCV value
-    ocv_row = df[df['Checkpoint'].str.contains('OCV', case=False, na=False)]
-    ocv_val = float(ocv_row.iloc[0]['Status']) if not ocv_row.empty else 0.0
-
-    return {
-        "visual_finish_ok": check_status("Visual"),
-        "terminal_tightness_ok": check_status("Terminal"),
-        "internal_wiring_routing_ok": check_status("Wiring"),
-        "handle_secure_ok": check_status("Handle"),
-        "sticker_labeling_ok": check_status("Label"),
-        "bms_communication_ok": check_status("BMS"),
-        "short_circuit_test_ok": check_status("Short"),
-        "final_ocv_v": ocv_val,
-        "polarity_check_ok": check_status("Polarity"),
-        "warranty_seal_applied": check_status("Warranty"),
-        "accessories_included": check_status("Accessories")
+        "bms_model": bms_model
     }
 
-# --- ENDPOINT ---
+# --- PHASE 4: PDI ---
 @router.post("/{battery_id}/upload-pdi")
 async def upload_pdi_checklist(
     battery_id: str, 
+    response: Response,
     file: UploadFile = File(...), 
+    background: bool = False,
+    force: bool = False,
     db: Session = Depends(get_db)
 ):
     # 1. Read file and Parse
-    content = await file.read()
-    try:
-        results = parse_pdi_excel(content)
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Checklist parsing failed: {str(e)}")
-
-    # 2. Logic: Must pass all booleans for a final 'PASS'
-    # Check if any boolean field is False
-    failed_checkpoints = [k for k, v in results.items() if isinstance(v, bool) and v is False]
-    verdict = "PASS" if not failed_checkpoints else "FAIL"
-
-    # 3. Save PDI Record
-    new_pdi = PDIChecklist(
-        battery_id=battery_id,
-        **results,
-        inspector_name="Factory_Admin",
-        final_result=verdict
+    upload = spooled(file)
+    # The same checklist file may be valid for several packs, so the ledger is keyed per battery_id
+    if background:
+        duplicate = None if force else await run_in_threadpool(
+            IngestLedgerService.seen, db, "pdi", upload, battery_id
+        )
+        if duplicate:
+            return duplicate
+        timer = StageTimer("pdi")
+        content = await file.read()
+        timer.lap("read")
+        job = await run_in_threadpool(
+            JobQueue.enqueue, db, "pdi", file.filename, content, {"battery_id": battery_id, "force": force}
+        )
+        response.status_code = 202
+        return JobQueue.accepted(job)
+
+    def ingest():
+        with parse_slot():
+            try:
+                results = timed_parse("pdi", parse_upload, "pdi", upload)
+            except Exception as e:
+                raise HTTPException(status_code=400, detail=f"Checklist parsing failed: {str(e)}")
+        return BatteryService.save_pdi(db, battery_id, results)
+
+    return await run_in_threadpool(
+        IngestLedgerService.process, db, "pdi", upload, ingest,
+        scope=battery_id, file_name=file.filename, force=force
     )
-    
-    # 4. Update Battery Pack Master Status
-    pack = db.query(BatteryPack).filter_by(battery_id=battery_id).first()
-    if pack:
-        pack.final_status = "READY_FOR_DISPATCH" if verdict == "PASS" else "PDI_REJECTED"
 
-    db.add(new_pdi)
-    db.commit()
 
-    return {
-        "battery_id": battery_id,
-        "pdi_status": verdict,
-        "failed_points": failed_checkpoints if verdict == "FAIL" else None,
-        "final_ocv": results['final_ocv_v']
-    }
\ No newline at end of file
+@router.post("/upload-pdi-batch")
+async def upload_pdi_batch(
+    response: Response,
+    file: UploadFile = File(...),
+    background: bool = False,
+    force: bool = False,
+    db: Session = Depends(get_db)
+):
+    """
+    End-of-line sign-off for a whole pallet: one sheet keyed by Battery ID (a row
+    per pack with a column per checkpoint, or Battery ID / Checkpoint / Status rows).
+    """
+    upload = spooled(file)
+    if background:
+        duplicate = None if force else await run_in_threadpool(IngestLedgerService.seen, db, "pdi_batch", upload)
+        if duplicate:
+            return duplicate
+        timer = StageTimer("pdi_batch")
+        content = await file.read()
+        timer.lap("read")
+        job = await run_in_threadpool(JobQueue.enqueue, db, "pdi_batch", file.filename, content, {"force": force})
+        response.status_code = 202
+        return JobQueue.accepted(job)
+
+    def ingest():
+        with parse_slot():
+            try:
+                parsed = timed_parse("pdi_batch", parse_upload, "pdi_batch", upload)
+            except (ValueError, KeyError) as e:
+                raise HTTPException(status_code=400, detail=f"Checklist parsing failed: {e}")
+        return BatteryService.save_pdi_batch(db, parsed)
+
+    return await run_in_threadpool(
+        IngestLedgerService.process, db, "pdi_batch", upload, ingest, file_name=file.filename, force=force
+    )
@@ -1,8 +1,19 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
+from datetime import datetime
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Response, Query
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from app.database import get_db
+from app.database import get_db, get_read_db
 from app.models.cell import Cell
 from app.services.cell_service import CellService # Unified service import
+from app.services.dashboard_service import DashboardService
+from app.services.event_bus import EventBus
+from app.services.ingest_ledger import IngestLedgerService
+from app.services.job_queue import JobQueue
+from app.services.metrics import StageTimer
+from app.services.pagination import keyset_page, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from app.services.reservation_service import ReservationService
+from app.services.uploads import spooled
 
 router = APIRouter(prefix="/cells", tags=["Phase 1: Cell Management"])
 
@@ -16,13 +27,37 @@ def register_cell(cell_id: str, db: Session = Depends(get_db)):
     
     new_cell = Cell(cell_id=cell_id, is_used=False)
     db.add(new_cell)
-    db.commit()
+    DashboardService.cells_changed(db, [None], [(None, False)])
+    EventBus.stage(db, "cell.registered", {"cell_id": cell_id})
+    ReservationService.commit_or_conflict(db, "Cell ID already exists")
     db.refresh(new_cell) # Best practice to refresh after commit
     return {"message": "Cell registered successfully", "cell": new_cell}
 
+# INVENTORY LISTING (keyset paginated, newest grading first)
+@router.get("/")
+def list_cells(
+    capacity_group: Optional[str] = None,
+    is_used: Optional[bool] = None,
+    graded_from: Optional[datetime] = None,
+    graded_to: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    db: Session = Depends(get_read_db)
+):
+    query = db.query(Cell)
+    if capacity_group is not None:
+        query = query.filter(Cell.capacity_group == capacity_group)
+    if is_used is not None:
+        query = query.filter(Cell.is_used == is_used)
+    if graded_from is not None:
+        query = query.filter(Cell.grading_date >= graded_from)
+    if graded_to is not None:
+        query = query.filter(Cell.grading_date < graded_to)
+    return keyset_page(query, [Cell.grading_date, Cell.cell_id], cursor, limit, descending=True)
+
 # STEP 2: GET DETAILS
 @router.get("/{cell_id}")
-def get_cell_details(cell_id: str, db: Session = Depends(get_db)):
+def get_cell_details(cell_id: str, db: Session = Depends(get_read_db)):
     cell = db.query(Cell).filter(Cell.cell_id == cell_id).first()
     if not cell:
         raise HTTPException(status_code=404, detail="Cell not found")
@@ -30,8 +65,42 @@ def get_cell_details(cell_id: str, db: Session = Depends(get_db)):
 
 # STEP 3: PROCESS GRADING
 @router.post("/auto-link-grading")
-async def auto_link_grading(file: UploadFile = File(...), db: Session = Depends(get_db)):
-    content = await file.read()
-    # Ensure CellService.process_grading_excel is an 'async' function 
-    # if you are 'awaiting' it here.
-    return await CellService.process_grading_excel(db, content)
\ No newline at end of file
+async def auto_link_grading(
+    response: Response,
+    file: UploadFile = File(...),
+    background: bool = False,
+    force: bool = False,
+    db: Session = Depends(get_db)
+):
+    """Re-uploading an already ingested workbook returns the recorded result (force=true reprocesses)."""
+    # Already streamed to a spooled temp file by the multipart parser; parse from the handle
+    upload = spooled(file)
+    # Queue mode: accept now, poll /jobs/{job_id} for the result
+    if background:
+        duplicate = None if force else await run_in_threadpool(IngestLedgerService.seen, db, "grading", upload)
+        if duplicate:
+            return duplicate
+        timer = StageTimer("grading")
+        content = await file.read()
+        timer.lap("read")
+        job = await run_in_threadpool(JobQueue.enqueue, db, "grading", file.filename, content, {"force": force})
+        response.status_code = 202
+        return JobQueue.accepted(job)
+    # Parsing + DB write are blocking; run them in the threadpool, not on the event loop
+    return await run_in_threadpool(
+        IngestLedgerService.process, db, "grading", upload,
+        lambda: CellService.process_grading_excel(db, upload), file_name=file.filename, force=force
+    )
+
+# STEP 3b: BATCH GRADING (many workbooks or a ZIP of a whole shift)
+@router.post("/auto-link-grading/batch")
+async def auto_link_grading_batch(files: List[UploadFile] = File(...), force: bool = False, db: Session = Depends(get_db)):
+    timer = StageTimer("grading_batch")
+    # Files stay spooled and ZIP members compressed; each is read only when its parse is submitted
+    uploads = [(f.filename, spooled(f)) for f in files]
+    workbooks = await run_in_threadpool(CellService.expand_grading_uploads, uploads)
+    timer.lap("read")
+    if not workbooks:
+        raise HTTPException(status_code=400, detail="No Excel workbooks or CSV exports found in upload")
+    # Parsing fans out to worker processes; keep the event loop free while we wait
+    return await run_in_threadpool(CellService.process_grading_batch, db, workbooks, force)
@@ -0,0 +1,21 @@
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.orm import Session
+from app.database import get_db, get_read_db
+from app.services.dashboard_service import DashboardService
+
+router = APIRouter(prefix="/dashboard", tags=["Floor Dashboard"])
+
+
+@router.get("/summary")
+def dashboard_summary(days: int = Query(7, ge=1, le=90), db: Session = Depends(get_read_db)):
+    """
+    Packs by status, cells by capacity group / used state and daily yields per model.
+    Served from pre-aggregated counters, so cost does not grow with history.
+    """
+    return DashboardService.summary(db, days)
+
+
+@router.post("/reconcile")
+def dashboard_reconcile(db: Session = Depends(get_db)):
+    """Rebuilds every counter from the base tables (also runs periodically)."""
+    return {"status": "Success", "counters": DashboardService.reconcile(db)}
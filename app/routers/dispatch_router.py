@@ -0,0 +1,51 @@
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+from app.database import get_db, get_read_db
+from app.models.dispatch import BatteryDispatch
+from app.schemas.dispatch import BatteryDispatchCreate, BatteryDispatchResponse, BulkDispatchCreate
+from app.services.dispatch_service import DispatchService
+from app.services.pagination import keyset_page, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+
+router = APIRouter(prefix="/dispatch", tags=["Phase 5: Dispatch"])
+
+# --- DISPATCH (packs must be READY_FOR_DISPATCH) ---
+
+@router.post("/bulk")
+def dispatch_bulk(payload: BulkDispatchCreate, db: Session = Depends(get_db)):
+    """One invoice, one customer, a whole pallet or truck of packs; all or nothing."""
+    return DispatchService.dispatch(
+        db, payload.battery_ids, payload.customer_name, payload.invoice_number, payload.sales_executive_signature
+    )
+
+@router.post("/")
+def dispatch_pack(payload: BatteryDispatchCreate, db: Session = Depends(get_db)):
+    return DispatchService.dispatch(
+        db, [payload.battery_id], payload.customer_name, payload.invoice_number, payload.sales_executive_signature
+    )
+
+# --- LOOKUPS (keyset paginated, newest sale first) ---
+
+@router.get("/")
+def list_dispatches(
+    invoice_number: Optional[str] = None,
+    customer_name: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    db: Session = Depends(get_read_db)
+):
+    query = db.query(BatteryDispatch)
+    if invoice_number is not None:
+        query = query.filter(BatteryDispatch.invoice_number == invoice_number)
+    if customer_name is not None:
+        query = query.filter(BatteryDispatch.customer_name == customer_name)
+    page = keyset_page(query, [BatteryDispatch.sale_date, BatteryDispatch.sale_id], cursor, limit, descending=True)
+    page["items"] = [BatteryDispatchResponse.model_validate(d) for d in page["items"]]
+    return page
+
+@router.get("/battery/{battery_id}", response_model=BatteryDispatchResponse)
+def get_dispatch(battery_id: str, db: Session = Depends(get_read_db)):
+    sale = db.query(BatteryDispatch).filter_by(battery_id=battery_id).first()
+    if not sale:
+        raise HTTPException(status_code=404, detail="This pack has not been dispatched")
+    return sale
@@ -0,0 +1,38 @@
+from typing import Optional
+from fastapi import APIRouter, Header, Request
+from fastapi.responses import StreamingResponse
+from app.services.event_bus import EventBus
+
+router = APIRouter(prefix="/events", tags=["Floor Dashboard"])
+
+
+def _split(value: Optional[str]) -> list:
+    return [v.strip() for v in value.split(",") if v.strip()] if value else []
+
+
+@router.get("/")
+async def event_stream(
+    request: Request,
+    types: Optional[str] = None,
+    model: Optional[str] = None,
+    station: Optional[str] = None,
+    last_event_id: Optional[str] = Header(None),
+):
+    """
+    Server-Sent Events for line-side screens, instead of polling the cell and pack
+    endpoints. Comma-separated filters: types=pack.tested,cell. ("cell." is every
+    cell event), model=M1,M2, station=LINE-2 (the X-Station header of the writer).
+    An 'event: lagged' frame means this client fell behind and events were dropped.
+    """
+    subscriber = EventBus.subscribe(_split(types), _split(model), _split(station), last_event_id)
+    return StreamingResponse(
+        EventBus.stream(subscriber, request.is_disconnected),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/stats")
+def event_stats():
+    """Open streams and buffered events on this worker."""
+    return EventBus.stats()
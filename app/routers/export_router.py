@@ -0,0 +1,29 @@
+from datetime import datetime
+from typing import Literal, Optional
+from fastapi import APIRouter, Query
+from fastapi.responses import StreamingResponse
+from app.services.export_service import ExportService
+
+router = APIRouter(prefix="/exports", tags=["Data Exports"])
+
+
+@router.get("/{dataset}")
+def export_dataset(
+    dataset: Literal["cells", "pack_test_results", "pdi_checklists"],
+    fmt: Literal["csv", "parquet"] = Query("csv", alias="format"),
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    model_name: Optional[str] = None,
+):
+    """
+    Full dump of a table as CSV or Parquet, streamed chunk by chunk.
+    Dates filter grading_date / tested_at / inspection_timestamp; model_name
+    limits to cells, tests or PDI records of packs of that model.
+    """
+    body, media_type, file_name = ExportService.stream(
+        dataset, fmt, date_from=date_from, date_to=date_to, model_name=model_name
+    )
+    return StreamingResponse(
+        body, media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{file_name}"'}
+    )
@@ -0,0 +1,37 @@
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session, defer
+from app.database import get_db
+from app.models.job import IngestJob
+from app.services.job_queue import JobQueue, JOB_STATUSES
+
+router = APIRouter(prefix="/jobs", tags=["Background Upload Jobs"])
+
+
+# Job routes stay on the primary: workers update a job moments before its client polls it
+@router.get("/{job_id}")
+def get_job(job_id: int, db: Session = Depends(get_db)):
+    # Never pull the raw upload back out just to report status
+    job = db.query(IngestJob).options(defer(IngestJob.payload)).filter_by(job_id=job_id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return JobQueue.to_dict(job)
+
+
+@router.get("/")
+def list_jobs(
+    status: Optional[str] = None,
+    kind: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500),
+    db: Session = Depends(get_db)
+):
+    query = db.query(IngestJob).options(defer(IngestJob.payload))
+    if status:
+        status = status.upper()
+        if status not in JOB_STATUSES:
+            raise HTTPException(status_code=400, detail=f"status must be one of {', '.join(JOB_STATUSES)}")
+        query = query.filter(IngestJob.status == status)
+    if kind:
+        query = query.filter(IngestJob.kind == kind)
+    jobs = query.order_by(IngestJob.job_id.desc()).limit(limit).all()
+    return [JobQueue.to_dict(job) for job in jobs]
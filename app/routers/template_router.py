@@ -1,7 +1,11 @@
-from fastapi import APIRouter, Depends, HTTPException
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
-from app.database import get_db
+from app.database import get_db, get_read_db
 from app.models.template import BatteryTemplate
+from app.services.event_bus import EventBus
+from app.services.template_cache import TemplateCache
+from app.services.pagination import keyset_page, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
 from pydantic import BaseModel
 
 router = APIRouter(prefix="/templates", tags=["Phase 2: Template Management"])
@@ -25,11 +29,39 @@ def create_template(template: TemplateCreate, db: Session = Depends(get_db)):
     # Convert Pydantic model to SQLAlchemy model
     new_template = BatteryTemplate(**template.model_dump())
     db.add(new_template)
+    TemplateCache.invalidate(db)
+    EventBus.stage(db, "template.created", template.model_dump(), model=template.model_name)
     db.commit()
     db.refresh(new_template)
     return new_template
 
+@router.put("/{model_name}")
+def update_template(model_name: str, template: TemplateCreate, db: Session = Depends(get_db)):
+    existing = db.query(BatteryTemplate).filter_by(model_name=model_name).first()
+    if not existing:
+        raise HTTPException(status_code=404, detail="Model template not found")
+    if template.model_name != model_name:
+        raise HTTPException(status_code=400, detail="model_name cannot be changed")
+
+    for field, value in template.model_dump().items():
+        setattr(existing, field, value)
+    # Every write to battery_templates must invalidate the cache in the same transaction
+    TemplateCache.invalidate(db)
+    EventBus.stage(db, "template.updated", template.model_dump(), model=model_name)
+    db.commit()
+    db.refresh(existing)
+    return existing
+
+@router.get("/cache-stats")
+def template_cache_stats():
+    """Hit/miss counters of this worker's template cache."""
+    return TemplateCache.stats()
+
 @router.get("/")
-def list_templates(db: Session = Depends(get_db)):
-    templates = db.query(BatteryTemplate).all()
-    return templates
\ No newline at end of file
+def list_templates(
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    db: Session = Depends(get_read_db)
+):
+    # Keyset on the primary key, alphabetical by model name
+    return keyset_page(db.query(BatteryTemplate), [BatteryTemplate.model_name], cursor, limit)
\ No newline at end of file
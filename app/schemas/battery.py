@@ -1,4 +1,10 @@
 # app/schemas/battery.py
+from pydantic import BaseModel
+from typing import List
+
 class PackCellMappingCreate(BaseModel):
-    battery_id: int
-    cell_id: str
\ No newline at end of file
+    battery_id: str
+    cell_id: str
+
+class BulkCellLink(BaseModel):
+    cell_ids: List[str]  # Scan order is kept; surplus cells are rejected once the pack is full
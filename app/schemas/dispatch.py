@@ -1,16 +1,23 @@
 # app/schemas/dispatch.py
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from datetime import datetime
+from typing import List
 
 class BatteryDispatchCreate(BaseModel):
-    battery_id: int
+    battery_id: str
     customer_name: str
     invoice_number: str
     sales_executive_signature: str
 
+class BulkDispatchCreate(BaseModel):
+    customer_name: str
+    invoice_number: str
+    sales_executive_signature: str
+    battery_ids: List[str] = Field(..., min_length=1)  # Every pack on the pallet / truck
+
 class BatteryDispatchResponse(BatteryDispatchCreate):
     sale_id: int
     sale_date: datetime
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
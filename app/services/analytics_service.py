@@ -0,0 +1,204 @@
+import numpy as np
+from sqlalchemy import Float, cast, select
+from sqlalchemy.orm import Session
+from app.models.battery import BatteryPack, pack_cell_mapping
+from app.models.cell import Cell
+from app.services.capacity import capacity_group_lower_bounds, format_capacity_group
+from app.services.template_cache import TemplateCache
+from fastapi import HTTPException
+
+# Rows per server-side cursor fetch; each chunk is turned into arrays and dropped
+FETCH_CHUNK = 50_000
+# Robust z-score (median/MAD) above which a cell's OCV is off its capacity trend
+OUTLIER_Z = 3.5
+PERCENTILES = (1, 5, 50, 95, 99)
+
+
+def _num(value):
+    """NumPy scalar -> JSON-safe float (NaN/inf -> None)."""
+    value = float(value)
+    return round(value, 4) if np.isfinite(value) else None
+
+
+class AnalyticsService:
+    """
+    Capacity statistics computed on NumPy arrays. Columns are streamed
+    straight from a server-side cursor as floats; no ORM objects are built,
+    so memory is a few arrays of 8 bytes per cell.
+    """
+
+    # --- LOADING ---
+
+    @staticmethod
+    def load_cells(db: Session, *criteria, join_model: str = None) -> dict:
+        """Returns {cell_id, cap, ocv} arrays for graded cells matching `criteria`."""
+        stmt = select(
+            Cell.cell_id, cast(Cell.actual_cap_ah, Float), cast(Cell.ocv_volts, Float)
+        ).where(Cell.actual_cap_ah.isnot(None), *criteria)
+        if join_model is not None:
+            stmt = (
+                stmt.join(pack_cell_mapping, pack_cell_mapping.c.cell_id == Cell.cell_id)
+                .join(BatteryPack, BatteryPack.battery_id == pack_cell_mapping.c.battery_id)
+                .where(BatteryPack.model_name == join_model)
+            )
+
+        ids, caps, ocvs = [], [], []
+        result = db.execute(stmt.execution_options(yield_per=FETCH_CHUNK))
+        for chunk in result.partitions():
+            chunk_ids, chunk_caps, chunk_ocvs = zip(*chunk)
+            ids.extend(chunk_ids)
+            caps.append(np.array(chunk_caps, dtype=np.float64))
+            # NULL OCV becomes NaN and is ignored by the outlier fit
+            ocvs.append(np.array(chunk_ocvs, dtype=np.float64))
+        return {
+            "cell_id": np.array(ids, dtype=object),
+            "cap": np.concatenate(caps) if caps else np.empty(0),
+            "ocv": np.concatenate(ocvs) if ocvs else np.empty(0),
+        }
+
+    # --- STATISTICS ---
+
+    @staticmethod
+    def describe(values: np.ndarray) -> dict:
+        n = int(values.size)
+        if n == 0:
+            return {"count": 0}
+        pct = np.percentile(values, PERCENTILES)
+        return {
+            "count": n,
+            "mean": _num(values.mean()),
+            "std": _num(values.std(ddof=1)) if n > 1 else None,
+            "min": _num(values.min()),
+            "max": _num(values.max()),
+            "percentiles": {f"p{p}": _num(v) for p, v in zip(PERCENTILES, pct)},
+        }
+
+    @staticmethod
+    def capability(values: np.ndarray, lsl: float, usl: float) -> dict:
+        """Cp/Cpk against [lsl, usl] plus the share of cells outside it."""
+        n = values.size
+        out = {"lsl": lsl, "usl": usl, "cp": None, "cpk": None, "out_of_spec": 0, "out_of_spec_pct": None}
+        if n == 0:
+            return out
+        outside = int(np.count_nonzero((values < lsl) | (values > usl)))
+        out["out_of_spec"] = outside
+        out["out_of_spec_pct"] = round(100.0 * outside / n, 3)
+        if n > 1:
+            mean, std = values.mean(), values.std(ddof=1)
+            if std > 0:
+                out["cp"] = _num((usl - lsl) / (6 * std))
+                out["cpk"] = _num(min(usl - mean, mean - lsl) / (3 * std))
+        return out
+
+    @staticmethod
+    def histogram(values: np.ndarray, bins: int, value_range: tuple = None) -> dict:
+        if values.size == 0:
+            return {"edges": [], "counts": []}
+        counts, edges = np.histogram(values, bins=bins, range=value_range)
+        return {"edges": [_num(e) for e in edges], "counts": counts.tolist()}
+
+    @staticmethod
+    def by_capacity_group(caps: np.ndarray) -> list:
+        """Count/mean/std per 0.5 Ah group using bincount over the group index."""
+        if caps.size == 0:
+            return []
+        lower = capacity_group_lower_bounds(caps)
+        groups, inverse = np.unique(lower, return_inverse=True)
+        counts = np.bincount(inverse)
+        sums = np.bincount(inverse, weights=caps)
+        means = sums / counts
+        deviations = caps - means[inverse]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            variances = np.bincount(inverse, weights=deviations * deviations) / (counts - 1)
+        stds = np.sqrt(variances)
+        return [
+            {
+                "capacity_group": format_capacity_group(g),
+                "count": int(c),
+                "mean": _num(m),
+                "std": _num(s) if c > 1 else None,
+            }
+            for g, c, m, s in zip(groups, counts, means, stds)
+        ]
+
+    @staticmethod
+    def ocv_outliers(cells: dict, limit: int, z_threshold: float = OUTLIER_Z) -> dict:
+        """
+        Fits OCV = a * capacity + b over the population and flags cells whose
+        residual has a robust z-score (median / MAD) above `z_threshold`.
+        """
+        cap, ocv = cells["cap"], cells["ocv"]
+        mask = np.isfinite(ocv)
+        if np.count_nonzero(mask) < 3:
+            return {"fit": None, "count": 0, "cells": []}
+
+        slope, intercept = np.polyfit(cap[mask], ocv[mask], 1)
+        residuals = np.full(cap.shape, np.nan)
+        residuals[mask] = ocv[mask] - (slope * cap[mask] + intercept)
+        median = np.nanmedian(residuals)
+        mad = np.nanmedian(np.abs(residuals - median))
+        if mad == 0:
+            return {"fit": {"slope": _num(slope), "intercept": _num(intercept)}, "count": 0, "cells": []}
+
+        z = 0.6745 * (residuals - median) / mad
+        flagged = np.flatnonzero(np.abs(np.nan_to_num(z)) > z_threshold)
+        worst = flagged[np.argsort(-np.abs(z[flagged]))][:limit]
+        return {
+            "fit": {"slope": _num(slope), "intercept": _num(intercept), "residual_mad": _num(mad)},
+            "z_threshold": z_threshold,
+            "count": int(flagged.size),
+            "cells": [
+                {
+                    "cell_id": cells["cell_id"][i],
+                    "actual_cap_ah": _num(cap[i]),
+                    "ocv_volts": _num(ocv[i]),
+                    "expected_ocv": _num(slope * cap[i] + intercept),
+                    "z_score": _num(z[i]),
+                }
+                for i in worst
+            ],
+        }
+
+    # --- REPORTS ---
+
+    @staticmethod
+    def cell_report(db: Session, criteria: list, bins: int, outlier_limit: int) -> dict:
+        cells = AnalyticsService.load_cells(db, *criteria)
+        cap = cells["cap"]
+        return {
+            "capacity": AnalyticsService.describe(cap),
+            "histogram": AnalyticsService.histogram(cap, bins),
+            "capacity_groups": AnalyticsService.by_capacity_group(cap),
+            "ocv_outliers": AnalyticsService.ocv_outliers(cells, outlier_limit),
+        }
+
+    @staticmethod
+    def template_report(db: Session, model_name: str, scope: str, bins: int, outlier_limit: int) -> dict:
+        """
+        scope='linked': cells already built into packs of this model.
+        scope='stock':  unused graded cells, i.e. how capable the current
+                        inventory is of meeting this model's spec.
+        """
+        template = TemplateCache.get(db, model_name)
+        if not template:
+            raise HTTPException(status_code=404, detail="Battery Template not found")
+
+        if scope == "linked":
+            cells = AnalyticsService.load_cells(db, join_model=model_name)
+        else:
+            cells = AnalyticsService.load_cells(db, Cell.is_used == False)
+
+        cap = cells["cap"]
+        lsl = template.target_capacity_ah - template.tolerance_ah
+        usl = template.target_capacity_ah + template.tolerance_ah
+        return {
+            "model_name": model_name,
+            "scope": scope,
+            "target_capacity_ah": template.target_capacity_ah,
+            "tolerance_ah": template.tolerance_ah,
+            "capacity": AnalyticsService.describe(cap),
+            "capability": AnalyticsService.capability(cap, lsl, usl),
+            "histogram": AnalyticsService.histogram(cap, bins),
+            "capacity_groups": AnalyticsService.by_capacity_group(cap),
+            "ocv_outliers": AnalyticsService.ocv_outliers(cells, outlier_limit),
+        }
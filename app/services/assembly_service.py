@@ -0,0 +1,241 @@
+import os
+from sqlalchemy import func, select, tuple_
+from sqlalchemy.orm import Session
+from app.models.battery import pack_cell_mapping
+from app.models.cell import Cell
+from app.services.dashboard_service import DashboardService
+from app.services.dispatch_service import DISPATCHED_STATUS, PackDispatched
+from app.services.event_bus import EventBus
+from app.services.reservation_service import ReservationService
+from app.services.template_cache import TemplateCache
+from fastapi import HTTPException
+
+# Auto-fill re-selects this many times if another station wins one of its cells
+AUTO_FILL_ATTEMPTS = 3
+# The window search reads this many x `count` cells on each side of the target, so its cost
+# does not grow with stock; the tightest window almost always sits near the target anyway
+MATCH_BAND_FACTOR = int(os.getenv("MATCH_BAND_FACTOR", "8"))
+# Allowed widening (Ah) when locked cells are swapped for the next ones in capacity order
+MATCH_SPREAD_SLACK_AH = float(os.getenv("MATCH_SPREAD_SLACK_AH", "0"))
+
+
+class MatchDrifted(HTTPException):
+    """Cells of the chosen window were taken meanwhile and the substitutes widen the spread."""
+
+    def __init__(self, detail: str):
+        super().__init__(status_code=409, detail=detail)
+
+
+class AssemblyService:
+    @staticmethod
+    def lock_open_pack(db: Session, battery_id: str):
+        """ReservationService.lock_pack() for assembly; a dispatched pack's cells are final."""
+        pack = ReservationService.lock_pack(db, battery_id)
+        if pack.final_status == DISPATCHED_STATUS:
+            db.rollback()
+            raise PackDispatched(f"Pack {battery_id} has been dispatched, its cells are final")
+        return pack
+
+    @staticmethod
+    def linked_cell_count(db: Session, battery_id: str) -> int:
+        """COUNT on the bridge table instead of loading pack.cells."""
+        return db.execute(
+            select(func.count()).select_from(pack_cell_mapping).where(pack_cell_mapping.c.battery_id == battery_id)
+        ).scalar_one()
+
+    @staticmethod
+    def select_matched_cells(db: Session, target: float, tolerance: float, count: int) -> list:
+        """
+        Picks `count` unused in-tolerance cells with the smallest capacity spread.
+
+        Two ix_cells_unused_capacity range reads fetch the MATCH_BAND_FACTOR x
+        `count` cells nearest the target on either side; every window of `count`
+        consecutive cells in that band is scored and the tightest one wins,
+        ties broken towards the template target. The window is then locked and
+        its spread checked again (MatchDrifted when it no longer holds).
+        """
+        in_window = (
+            Cell.is_used == False,
+            Cell.actual_cap_ah.between(target - tolerance, target + tolerance),
+        )
+        ordering = (Cell.actual_cap_ah, Cell.cell_id)
+        band = MATCH_BAND_FACTOR * count
+        columns = (Cell.cell_id, Cell.actual_cap_ah)
+        above = db.execute(
+            select(*columns).where(*in_window, Cell.actual_cap_ah >= target).order_by(*ordering).limit(band)
+        ).all()
+        below = db.execute(
+            select(*columns).where(*in_window, Cell.actual_cap_ah < target)
+            .order_by(Cell.actual_cap_ah.desc(), Cell.cell_id.desc()).limit(band)
+        ).all()
+        cells = below[::-1] + above
+        if len(cells) < count:
+            # Each side reads at least `count` cells, so a short band is the whole stock
+            raise HTTPException(
+                status_code=400,
+                detail=f"Not enough in-tolerance cells in stock (found {len(cells)}, need {count})"
+            )
+
+        caps = [float(c.actual_cap_ah) for c in cells]
+        start = min(
+            range(len(cells) - count + 1),
+            key=lambda i: (caps[i + count - 1] - caps[i], abs((caps[i] + caps[i + count - 1]) / 2 - target)),
+        )
+        best, best_spread = cells[start], caps[start + count - 1] - caps[start]
+
+        # SKIP LOCKED: a station filling another pack right now keeps its cells,
+        # we take the next ones in capacity order instead of blocking on them
+        rows = db.execute(
+            select(Cell.cell_id, Cell.actual_cap_ah, Cell.capacity_group)
+            .where(*in_window, tuple_(*ordering) >= tuple_(best.actual_cap_ah, best.cell_id))
+            .order_by(*ordering)
+            .limit(count)
+            .with_for_update(skip_locked=True)
+        ).all()
+        if len(rows) < count:
+            raise HTTPException(status_code=409, detail="In-tolerance stock is being reserved by other stations, please retry")
+        if float(rows[-1].actual_cap_ah) - float(rows[0].actual_cap_ah) > best_spread + MATCH_SPREAD_SLACK_AH:
+            raise MatchDrifted("Matched cells are being reserved by other stations, please retry")
+        return [(r.cell_id, float(r.actual_cap_ah), r.capacity_group) for r in rows]
+
+    @staticmethod
+    def balance_parallel_groups(cells: list, series_count: int, parallel_count: int) -> list:
+        """
+        Snake-deals capacity-sorted cells into `series_count` groups of `parallel_count`
+        so every series group ends up with nearly the same total capacity.
+        """
+        ordered = sorted(cells, key=lambda c: c[1], reverse=True)
+        groups = [[] for _ in range(series_count)]
+        for i, cell in enumerate(ordered):
+            lap, pos = divmod(i, series_count)
+            groups[pos if lap % 2 == 0 else series_count - 1 - pos].append(cell)
+        return [
+            {
+                "series_position": idx + 1,
+                "cell_ids": [c[0] for c in group],
+                "capacity_ah": round(sum(c[1] for c in group), 3),
+            }
+            for idx, group in enumerate(groups)
+        ]
+
+    @staticmethod
+    def link_cells(db: Session, battery_id: str, cell_ids: list) -> dict:
+        """
+        Validates a whole scan list with set-based queries and links the
+        accepted cells in one transaction. Returns per-cell rejections.
+        """
+        pack = AssemblyService.lock_open_pack(db, battery_id)
+        template = TemplateCache.get(db, pack.model_name)
+        target = template.target_capacity_ah
+        tolerance = template.tolerance_ah
+
+        # 1. Remaining slots via COUNT, all scanned cells in one query
+        current = AssemblyService.linked_cell_count(db, battery_id)
+        slots = template.cell_count_required - current
+        found = {
+            row.cell_id: row
+            for row in db.execute(
+                select(Cell.cell_id, Cell.actual_cap_ah, Cell.is_used, Cell.capacity_group)
+                .where(Cell.cell_id.in_(set(cell_ids)))
+            )
+        }
+
+        # 2. Classify in scan order
+        accepted, rejected, seen = [], [], set()
+        for cell_id in cell_ids:
+            row = found.get(cell_id)
+            if cell_id in seen:
+                reason = "Duplicate in request"
+            elif row is None:
+                reason = "Cell not found"
+            elif row.is_used:
+                reason = "Cell already in use"
+            elif row.actual_cap_ah is None:
+                reason = "Cell not graded"
+            elif not (target - tolerance <= float(row.actual_cap_ah) <= target + tolerance):
+                reason = "Capacity Tolerance Breach"
+            elif len(accepted) >= slots:
+                reason = "Pack is full"
+            else:
+                reason = None
+            seen.add(cell_id)
+            if reason:
+                rejected.append({"cell_id": cell_id, "reason": reason})
+            else:
+                accepted.append(cell_id)
+
+        # 3. One UPDATE for is_used, one multi-row INSERT for the mappings
+        if accepted:
+            claimed = ReservationService.reserve_and_link(db, battery_id, accepted)
+            if claimed != len(accepted):
+                db.rollback()
+                raise HTTPException(status_code=409, detail="Some cells were claimed by another station, please rescan")
+            DashboardService.cells_linked(db, [found[c].capacity_group for c in accepted])
+            EventBus.stage(db, "pack.cells_linked", {
+                "battery_id": battery_id, "cell_ids": accepted, "current_count": current + len(accepted)
+            }, model=pack.model_name)
+            ReservationService.commit_or_conflict(db, "Cells were linked concurrently, please rescan")
+
+        return {
+            "battery_id": battery_id,
+            "linked": accepted,
+            "rejected": rejected,
+            "current_count": current + len(accepted),
+            "cell_count_required": template.cell_count_required
+        }
+
+    @staticmethod
+    def auto_fill_pack(db: Session, battery_id: str, balance_parallel: bool = True) -> dict:
+        for _ in range(AUTO_FILL_ATTEMPTS):
+            pack = AssemblyService.lock_open_pack(db, battery_id)
+            template = TemplateCache.get(db, pack.model_name)
+            series, parallel = template.series_count, template.parallel_count
+
+            # 1. How many slots are left?
+            current = AssemblyService.linked_cell_count(db, battery_id)
+            needed = template.cell_count_required - current
+            if needed <= 0:
+                db.rollback()
+                raise HTTPException(status_code=400, detail="Pack is full")
+
+            # 2. Tightest capacity window in stock; locked cells widened it -> select again
+            try:
+                cells = AssemblyService.select_matched_cells(
+                    db, template.target_capacity_ah, template.tolerance_ah, needed
+                )
+            except MatchDrifted:
+                db.rollback()
+                continue
+            except HTTPException:
+                db.rollback()
+                raise
+
+            # 3. Reserve + link in one transaction; lost a race -> select again
+            claimed = ReservationService.reserve_and_link(db, battery_id, [c[0] for c in cells])
+            if claimed == len(cells):
+                DashboardService.cells_linked(db, [c[2] for c in cells])
+                EventBus.stage(db, "pack.cells_linked", {
+                    "battery_id": battery_id, "cell_ids": [c[0] for c in cells], "current_count": current + len(cells)
+                }, model=pack.model_name)
+                ReservationService.commit_or_conflict(db, "Cells were linked concurrently, please retry")
+                break
+            db.rollback()
+        else:
+            raise HTTPException(status_code=409, detail="Selected cells were claimed by another station, please retry")
+
+        capacities = [c[1] for c in cells]
+        result = {
+            "status": "Linked",
+            "battery_id": battery_id,
+            "cells_linked": len(cells),
+            "current_count": current + len(cells),
+            "min_capacity_ah": min(capacities),
+            "max_capacity_ah": max(capacities),
+            "capacity_spread_ah": round(max(capacities) - min(capacities), 3),
+            "cell_ids": [c[0] for c in cells],
+        }
+
+        # 4. Optional series/parallel layout for the whole pack
+        if balance_parallel and current == 0 and series > 0 and parallel > 1 and series * parallel == len(cells):
+            result["groups"] = AssemblyService.balance_parallel_groups(cells, series, parallel)
+        return result
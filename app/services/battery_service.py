@@ -0,0 +1,389 @@
+import logging
+from datetime import datetime
+from sqlalchemy import case, delete, func, insert, select, update
+from sqlalchemy.orm import Session
+from app.models.battery import BatteryPack, PackTestResult, PDIChecklist
+from app.models.dispatch import BatteryDispatch
+from app.models.pdi import PDICheckpoint, PDIResult, PDISession
+from app.models.template import BatteryTemplate
+from app.services.dashboard_service import DashboardService
+from app.services.dispatch_service import DISPATCHED_STATUS, PackDispatched
+from app.services.event_bus import EventBus
+from app.services.ingest_ledger import IngestLedgerService
+from app.services.metrics import StageTimer, record_ingested, record_parse_failure
+from app.services.parser_registry import parse_upload
+from app.services.process_pool import map_parse
+from app.services.template_cache import TemplateCache
+from app.services.uploads import load_named, parse_slot
+from fastapi import HTTPException
+
+logger = logging.getLogger(__name__)
+
+
+def _parse_pack_test_file_safe(item):
+    """Runs in a pool worker: returns (file_name, {"tests": [...]}, error_message)."""
+    file_name, content = item
+    try:
+        return file_name, parse_upload("pack_test_batch", content), None
+    except Exception as e:
+        return file_name, None, str(e)
+
+
+class BatteryService:
+    # --- PHASE 3: PACK TEST ---
+    # Parsing (xlsx/xls/CSV) lives in the parser registry: parse_upload("pack_test" | "pack_test_batch", ...)
+
+    @staticmethod
+    def save_pack_test(db: Session, parsed: dict) -> dict:
+        battery_id = parsed["battery_id"]
+
+        # 4. Validation against DB
+        pack = db.query(BatteryPack.model_name, BatteryPack.final_status).filter_by(battery_id=battery_id).first()
+        if not pack:
+            raise HTTPException(status_code=404, detail=f"Pack {battery_id} not registered in assembly")
+
+        template = TemplateCache.get(db, pack.model_name)
+        known = {battery_id: (pack.model_name, pack.final_status, template.target_capacity_ah)}
+        BatteryService.reject_dispatched(db, known)
+        return BatteryService._write_pack_tests(db, "pack_test", [parsed], known)[0]
+
+    @staticmethod
+    def process_pack_test_batch(db: Session, files: list, force: bool = False) -> dict:
+        """
+        Many tester exports (or multi-channel workbooks) in one request: files are
+        parsed across cores, every barcode is resolved with its template in one
+        query, verdicts are computed as one array comparison and all results are
+        written with one bulk insert and one status UPDATE.
+        """
+        # 0. Claim each distinct file under the same ledger kind as the single upload,
+        #    so a file already ingested by either endpoint (or in flight) is not written twice
+        claimed, by_digest, copies = IngestLedgerService.claim_batch(db, "pack_test", files, force)
+        report = list(by_digest.values())
+        try:
+            result = BatteryService._pack_test_batch(db, claimed, by_digest, report)
+        except Exception:
+            IngestLedgerService.release_many(db, "pack_test", [digest for digest, _, _ in claimed])
+            raise
+        report += IngestLedgerService.copies_report(by_digest, copies)
+
+        succeeded = sum(1 for r in report if r["status"] == "Success")
+        duplicates = sum(1 for r in report if r["status"] == "Duplicate")
+        ok = succeeded + duplicates
+        if ok == len(report) and not result["unregistered"]:
+            status = "Success"
+        else:
+            status = "Partial" if ok else "Failed"
+        return {
+            "status": status,
+            "files_received": len(report),
+            "succeeded": succeeded,
+            "duplicates": duplicates,
+            "failed": len(report) - ok,
+            **result,
+            "results": report
+        }
+
+    @staticmethod
+    def _pack_test_batch(db: Session, claimed: list, by_digest: dict, report: list) -> dict:
+        """Parses and writes the claimed files; adds their report entries and completes their claims."""
+        # 1. Parse in parallel
+        timer = StageTimer("pack_test_batch")
+        files = [(file_name, content) for _, file_name, content in claimed]
+        with parse_slot():
+            if len(files) > 1:
+                parsed_files = map_parse(_parse_pack_test_file_safe, files, load=load_named)
+            else:
+                parsed_files = [_parse_pack_test_file_safe(load_named(item)) for item in files]
+        timer.lap("parse")
+
+        tests, test_files = [], []
+        failed = []
+        for (digest, _, _), (file_name, parsed, error) in zip(claimed, parsed_files):
+            if error:
+                record_parse_failure("pack_test_batch", error)
+                by_digest[digest] = {"file": file_name, "status": "Error", "detail": error}
+                report.append(by_digest[digest])
+                failed.append(digest)
+                continue
+            tests += parsed["tests"]
+            test_files += [digest] * len(parsed["tests"])
+        # Unparseable files give their claim back so a corrected re-upload is not blocked
+        IngestLedgerService.release_many(db, "pack_test", failed)
+
+        # 2. One lookup for every barcode and its template target
+        barcodes = {t["battery_id"] for t in tests}
+        known = {}
+        if barcodes:
+            known = {
+                r.battery_id: (r.model_name, r.final_status, float(r.target_capacity_ah))
+                for r in db.execute(
+                    select(BatteryPack.battery_id, BatteryPack.model_name, BatteryPack.final_status,
+                           BatteryTemplate.target_capacity_ah)
+                    .join(BatteryTemplate, BatteryTemplate.model_name == BatteryPack.model_name)
+                    .where(BatteryPack.battery_id.in_(list(barcodes)))
+                )
+            }
+        unregistered = sorted(barcodes - set(known))
+        BatteryService.reject_dispatched(db, known)
+
+        # 3. Bulk write the registered ones
+        accepted = [(t, d) for t, d in zip(tests, test_files) if t["battery_id"] in known]
+        verdicts = []
+        if accepted:
+            try:
+                verdicts = BatteryService._write_pack_tests(db, "pack_test_batch", [t for t, _ in accepted], known)
+            except HTTPException:
+                raise
+            except Exception as e:
+                db.rollback()
+                logger.exception("Batch Pack Test Error")
+                raise HTTPException(status_code=500, detail=f"Batch Pack Test Error: {str(e)}")
+
+        by_file = {}
+        for (_, digest), verdict in zip(accepted, verdicts):
+            by_file.setdefault(digest, []).append(verdict)
+        outcomes = []
+        for (digest, _, _), (file_name, parsed, error) in zip(claimed, parsed_files):
+            if error:
+                continue
+            result = {
+                "status": "Success",
+                "verdicts": by_file.get(digest, []),
+                "unregistered": sorted({t["battery_id"] for t in parsed["tests"]} - set(known)),
+            }
+            by_digest[digest] = {"file": file_name, **result}
+            report.append(by_digest[digest])
+            outcomes.append((digest, file_name, result))
+        # Recorded even with unregistered barcodes (their registered packs were written);
+        # re-send with force=true once the missing packs are assembled
+        IngestLedgerService.complete_many(db, "pack_test", outcomes)
+
+        return {
+            "packs_tested": len(verdicts),
+            "passed": sum(1 for v in verdicts if v["final_status"] == "PASS"),
+            "unregistered": unregistered,
+            "verdicts": verdicts,
+        }
+
+    @staticmethod
+    def _write_pack_tests(db: Session, kind: str, tests: list, known: dict) -> list:
+        """tests: parsed pack tests; known: {battery_id: (model_name, final_status, target_capacity_ah)}."""
+        import numpy as np
+
+        timer = StageTimer(kind)
+        # 5. Verdicts for the whole batch in one comparison against each pack's template target
+        measured = np.array([t["cap_ah"] for t in tests], dtype=float)
+        targets = np.array([known[t["battery_id"]][2] for t in tests], dtype=float)
+        passed = (measured >= targets).tolist()
+
+        now = datetime.now()
+        rows, report, verdicts = [], [], []
+        final_status = {}  # battery_id -> status; a pack tested twice in one batch keeps the last verdict
+        for test, ok in zip(tests, passed):
+            status = "PASS" if ok else "FAIL"
+            battery_id = test["battery_id"]
+            model_name, _, target = known[battery_id]
+            rows.append({
+                "battery_id": battery_id,
+                "working_mode": "Discharge",
+                "cap_ah": test["cap_ah"],
+                "end_v": test["end_v"],
+                "end_a": test["end_a"],
+                "energy_wh": test["energy_wh"],
+                "test_duration_min": test["test_duration_min"],
+                "avg_voltage": test["avg_voltage"],
+                "status": status,
+                "tested_at": now,
+            })
+            final_status[battery_id] = f"TESTED_{status}"
+            verdicts.append((model_name, status))
+            report.append({
+                "battery_id": battery_id,
+                "final_status": status,
+                "measured_ah": test["cap_ah"],
+                "target_ah": target,
+                "energy_wh": test["energy_wh"]
+            })
+
+        db.execute(insert(PackTestResult), rows)
+        # One UPDATE for every pack: final_status = CASE battery_id WHEN ... END
+        updated = db.execute(
+            update(BatteryPack)
+            .where(BatteryPack.battery_id.in_(list(final_status)),
+                   BatteryPack.final_status.is_distinct_from(DISPATCHED_STATUS))
+            .values(final_status=case(final_status, value=BatteryPack.battery_id))
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        BatteryService._check_not_shipped_since(db, updated, len(final_status))
+        DashboardService.pack_statuses_changed(db, [(known[bid][1], status) for bid, status in final_status.items()])
+        DashboardService.verdicts_recorded(db, "daily_test", verdicts)
+        for verdict in report:
+            EventBus.stage(db, "pack.tested", verdict, model=known[verdict["battery_id"]][0])
+        timer.lap("db_write")
+        db.commit()
+        timer.lap("commit")
+        record_ingested(kind, pack_test_results=len(rows))
+        return report
+
+    # --- DISPATCHED PACKS ARE FINAL ---
+
+    @staticmethod
+    def reject_dispatched(db: Session, known: dict):
+        """409 if any pack in `known` ({battery_id: (model_name, final_status, ...)}) has already shipped."""
+        if not known:
+            return
+        shipped = {bid for bid, info in known.items() if info[1] == DISPATCHED_STATUS}
+        shipped.update(db.execute(
+            select(BatteryDispatch.battery_id).where(BatteryDispatch.battery_id.in_(list(known)))
+        ).scalars())
+        if shipped:
+            db.rollback()
+            listed = sorted(shipped)
+            shown = ", ".join(listed[:20]) + (f" (+{len(listed) - 20} more)" if len(listed) > 20 else "")
+            raise PackDispatched(f"Packs already dispatched, their records are final: {shown}")
+
+    @staticmethod
+    def _check_not_shipped_since(db: Session, updated: int, expected: int):
+        """The status UPDATE skips DISPATCHED rows; fewer rows means a dispatch committed after our check."""
+        if updated != expected:
+            db.rollback()
+            raise PackDispatched("A pack was dispatched while its results were being saved")
+
+    # --- PHASE 4: PDI ---
+    # Parsed by parse_upload("pdi", ...) / parse_upload("pdi_batch", ...)
+
+    @staticmethod
+    def save_pdi(db: Session, battery_id: str, results: dict) -> dict:
+        pack = db.query(BatteryPack.model_name, BatteryPack.final_status).filter_by(battery_id=battery_id).first()
+        if not pack:
+            raise HTTPException(status_code=404, detail=f"Pack {battery_id} not registered in assembly")
+        known = {battery_id: tuple(pack)}
+        BatteryService.reject_dispatched(db, known)
+        return BatteryService._write_pdi(db, "pdi", {battery_id: results}, known)[0]
+
+    @staticmethod
+    def save_pdi_batch(db: Session, parsed: dict) -> dict:
+        """
+        Pallet sign-off: every pack in the sheet is validated in one query and
+        written in one bulk insert. Unknown battery IDs reject the whole sheet.
+        """
+        packs = parsed["packs"]
+        known = {
+            r.battery_id: (r.model_name, r.final_status)
+            for r in db.execute(
+                select(BatteryPack.battery_id, BatteryPack.model_name, BatteryPack.final_status)
+                .where(BatteryPack.battery_id.in_(list(packs)))
+            )
+        }
+        missing = [bid for bid in packs if bid not in known]
+        if missing:
+            shown = ", ".join(missing[:20]) + (f" (+{len(missing) - 20} more)" if len(missing) > 20 else "")
+            raise HTTPException(status_code=404, detail=f"Packs not registered in assembly: {shown}")
+        BatteryService.reject_dispatched(db, known)
+
+        report = BatteryService._write_pdi(db, "pdi_batch", packs, known)
+        passed = sum(1 for r in report if r["pdi_status"] == "PASS")
+        return {
+            "status": "Success",
+            "packs": len(report),
+            "passed": passed,
+            "failed": len(report) - passed,
+            "results": report
+        }
+
+    @staticmethod
+    def _write_pdi(db: Session, kind: str, packs: dict, known: dict) -> list:
+        """packs: {battery_id: parsed checklist}; known: {battery_id: (model_name, final_status)}."""
+        timer = StageTimer(kind)
+        # Extra checkpoints are only kept when they exist in the PDICheckpoint master list (one lookup)
+        labels = {label.lower() for results in packs.values() for label in results.get("other_checkpoints", {})}
+        master = {}
+        if labels:
+            master = {
+                name.lower(): checkpoint_id
+                for checkpoint_id, name in db.execute(
+                    select(PDICheckpoint.checkpoint_id, PDICheckpoint.name)
+                    .where(func.lower(PDICheckpoint.name).in_(labels))
+                )
+            }
+
+        now = datetime.now()
+        rows, report, transitions, verdicts = [], [], [], []
+        extra_results = {}
+        ids_by_status = {}
+        for battery_id, results in packs.items():
+            checklist = {k: v for k, v in results.items() if k != "other_checkpoints"}
+            # Must pass every boolean column (and every mapped master checkpoint) for a final 'PASS'
+            failed_checkpoints = [k for k, v in checklist.items() if isinstance(v, bool) and v is False]
+            extra = {}
+            for label, ok in results.get("other_checkpoints", {}).items():
+                checkpoint_id = master.get(label.lower())
+                if checkpoint_id is not None:
+                    extra[checkpoint_id] = ok
+                    if not ok:
+                        failed_checkpoints.append(label)
+            if extra:
+                extra_results[battery_id] = extra
+            verdict = "PASS" if not failed_checkpoints else "FAIL"
+
+            rows.append({
+                "battery_id": battery_id, **checklist, "inspector_name": "Factory_Admin",
+                "inspection_timestamp": now, "final_result": verdict,
+            })
+            model_name, old_status = known[battery_id]
+            new_status = "READY_FOR_DISPATCH" if verdict == "PASS" else "PDI_REJECTED"
+            transitions.append((old_status, new_status))
+            verdicts.append((model_name, verdict))
+            ids_by_status.setdefault(new_status, []).append(battery_id)
+            report.append({
+                "battery_id": battery_id,
+                "pdi_status": verdict,
+                "failed_points": failed_checkpoints if verdict == "FAIL" else None,
+                "final_ocv": checklist["final_ocv_v"]
+            })
+
+        db.execute(insert(PDIChecklist), rows)
+        updated = 0
+        for status, battery_ids in ids_by_status.items():
+            updated += db.execute(
+                update(BatteryPack)
+                .where(BatteryPack.battery_id.in_(battery_ids),
+                       BatteryPack.final_status.is_distinct_from(DISPATCHED_STATUS))
+                .values(final_status=status)
+                .execution_options(synchronize_session=False)
+            ).rowcount
+        BatteryService._check_not_shipped_since(db, updated, sum(len(ids) for ids in ids_by_status.values()))
+        n_results = BatteryService._save_master_results(db, extra_results, now)
+        DashboardService.pack_statuses_changed(db, transitions)
+        DashboardService.verdicts_recorded(db, "daily_pdi", verdicts)
+        for result in report:
+            EventBus.stage(db, "pack.pdi", result, model=known[result["battery_id"]][0])
+        timer.lap("db_write")
+        db.commit()
+        timer.lap("commit")
+        record_ingested(kind, pdi_checklists=len(rows), pdi_results=n_results)
+        return report
+
+    @staticmethod
+    def _save_master_results(db: Session, extra_results: dict, now: datetime) -> int:
+        """{battery_id: {checkpoint_id: passed}} -> one PDISession per pack (re-inspection replaces its results)."""
+        if not extra_results:
+            return 0
+        sessions = {
+            s.battery_id: s
+            for s in db.query(PDISession).filter(PDISession.battery_id.in_(list(extra_results)))
+        }
+        new_sessions = [
+            PDISession(battery_id=bid, inspection_date=now.date(), qc_signature="Factory_Admin")
+            for bid in extra_results if bid not in sessions
+        ]
+        db.add_all(new_sessions)
+        db.flush()
+        sessions.update({s.battery_id: s for s in new_sessions})
+        db.execute(delete(PDIResult).where(PDIResult.pdi_id.in_([sessions[bid].pdi_id for bid in extra_results])))
+        rows = [
+            {"pdi_id": sessions[bid].pdi_id, "checkpoint_id": checkpoint_id, "status": ok}
+            for bid, extra in extra_results.items() for checkpoint_id, ok in extra.items()
+        ]
+        db.execute(insert(PDIResult), rows)
+        return len(rows)
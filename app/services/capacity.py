@@ -0,0 +1,19 @@
+# Warehouse bins are 0.5 Ah wide, e.g. 102.3 -> '102.0-102.5 Ah'
+GROUP_WIDTH_AH = 0.5
+
+
+def calculate_capacity_group(capacity: float) -> str:
+    """Groups cells into 0.5 Ah buckets for warehouse sorting."""
+    if capacity is None: return "Unknown"
+    lower_bound = (capacity * 2 // 1) / 2
+    upper_bound = lower_bound + GROUP_WIDTH_AH
+    return f"{lower_bound:.1f}-{upper_bound:.1f} Ah"
+
+
+def capacity_group_lower_bounds(capacities):
+    """Vectorised twin of calculate_capacity_group: the lower bound of every cell's bin (NumPy array in/out)."""
+    return (capacities * 2 // 1) / 2
+
+
+def format_capacity_group(lower_bound: float) -> str:
+    return f"{lower_bound:.1f}-{lower_bound + GROUP_WIDTH_AH:.1f} Ah"
@@ -1,90 +1,340 @@
-import pandas as pd
-import io
+import logging
+import zipfile
+from collections import Counter
+from sqlalchemy import delete, insert, select
 from sqlalchemy.orm import Session
+from app.database import insert_for
+from app.models.battery import BatteryPack, pack_cell_mapping
 from app.models.cell import Cell
+from app.models.grading import GradingStepResult
+from app.services.capacity import calculate_capacity_group
+from app.services.dashboard_service import DashboardService
+from app.services.dispatch_service import DISPATCHED_STATUS, PackDispatched
+from app.services.event_bus import EventBus
+from app.services.ingest_ledger import IngestLedgerService
+from app.services.metrics import StageTimer, record_ingested, record_parse_failure, timed_parse
+from app.services.process_pool import map_parse
+from app.services.uploads import (
+    MAX_UNZIPPED_BYTES, ParserBusy, UploadTooLarge, ZipMember, load_named, open_source, parse_slot
+)
+from app.services.neware_parser import find_column, step_number, step_records
+from app.services.parser_registry import parse_upload
 from fastapi import HTTPException
 from datetime import datetime
 
+logger = logging.getLogger(__name__)
+
+# Rows per statement when a batch writes its cells: bounds statement size and bind
+# parameters (a shift ZIP can hold thousands of cells) while staying one transaction
+GRADING_UPSERT_CHUNK = 1000
+
+
+def _parse_file_safe(item):
+    """Runs in a pool worker: returns (file_name, parsed_dict, error_message)."""
+    file_name, content = item
+    try:
+        return file_name, CellService.parse_grading_excel(content), None
+    except Exception as e:
+        return file_name, None, str(e)
+
+
 class CellService:
+    # Shared with CSVService and the analytics module (app/services/capacity.py)
+    calculate_capacity_group = staticmethod(calculate_capacity_group)
+
     @staticmethod
-    def calculate_capacity_group(capacity: float) -> str:
-        """Groups cells into 0.5 Ah buckets for warehouse sorting."""
-        if capacity is None: return "Unknown"
-        lower_bound = (capacity * 2 // 1) / 2
-        upper_bound = lower_bound + 0.5
-        return f"{lower_bound:.1f}-{upper_bound:.1f} Ah"
+    def parse_grading_excel(file_content) -> dict:
+        """
+        Pure parsing step (no DB access) so it can run in a worker process.
+        Raises ValueError when the workbook does not look like a Neware grading file.
+        """
+        # 1. Registry picks the reader (xlsx, legacy xls, CSV export); only 'Basic data'
+        #    and 'Statistical data' are read
+        workbook = parse_upload("grading", file_content)
+
+        # --- [Step A: Cell ID from 'Basic data'] ---
+        cell_id = workbook["cell_id"]
+        if not cell_id or cell_id == "nan":
+            raise ValueError("Cell ID not found in Basic data sheet")
+
+        # --- [Step B: Extract Metrics from 'Statistical data'] ---
+        steps = workbook["steps"]
+
+        # Locate Step 3.0 (CC-D) which contains the 3.39V OCV and 2.492V Cutoff
+        data_row = next((s for s in steps if step_number(s) == 3.0), None)
+        if data_row is None:
+            # Fallback to name search if the step number is different
+            data_row = next((s for s in steps if "cc-d" in str(s.get("Work Step Name") or "").lower()), None)
+
+        if data_row is None:
+            raise ValueError(f"Discharge step (CC-D) not found for Cell {cell_id}")
+
+        # Fuzzy Column Search for Cut-off (handles the double-space 'Cut-off  Voltage(V)')
+        cutoff_col = find_column(steps, "Cut-off", "Voltage")
+        actual_cap_ah = float(data_row.get('Capacity(Ah)') or 0)
+
+        return {
+            "cell_id": cell_id,
+            "actual_cap_ah": actual_cap_ah,
+            "ocv_volts": float(data_row.get('Open Voltage(V)') or 0),
+            "cut_off_voltage": float(data_row[cutoff_col] or 0) if cutoff_col else 0.0,
+            # Calculate the bin/group for assembly
+            "capacity_group": CellService.calculate_capacity_group(actual_cap_ah),
+            # Every work step, stored as GradingStepResult rows for failure analysis
+            "steps": step_records(steps),
+        }
 
     @staticmethod
-    async def process_grading_excel(db: Session, file_content: bytes):
+    def dispatched_cells(db: Session, cell_ids: list) -> dict:
+        """{cell_id: battery_id} for the given cells that are built into a dispatched pack."""
+        if not cell_ids:
+            return {}
+        return dict(db.execute(
+            select(pack_cell_mapping.c.cell_id, pack_cell_mapping.c.battery_id)
+            .join(BatteryPack, BatteryPack.battery_id == pack_cell_mapping.c.battery_id)
+            .where(pack_cell_mapping.c.cell_id.in_(list(set(cell_ids))), BatteryPack.final_status == DISPATCHED_STATUS)
+        ).all())
+
+    @staticmethod
+    def save_grading(db: Session, parsed: dict) -> dict:
+        """Writes one parsed grading result onto its Cell (creating it if needed)."""
+        cell_id = parsed["cell_id"]
+        timer = StageTimer("grading")
+
+        shipped = CellService.dispatched_cells(db, [cell_id])
+        if shipped:
+            raise PackDispatched(f"Cell {cell_id} is in dispatched pack {shipped[cell_id]}, its grading is final")
+
+        # --- [Step C: Database Update] ---
+        # Search for the cell; if it doesn't exist, we create a new record
+        cell = db.query(Cell).filter(Cell.cell_id == cell_id).first()
+        if not cell:
+            before = None
+            cell = Cell(cell_id=cell_id, is_used=False)
+            db.add(cell)
+        else:
+            before = (cell.capacity_group, cell.is_used)
+
+        # Capture High-Precision Metrics
+        cell.actual_cap_ah = parsed["actual_cap_ah"]
+        cell.ocv_volts = parsed["ocv_volts"]
+        cell.cut_off_voltage = parsed["cut_off_voltage"]
+        cell.capacity_group = parsed["capacity_group"]
+        cell.grading_date = datetime.now()
+        db.flush()
+
+        CellService.replace_grading_steps(db, {cell_id: parsed.get("steps", [])})
+        DashboardService.cells_changed(db, [before], [(cell.capacity_group, cell.is_used)])
+        EventBus.stage(db, "cell.graded", {
+            "cell_id": cell_id, "capacity": parsed["actual_cap_ah"], "group": parsed["capacity_group"]
+        })
+        timer.lap("db_write")
+        db.commit()
+        timer.lap("commit")
+        record_ingested("grading", cells=1, grading_step_results=len(parsed.get("steps", [])))
+
+        return {
+            "status": "Success",
+            "cell_id": cell_id,
+            "data": {
+                "capacity": float(cell.actual_cap_ah),
+                "ocv": float(cell.ocv_volts),
+                "cutoff": float(cell.cut_off_voltage),
+                "group": cell.capacity_group
+            }
+        }
+
+    @staticmethod
+    def replace_grading_steps(db: Session, steps_by_cell: dict):
+        """
+        Re-grading replaces a cell's step history. One DELETE per chunk of cells, then
+        one executemany INSERT (batched into multi-row VALUES by SQLAlchemy).
+        """
+        if not steps_by_cell:
+            return
+        cell_ids = list(steps_by_cell)
+        for i in range(0, len(cell_ids), GRADING_UPSERT_CHUNK):
+            db.execute(delete(GradingStepResult).where(GradingStepResult.cell_id.in_(cell_ids[i:i + GRADING_UPSERT_CHUNK])))
+        rows = [
+            {"cell_id": cell_id, **step}
+            for cell_id, steps in steps_by_cell.items()
+            for step in steps
+        ]
+        if rows:
+            db.execute(insert(GradingStepResult), rows)
+
+    @staticmethod
+    def process_grading_excel(db: Session, file_content):
+        cell_id = None
         try:
-            # 1. Load the Excel file to access both 'Basic' and 'Statistical' sheets
-            excel_file = pd.ExcelFile(io.BytesIO(file_content))
-            
-            # --- [Step A: Extract Cell ID from 'Basic data'] ---
-            df_basic = excel_file.parse('Basic data', header=None)
-            cell_id = None
-            for row_idx in range(len(df_basic)):
-                for col_idx in range(len(df_basic.columns)):
-                    val = str(df_basic.iloc[row_idx, col_idx])
-                    if "Battery code:" in val:
-                        cell_id = str(df_basic.iloc[row_idx, col_idx + 1]).strip()
-                        break
-            
-            if not cell_id or cell_id == "nan":
-                raise HTTPException(status_code=400, detail="Cell ID not found in Basic data sheet")
-
-            # --- [Step B: Extract Metrics from 'Statistical data'] ---
-            df_stat = excel_file.parse('Statistical data')
-            df_stat.columns = df_stat.columns.str.strip()
-
-            # Locate Step 3.0 (CC-D) which contains the 3.39V OCV and 2.492V Cutoff
-            cc_d_rows = df_stat[df_stat['Work Step Number'] == 3.0]
-            if cc_d_rows.empty:
-                # Fallback to name search if the step number is different
-                cc_d_rows = df_stat[df_stat['Work Step Name'].str.contains('CC-D', na=False, case=False)]
-
-            if cc_d_rows.empty:
-                raise HTTPException(status_code=400, detail=f"Discharge step (CC-D) not found for Cell {cell_id}")
-            
-            data_row = cc_d_rows.iloc[0]
-
-            # --- [Step C: Database Update] ---
-            # Search for the cell; if it doesn't exist, we create a new record
-            cell = db.query(Cell).filter(Cell.cell_id == cell_id).first()
-            if not cell:
-                cell = Cell(cell_id=cell_id, is_used=False)
-                db.add(cell)
-
-            # Capture High-Precision Metrics
-            cell.actual_cap_ah = float(data_row.get('Capacity(Ah)', 0))
-            cell.ocv_volts = float(data_row.get('Open Voltage(V)', 0))
-            
-            # Fuzzy Column Search for Cut-off (handles the double-space 'Cut-off  Voltage(V)')
-            cutoff_col = [c for c in df_stat.columns if "Cut-off" in c and "Voltage" in c]
-            if cutoff_col:
-                cell.cut_off_voltage = float(data_row[cutoff_col[0]])
-            else:
-                cell.cut_off_voltage = 0.0
+            with parse_slot():
+                parsed = timed_parse("grading", CellService.parse_grading_excel, file_content)
+            cell_id = parsed["cell_id"]
+            return CellService.save_grading(db, parsed)
+        except (ParserBusy, PackDispatched):
+            db.rollback()
+            raise
+        except Exception as e:
+            db.rollback()
+            # Clean logging for debugging production issues
+            logger.warning("Grading Error for %s: %s", cell_id or "Unknown", e)
+            detail = e.detail if isinstance(e, HTTPException) else str(e)
+            raise HTTPException(status_code=400, detail=f"Grading Error: {detail}")
 
-            # Calculate the bin/group for assembly
-            cell.capacity_group = CellService.calculate_capacity_group(cell.actual_cap_ah)
-            cell.grading_date = datetime.now()
+    @staticmethod
+    def expand_grading_uploads(uploads: list) -> list:
+        """
+        Flattens (file_name, bytes or file handle) uploads into individual
+        (file_name, source) workbooks. ZIP members stay in the archive as
+        ZipMember sources and are decompressed only when hashed or handed to
+        a parse worker; anything inside that is not an Excel workbook or CSV
+        export is ignored. The archives live as long as the upload handles.
+        """
+        files = []
+        for file_name, content in uploads:
+            if not (file_name or "").lower().endswith(".zip"):
+                files.append((file_name, content))
+                continue
+            try:
+                archive = zipfile.ZipFile(open_source(content))
+            except zipfile.BadZipFile:
+                raise HTTPException(status_code=400, detail=f"Invalid ZIP archive: {file_name}")
+            members = [
+                m for m in archive.infolist()
+                if not m.is_dir() and not m.filename.startswith("__MACOSX/")
+                and m.filename.lower().endswith((".xlsx", ".xls", ".csv"))
+            ]
+            if sum(m.file_size for m in members) > MAX_UNZIPPED_BYTES:
+                raise UploadTooLarge(MAX_UNZIPPED_BYTES)
+            files += [(f"{file_name}/{m.filename}", ZipMember(archive, m)) for m in members]
+        return files
 
-            db.commit()
+    @staticmethod
+    def process_grading_batch(db: Session, files: list, force: bool = False) -> dict:
+        """
+        Parses many grading workbooks across cores and upserts every resulting
+        Cell with chunked INSERT ... ON CONFLICT statements and one commit.
+        Files are keyed by content: identical workbooks in one batch are parsed
+        once, and every digest is claimed in the ingest ledger before parsing, so
+        a file ingested before (or by a concurrent request) is never written twice.
+        """
+        # 0. Fingerprint, fold identical content, claim every digest in one statement
+        claimed, by_digest, copies = IngestLedgerService.claim_batch(db, "grading", files, force)
+        report = list(by_digest.values())
+        files = [(file_name, content) for _, file_name, content in claimed]
 
-            return {
+        # 1. Parse in parallel (in-process for a single file, no point paying for IPC).
+        #    The batch holds one parse slot, like a single upload; workbooks are read as they are submitted.
+        timer = StageTimer("grading_batch")
+        with parse_slot():
+            if len(files) > 1:
+                parsed_files = map_parse(_parse_file_safe, files, load=load_named)
+            else:
+                parsed_files = [_parse_file_safe(load_named(item)) for item in files]
+        timer.lap("parse")
+
+        rows = {}
+        outcomes = []
+        steps_by_cell = {}
+        graded_at = datetime.now()
+        failed = []
+        # Cells built into shipped packs keep the grading they shipped with
+        shipped = CellService.dispatched_cells(db, [parsed["cell_id"] for _, parsed, _ in parsed_files if parsed])
+        for (digest, _, _), (file_name, parsed, error) in zip(claimed, parsed_files):
+            if not error and parsed["cell_id"] in shipped:
+                error = f"Cell {parsed['cell_id']} is in dispatched pack {shipped[parsed['cell_id']]}, its grading is final"
+            elif error:
+                record_parse_failure("grading_batch", error)
+            if error:
+                by_digest[digest] = {"file": file_name, "status": "Error", "detail": error}
+                report.append(by_digest[digest])
+                failed.append(digest)
+                continue
+            # Last workbook wins if the same cell was graded twice in one batch
+            steps_by_cell[parsed["cell_id"]] = parsed.pop("steps", [])
+            rows[parsed["cell_id"]] = {**parsed, "grading_date": graded_at, "is_used": False}
+            result = {
                 "status": "Success",
-                "cell_id": cell_id,
+                "cell_id": parsed["cell_id"],
                 "data": {
-                    "capacity": float(cell.actual_cap_ah),
-                    "ocv": float(cell.ocv_volts),
-                    "cutoff": float(cell.cut_off_voltage),
-                    "group": cell.capacity_group
+                    "capacity": parsed["actual_cap_ah"],
+                    "ocv": parsed["ocv_volts"],
+                    "cutoff": parsed["cut_off_voltage"],
+                    "group": parsed["capacity_group"]
                 }
             }
-            
-        except Exception as e:
-            db.rollback()
-            # Clean logging for debugging production issues
-            print(f"Grading Error for {cell_id if 'cell_id' in locals() else 'Unknown'}: {str(e)}")
-            raise HTTPException(status_code=400, detail=f"Grading Error: {str(e)}")
\ No newline at end of file
+            by_digest[digest] = {"file": file_name, **result}
+            report.append(by_digest[digest])
+            outcomes.append((digest, file_name, result))
+        # Rejected files give their claim back so a corrected re-upload is not blocked
+        IngestLedgerService.release_many(db, "grading", failed)
+
+        # 2. Bulk upsert in GRADING_UPSERT_CHUNK-row statements, one transaction;
+        #    is_used is only set on insert so linked cells stay linked
+        if rows:
+            dialect_insert = insert_for(db)
+            cell_ids, values = list(rows), list(rows.values())
+            try:
+                # Current group/used state of re-graded cells, for the dashboard counters
+                existing = {}
+                for i in range(0, len(cell_ids), GRADING_UPSERT_CHUNK):
+                    existing.update(
+                        (r.cell_id, (r.capacity_group, r.is_used))
+                        for r in db.execute(
+                            select(Cell.cell_id, Cell.capacity_group, Cell.is_used)
+                            .where(Cell.cell_id.in_(cell_ids[i:i + GRADING_UPSERT_CHUNK]))
+                        )
+                    )
+                for i in range(0, len(values), GRADING_UPSERT_CHUNK):
+                    stmt = dialect_insert(Cell).values(values[i:i + GRADING_UPSERT_CHUNK])
+                    db.execute(stmt.on_conflict_do_update(
+                        index_elements=[Cell.cell_id],
+                        set_={
+                            col: stmt.excluded[col]
+                            for col in ("actual_cap_ah", "ocv_volts", "cut_off_voltage", "capacity_group", "grading_date")
+                        }
+                    ))
+                CellService.replace_grading_steps(db, steps_by_cell)
+                DashboardService.cells_changed(
+                    db,
+                    [existing.get(cid) for cid in rows],
+                    [(row["capacity_group"], existing[cid][1] if cid in existing else False) for cid, row in rows.items()]
+                )
+                # One event per batch: a shift ZIP would otherwise flood every screen cell by cell
+                EventBus.stage(db, "cell.graded_batch", {
+                    "cells": len(rows), "by_group": dict(Counter(row["capacity_group"] for row in rows.values()))
+                })
+                timer.lap("db_write")
+                db.commit()
+                timer.lap("commit")
+            except Exception as e:
+                db.rollback()
+                logger.exception("Batch Grading Error")
+                IngestLedgerService.release_many(db, "grading", [digest for digest, _, _ in outcomes])
+                raise HTTPException(status_code=500, detail=f"Batch Grading Error: {str(e)}")
+            # Same shape as the single-file response, so either endpoint can replay it
+            IngestLedgerService.complete_many(db, "grading", outcomes)
+
+        # Copies of a file already in this batch share its outcome
+        report += IngestLedgerService.copies_report(by_digest, copies)
+
+        succeeded = sum(1 for r in report if r["status"] == "Success")
+        duplicates = len(report) - succeeded - sum(1 for r in report if r["status"] == "Error")
+        record_ingested(
+            "grading_batch", files=succeeded,
+            cells=len(rows), grading_step_results=sum(len(steps) for steps in steps_by_cell.values())
+        )
+        ok = succeeded + duplicates
+        if ok == len(report):
+            status = "Success"
+        else:
+            status = "Partial" if ok else "Failed"
+        return {
+            "status": status,
+            "files_received": len(report),
+            "succeeded": succeeded,
+            "duplicates": duplicates,
+            "failed": len(report) - ok,
+            "cells_upserted": len(rows),
+            "results": report
+        }
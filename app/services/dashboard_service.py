@@ -0,0 +1,331 @@
+import logging
+import os
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import date, timedelta
+from sqlalchemy import delete, func, insert, select, union_all
+from sqlalchemy.orm import Session
+from app.database import SessionLocal, engine, insert_for
+from app.models.battery import BatteryPack, PackTestResult, PDIChecklist
+from app.models.cell import Cell
+from app.models.dashboard import ProductionCounter, ProductionCounterDelta
+
+logger = logging.getLogger(__name__)
+
+UNGRADED = "Ungraded"
+
+# pg_try_advisory_lock key held by the one process that runs the periodic reconciler
+RECONCILER_LOCK_KEY = 0x4D56_4442  # "MVDB"
+# pg_advisory_xact_lock key that serialises folds (periodic and POST /dashboard/reconcile)
+COUNTER_FOLD_LOCK_KEY = 0x4D56_4446  # "MVDF"
+RECONCILE_CHUNK = 1000
+# Pending deltas are folded into production_counters this often (0 leaves them to reconcile())
+COUNTER_FOLD_SECONDS = float(os.getenv("DASHBOARD_FOLD_SECONDS", "10"))
+# First counter check this long after start-up, off the path to serving requests
+RECONCILER_START_DELAY_SECONDS = float(os.getenv("DASHBOARD_RECONCILE_START_DELAY", "5"))
+
+
+def cell_key(capacity_group, is_used) -> str:
+    return f"{capacity_group or UNGRADED}|{'used' if is_used else 'unused'}"
+
+
+def daily_key(day, model_name, verdict) -> str:
+    return f"{day.isoformat() if hasattr(day, 'isoformat') else day}|{model_name}|{verdict}"
+
+
+class DashboardService:
+    """
+    Counters behind /dashboard/summary. Write paths call the helpers below
+    inside their own transaction; they only append to the insert-only
+    production_counter_deltas log, so a counter moves exactly when the row it
+    describes does without any writer waiting on a shared counter row.
+    fold() moves the log into production_counters; reconcile() rebuilds
+    everything from the base tables to correct any drift.
+    """
+
+    # --- WRITE-PATH HOOKS ---
+
+    @staticmethod
+    def bump(db: Session, deltas: Counter):
+        """Appends {(metric, key): delta} to the delta log as multi-row INSERTs, in key order."""
+        rows = [{"metric": m, "key": k, "delta": v} for (m, k), v in sorted(deltas.items()) if v]
+        for i in range(0, len(rows), RECONCILE_CHUNK):
+            db.execute(insert(ProductionCounterDelta).values(rows[i:i + RECONCILE_CHUNK]))
+
+    @staticmethod
+    def pack_status_changed(db: Session, old_status, new_status, count: int = 1):
+        if old_status == new_status:
+            return
+        deltas = Counter()
+        if old_status:
+            deltas[("pack_status", old_status)] -= count
+        deltas[("pack_status", new_status)] += count
+        DashboardService.bump(db, deltas)
+
+    @staticmethod
+    def pack_statuses_changed(db: Session, transitions: list):
+        """Bulk form: [(old_status, new_status), ...]."""
+        deltas = Counter()
+        for old_status, new_status in transitions:
+            if old_status == new_status:
+                continue
+            if old_status:
+                deltas[("pack_status", old_status)] -= 1
+            deltas[("pack_status", new_status)] += 1
+        DashboardService.bump(db, deltas)
+
+    @staticmethod
+    def cells_changed(db: Session, before: list, after: list):
+        """`before`/`after` are (capacity_group, is_used) pairs; None in before means a new cell."""
+        deltas = Counter()
+        for state in before:
+            if state is not None:
+                deltas[("cells", cell_key(*state))] -= 1
+        for state in after:
+            deltas[("cells", cell_key(*state))] += 1
+        DashboardService.bump(db, deltas)
+
+    @staticmethod
+    def cells_linked(db: Session, capacity_groups: list):
+        deltas = Counter()
+        for group in capacity_groups:
+            deltas[("cells", cell_key(group, False))] -= 1
+            deltas[("cells", cell_key(group, True))] += 1
+        DashboardService.bump(db, deltas)
+
+    @staticmethod
+    def verdicts_recorded(db: Session, metric: str, verdicts: list):
+        """metric 'daily_test' or 'daily_pdi'; verdicts are (model_name, 'PASS'|'FAIL') for today."""
+        today = date.today()
+        deltas = Counter((metric, daily_key(today, model, verdict)) for model, verdict in verdicts)
+        DashboardService.bump(db, deltas)
+
+    # --- READ SIDE ---
+
+    @staticmethod
+    def _totals(db: Session, where=None) -> dict:
+        """{(metric, key): value} of the folded counters plus the deltas not folded yet."""
+        parts = []
+        for model, value in ((ProductionCounter, ProductionCounter.value),
+                             (ProductionCounterDelta, ProductionCounterDelta.delta)):
+            stmt = select(model.metric, model.key, value.label("value"))
+            if where is not None:
+                stmt = stmt.where(where(model.metric, model.key))
+            parts.append(stmt)
+        merged = union_all(*parts).subquery()
+        return {
+            (m, k): int(v) for m, k, v in db.execute(
+                select(merged.c.metric, merged.c.key, func.sum(merged.c.value))
+                .group_by(merged.c.metric, merged.c.key)
+            )
+        }
+
+    @staticmethod
+    def summary(db: Session, days: int = 7) -> dict:
+        since = (date.today() - timedelta(days=days - 1)).isoformat()
+        rows = DashboardService._totals(
+            db, lambda metric, key: metric.in_(("pack_status", "cells"))
+            | (metric.in_(("daily_test", "daily_pdi")) & (key >= since))
+        )
+
+        packs = {}
+        cells = defaultdict(lambda: {"used": 0, "unused": 0})
+        daily = {"daily_test": defaultdict(Counter), "daily_pdi": defaultdict(Counter)}
+        for (metric, key), value in rows.items():
+            if metric == "pack_status":
+                if value:
+                    packs[key] = value
+            elif metric == "cells":
+                group, used = key.rsplit("|", 1)
+                cells[group][used] = value
+            else:
+                day, model, verdict = key.split("|", 2)
+                daily[metric][(day, model)][verdict] = value
+
+        def yields(buckets):
+            out = []
+            for (day, model), c in sorted(buckets.items(), reverse=True):
+                total = c["PASS"] + c["FAIL"]
+                out.append({
+                    "date": day, "model_name": model, "pass": c["PASS"], "fail": c["FAIL"],
+                    "yield_pct": round(100.0 * c["PASS"] / total, 2) if total else None,
+                })
+            return out
+
+        cells = {g: v for g, v in sorted(cells.items()) if v["used"] or v["unused"]}
+        return {
+            "packs_by_status": packs,
+            "cells_by_group": cells,
+            "cells_total": {
+                "used": sum(v["used"] for v in cells.values()),
+                "unused": sum(v["unused"] for v in cells.values()),
+            },
+            "pack_test_yield": yields(daily["daily_test"]),
+            "pdi_yield": yields(daily["daily_pdi"]),
+        }
+
+    # --- RECONCILIATION ---
+
+    @staticmethod
+    def fold(db: Session) -> int:
+        """
+        Moves the pending deltas into production_counters in one short
+        transaction and drops counters that reached zero. Only folds touch the
+        counter rows, one at a time, in key order. Returns deltas folded.
+        """
+        if db.get_bind().dialect.name == "postgresql":
+            db.execute(select(func.pg_advisory_xact_lock(COUNTER_FOLD_LOCK_KEY)))
+        # DELETE ... RETURNING: a delta committed meanwhile is either taken here or left for next time
+        taken = db.execute(
+            delete(ProductionCounterDelta).returning(
+                ProductionCounterDelta.metric, ProductionCounterDelta.key, ProductionCounterDelta.delta
+            )
+        ).all()
+        sums = Counter()
+        for metric, key, delta in taken:
+            sums[(metric, key)] += delta
+        rows = [{"metric": m, "key": k, "value": v} for (m, k), v in sorted(sums.items()) if v]
+        for i in range(0, len(rows), RECONCILE_CHUNK):
+            dialect_insert = insert_for(db)
+            stmt = dialect_insert(ProductionCounter).values(rows[i:i + RECONCILE_CHUNK])
+            db.execute(stmt.on_conflict_do_update(
+                index_elements=[ProductionCounter.metric, ProductionCounter.key],
+                set_={"value": ProductionCounter.value + stmt.excluded.value}
+            ))
+        if rows:
+            db.execute(delete(ProductionCounter).where(ProductionCounter.value == 0))
+        db.commit()
+        return len(taken)
+
+    @staticmethod
+    def reconcile(db: Session) -> int:
+        """
+        Recomputes every counter with GROUP BY and appends the difference from
+        counters + pending deltas to the delta log, then folds. Nothing is
+        locked during the scans: on PostgreSQL they run in one REPEATABLE READ
+        snapshot with the counter read, so a write that commits meanwhile is on
+        neither side and its own delta still applies. Returns counters corrected.
+        """
+        if db.get_bind().dialect.name == "postgresql":
+            db.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+        truth = Counter()
+        for status, n in db.execute(select(BatteryPack.final_status, func.count()).group_by(BatteryPack.final_status)):
+            truth[("pack_status", status or "UNKNOWN")] = n
+        for group, used, n in db.execute(
+            select(Cell.capacity_group, Cell.is_used, func.count()).group_by(Cell.capacity_group, Cell.is_used)
+        ):
+            truth[("cells", cell_key(group, used))] += n
+
+        test_day = func.date(PackTestResult.tested_at)
+        for day, model, verdict, n in db.execute(
+            select(test_day, BatteryPack.model_name, PackTestResult.status, func.count())
+            .join(BatteryPack, BatteryPack.battery_id == PackTestResult.battery_id)
+            .where(PackTestResult.tested_at.isnot(None))
+            .group_by(test_day, BatteryPack.model_name, PackTestResult.status)
+        ):
+            truth[("daily_test", daily_key(day, model, verdict))] = n
+
+        pdi_day = func.date(PDIChecklist.inspection_timestamp)
+        for day, model, verdict, n in db.execute(
+            select(pdi_day, BatteryPack.model_name, PDIChecklist.final_result, func.count())
+            .join(BatteryPack, BatteryPack.battery_id == PDIChecklist.battery_id)
+            .where(PDIChecklist.inspection_timestamp.isnot(None))
+            .group_by(pdi_day, BatteryPack.model_name, PDIChecklist.final_result)
+        ):
+            truth[("daily_pdi", daily_key(day, model, verdict))] = n
+
+        current = DashboardService._totals(db)
+        corrections = Counter({key: truth[key] - current.get(key, 0) for key in truth.keys() | current.keys()})
+        DashboardService.bump(db, corrections)
+        db.commit()
+        DashboardService.fold(db)
+        return sum(1 for v in corrections.values() if v)
+
+    _stop = threading.Event()
+
+    _leader = None  # Connection holding RECONCILER_LOCK_KEY in this process
+
+    @staticmethod
+    def _is_leader() -> bool:
+        """
+        On PostgreSQL one uvicorn worker keeps a session advisory lock for its
+        lifetime and is the only one that reconciles; the others retry each
+        interval and take over if it dies. Other databases run a single process.
+        """
+        if engine.dialect.name != "postgresql":
+            return True
+        if DashboardService._leader is None:
+            conn = engine.connect()
+            won = False
+            try:
+                won = conn.execute(select(func.pg_try_advisory_lock(RECONCILER_LOCK_KEY))).scalar()
+                conn.commit()
+            finally:
+                if not won:
+                    conn.close()
+            if won:
+                DashboardService._leader = conn
+        return DashboardService._leader is not None
+
+    @staticmethod
+    def _resign():
+        """Closing the connection releases the advisory lock."""
+        if DashboardService._leader is not None:
+            try:
+                DashboardService._leader.close()
+            finally:
+                DashboardService._leader = None
+
+    @staticmethod
+    def start_reconciler(interval_seconds: float = None):
+        """
+        Background thread that folds pending deltas every DASHBOARD_FOLD_SECONDS
+        and reconciles every DASHBOARD_RECONCILE_SECONDS (0 disables either).
+        Started in every worker, but only the holder of the reconciler lock runs them.
+        """
+        interval = interval_seconds if interval_seconds is not None else float(os.getenv("DASHBOARD_RECONCILE_SECONDS", "900"))
+        if interval <= 0 and COUNTER_FOLD_SECONDS <= 0:
+            return
+        DashboardService._stop.clear()
+
+        def loop():
+            # Nothing on the start-up path: the worker serves requests before the first check
+            if DashboardService._stop.wait(RECONCILER_START_DELAY_SECONDS):
+                return
+            # First pass right away if the counters were never built (fresh deploy)
+            next_reconcile = time.monotonic() + interval
+            db = SessionLocal()
+            try:
+                if interval > 0 and not db.query(ProductionCounter).first():
+                    next_reconcile = time.monotonic()
+            except Exception:
+                logger.exception("Dashboard counter check failed")
+            finally:
+                db.close()
+            while True:
+                due = max(0.0, next_reconcile - time.monotonic()) if interval > 0 else None
+                wait = min(w for w in (due, COUNTER_FOLD_SECONDS or None) if w is not None)
+                if DashboardService._stop.wait(wait):
+                    break
+                db = SessionLocal()
+                try:
+                    if DashboardService._is_leader():
+                        if interval > 0 and time.monotonic() >= next_reconcile:
+                            next_reconcile = time.monotonic() + interval
+                            DashboardService.reconcile(db)
+                        else:
+                            DashboardService.fold(db)
+                except Exception:
+                    db.rollback()
+                    logger.exception("Dashboard reconciliation failed")
+                    DashboardService._resign()  # The lock connection may be dead too; re-elect next round
+                finally:
+                    db.close()
+            DashboardService._resign()
+
+        threading.Thread(target=loop, name="dashboard-reconciler", daemon=True).start()
+
+    @staticmethod
+    def stop_reconciler():
+        DashboardService._stop.set()
@@ -0,0 +1,96 @@
+from datetime import datetime
+from sqlalchemy import insert, select, update
+from sqlalchemy.orm import Session
+from fastapi import HTTPException
+from app.models.battery import BatteryPack
+from app.models.dispatch import BatteryDispatch
+from app.services.dashboard_service import DashboardService
+from app.services.event_bus import EventBus
+from app.services.reservation_service import ReservationService
+
+DISPATCHABLE_STATUS = "READY_FOR_DISPATCH"
+DISPATCHED_STATUS = "DISPATCHED"
+
+
+class PackDispatched(HTTPException):
+    """A test or inspection result arrived for a pack that has shipped; its records are final."""
+
+    def __init__(self, detail: str):
+        super().__init__(status_code=409, detail=detail)
+
+
+class DispatchService:
+    """
+    Ships packs against an invoice. A whole pallet or truck is checked with one
+    query and written in one transaction: either every pack is dispatched or
+    none is.
+    """
+
+    @staticmethod
+    def dispatch(db: Session, battery_ids: list, customer_name: str, invoice_number: str,
+                 sales_executive_signature: str) -> dict:
+        battery_ids = list(dict.fromkeys(battery_ids))  # A pack scanned twice ships once
+
+        # 1. One query: every pack, its status and any earlier sale.
+        #    Pack rows are locked so a concurrent dispatch or PDI cannot change them under us.
+        rows = db.execute(
+            select(BatteryPack.battery_id, BatteryPack.model_name, BatteryPack.final_status,
+                   BatteryDispatch.invoice_number)
+            .outerjoin(BatteryDispatch, BatteryDispatch.battery_id == BatteryPack.battery_id)
+            .where(BatteryPack.battery_id.in_(battery_ids))
+            .with_for_update(of=BatteryPack)
+        ).all()
+        found = {r.battery_id: r for r in rows}
+
+        missing = [bid for bid in battery_ids if bid not in found]
+        if missing:
+            db.rollback()
+            raise HTTPException(status_code=404, detail={"message": "Unknown battery packs", "battery_ids": missing})
+        already = {bid: found[bid].invoice_number for bid in battery_ids if found[bid].invoice_number is not None}
+        if already:
+            db.rollback()
+            raise HTTPException(status_code=409, detail={"message": "Already dispatched", "invoices": already})
+        not_ready = {bid: found[bid].final_status for bid in battery_ids if found[bid].final_status != DISPATCHABLE_STATUS}
+        if not_ready:
+            db.rollback()
+            raise HTTPException(
+                status_code=409,
+                detail={"message": f"Packs must be {DISPATCHABLE_STATUS}", "statuses": not_ready}
+            )
+
+        # 2. All sale rows and status flips in the same transaction
+        now = datetime.utcnow()
+        db.execute(insert(BatteryDispatch), [
+            {"battery_id": bid, "customer_name": customer_name, "invoice_number": invoice_number,
+             "sale_date": now, "sales_executive_signature": sales_executive_signature}
+            for bid in battery_ids
+        ])
+        updated = db.execute(
+            update(BatteryPack)
+            .where(BatteryPack.battery_id.in_(battery_ids), BatteryPack.final_status == DISPATCHABLE_STATUS)
+            .values(final_status=DISPATCHED_STATUS)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if updated != len(battery_ids):
+            db.rollback()
+            raise HTTPException(status_code=409, detail="Pack statuses changed during dispatch, please retry")
+        DashboardService.pack_status_changed(db, DISPATCHABLE_STATUS, DISPATCHED_STATUS, len(battery_ids))
+        # One event per model on the invoice, so screens filtered by model see their packs ship
+        by_model = {}
+        for bid in battery_ids:
+            by_model.setdefault(found[bid].model_name, []).append(bid)
+        for model_name, model_ids in by_model.items():
+            EventBus.stage(db, "pack.dispatched", {
+                "invoice_number": invoice_number, "customer_name": customer_name, "battery_ids": model_ids
+            }, model=model_name)
+        # unique(battery_id) on battery_dispatch catches a dispatch that raced past the lock (SQLite)
+        ReservationService.commit_or_conflict(db, "One of these packs was dispatched by another request")
+
+        return {
+            "status": "Dispatched",
+            "invoice_number": invoice_number,
+            "customer_name": customer_name,
+            "sale_date": now,
+            "dispatched": len(battery_ids),
+            "battery_ids": battery_ids,
+        }
@@ -0,0 +1,302 @@
+import asyncio
+import itertools
+import json
+import logging
+import os
+import select
+import threading
+import uuid
+from collections import deque
+from contextvars import ContextVar
+from datetime import datetime
+from sqlalchemy import event, text
+from app.services.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# Events a subscriber may fall behind by; beyond that its oldest are dropped (publishers never wait)
+EVENT_BUFFER = int(os.getenv("EVENT_BUFFER", "256"))
+# Recent events kept per worker so a reconnecting screen (Last-Event-ID) misses nothing
+EVENT_REPLAY = int(os.getenv("EVENT_REPLAY", "1000"))
+# SSE comment sent on idle streams so proxies keep them open and dead clients are noticed
+EVENT_HEARTBEAT_SECONDS = float(os.getenv("EVENT_HEARTBEAT_SECONDS", "15"))
+# "auto": LISTEN/NOTIFY when the database is PostgreSQL; "none": this worker's events only
+EVENT_BROKER = os.getenv("EVENT_BROKER", "auto")
+
+NOTIFY_CHANNEL = "production_events"
+NOTIFY_MAX_BYTES = 7900  # PostgreSQL caps a NOTIFY payload at 8000 bytes
+
+EVENTS_PUBLISHED = REGISTRY.counter(
+    "events_published_total", "Production events committed, by type.", ("type",))
+EVENTS_DROPPED = REGISTRY.counter(
+    "events_dropped_total", "Events discarded from the buffer of a slow subscriber.", ())
+
+# Set per request from the X-Station header (EventContextMiddleware)
+current_station = ContextVar("event_station", default=None)
+
+
+class Subscriber:
+    """One open stream: its filters and a bounded buffer drained by the SSE response."""
+
+    def __init__(self, types=None, models=None, stations=None, buffer: int = EVENT_BUFFER):
+        self.types = tuple(types or ())
+        self.models = set(models or ())
+        self.stations = set(stations or ())
+        self.queue = deque(maxlen=buffer)
+        self.dropped = 0
+        # Last-Event-ID the client resumed from that is no longer (or never was) in the replay buffer
+        self.unknown_last_id = None
+        self.ready = asyncio.Event()
+
+    def wants(self, evt: dict) -> bool:
+        # "pack." matches every pack event, "pack.tested" only that one
+        if self.types and not any(evt["type"] == t or (t.endswith(".") and evt["type"].startswith(t))
+                                  for t in self.types):
+            return False
+        if self.models and evt.get("model") not in self.models:
+            return False
+        if self.stations and evt.get("station") not in self.stations:
+            return False
+        return True
+
+    def offer(self, evt: dict):
+        """Runs on the event loop; a full buffer loses its oldest event, never blocks."""
+        if len(self.queue) == self.queue.maxlen:
+            self.dropped += 1
+            EVENTS_DROPPED.inc()
+        self.queue.append(evt)
+        self.ready.set()
+
+
+class EventBus:
+    """
+    In-process fan-out of production events to /events streams.
+
+    Write paths stage() events next to their dashboard hooks; they are
+    published only when the session commits (a rollback discards them), so a
+    screen never sees a verdict that was not stored. Publishing costs one
+    call_soon_threadsafe per event: filtering and buffering happen on the
+    event loop, and a slow subscriber only loses its own oldest events.
+
+    With PostgreSQL the staged events also go out as NOTIFY inside the
+    committing transaction, and a LISTEN thread in every worker delivers the
+    ones published elsewhere, so a screen connected to any worker sees all.
+    """
+    origin = uuid.uuid4().hex[:12]
+    _seq = itertools.count(1)
+    _loop = None
+    _subscribers = set()
+    _recent = deque(maxlen=EVENT_REPLAY)
+    _broker = None
+
+    # --- PUBLISHING (any thread) ---
+
+    @staticmethod
+    def stage(db, type: str, data: dict = None, model: str = None):
+        """Queues an event on the session; it is published if and when the session commits."""
+        db.info.setdefault("staged_events", []).append({
+            "id": f"{EventBus.origin}-{next(EventBus._seq)}",
+            "type": type,
+            "at": datetime.now().isoformat(),
+            "model": model,
+            "station": current_station.get(),
+            "data": data or {},
+        })
+
+    @staticmethod
+    def _before_commit(session):
+        staged = session.info.get("staged_events")
+        if staged and EventBus._broker is not None:
+            EventBus._broker.notify(session, staged)
+
+    @staticmethod
+    def _after_commit(session):
+        for evt in session.info.pop("staged_events", ()):
+            EVENTS_PUBLISHED.inc(type=evt["type"])
+            EventBus.deliver(evt)
+
+    @staticmethod
+    def _after_rollback(session):
+        session.info.pop("staged_events", None)
+
+    @staticmethod
+    def deliver(evt: dict):
+        loop = EventBus._loop
+        if loop is None or loop.is_closed():
+            # No stream opened yet: keep it for replay so the first reconnecting screen misses nothing
+            EventBus._recent.append(evt)
+            return
+        try:
+            loop.call_soon_threadsafe(EventBus._fan_out, evt)
+        except RuntimeError:
+            pass  # Loop shut down between the check and the call
+
+    @staticmethod
+    def _fan_out(evt: dict):
+        EventBus._recent.append(evt)
+        for subscriber in EventBus._subscribers:
+            if subscriber.wants(evt):
+                subscriber.offer(evt)
+
+    # --- SUBSCRIBING (event loop) ---
+
+    @staticmethod
+    def subscribe(types=None, models=None, stations=None, last_event_id: str = None) -> Subscriber:
+        EventBus._loop = asyncio.get_running_loop()
+        subscriber = Subscriber(types, models, stations)
+        if last_event_id:
+            ids = [e["id"] for e in EventBus._recent]
+            if last_event_id in ids:
+                for evt in list(EventBus._recent)[ids.index(last_event_id) + 1:]:
+                    if subscriber.wants(evt):
+                        subscriber.offer(evt)
+            else:
+                # Aged out of the buffer, or from before a restart: the gap cannot be replayed
+                subscriber.unknown_last_id = last_event_id
+                subscriber.ready.set()
+        EventBus._subscribers.add(subscriber)
+        return subscriber
+
+    @staticmethod
+    def unsubscribe(subscriber: Subscriber):
+        EventBus._subscribers.discard(subscriber)
+
+    @staticmethod
+    async def stream(subscriber: Subscriber, is_disconnected):
+        """SSE frames for one subscriber until the client goes away."""
+        try:
+            yield f"retry: 3000\n: subscribed {EventBus.origin}\n\n"
+            while not await is_disconnected():
+                try:
+                    await asyncio.wait_for(subscriber.ready.wait(), EVENT_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                subscriber.ready.clear()
+                if subscriber.unknown_last_id:
+                    # Events since the client's last one cannot be replayed: it must re-fetch state
+                    lagged = {"unknown_last_event_id": subscriber.unknown_last_id}
+                    yield f"event: lagged\ndata: {json.dumps(lagged)}\n\n"
+                    subscriber.unknown_last_id = None
+                if subscriber.dropped:
+                    # The client fell behind: tell it to re-fetch state rather than trust the stream
+                    yield f"event: lagged\ndata: {json.dumps({'dropped': subscriber.dropped})}\n\n"
+                    subscriber.dropped = 0
+                while subscriber.queue:
+                    evt = subscriber.queue.popleft()
+                    yield f"id: {evt['id']}\nevent: {evt['type']}\ndata: {json.dumps(evt, default=str)}\n\n"
+        finally:
+            EventBus.unsubscribe(subscriber)
+
+    @staticmethod
+    def stats() -> dict:
+        return {
+            "origin": EventBus.origin,
+            "subscribers": len(EventBus._subscribers),
+            "buffered": sum(len(s.queue) for s in EventBus._subscribers),
+            "broker": type(EventBus._broker).__name__ if EventBus._broker else None,
+        }
+
+    # --- LIFECYCLE ---
+
+    @staticmethod
+    def install(session_factory):
+        event.listen(session_factory, "before_commit", EventBus._before_commit)
+        event.listen(session_factory, "after_commit", EventBus._after_commit)
+        event.listen(session_factory, "after_rollback", EventBus._after_rollback)
+
+    @staticmethod
+    def start_broker(engine):
+        if EVENT_BROKER == "none" or engine.dialect.name != "postgresql":
+            return
+        EventBus._broker = PostgresBroker(engine)
+        EventBus._broker.start()
+
+    @staticmethod
+    def stop_broker():
+        if EventBus._broker is not None:
+            EventBus._broker.stop()
+            EventBus._broker = None
+
+
+class PostgresBroker:
+    """
+    Carries events between workers over LISTEN/NOTIFY on the database we
+    already run, instead of a separate message broker. NOTIFY is transactional:
+    other workers hear of an event only once its writes are committed.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self._stop = threading.Event()
+        self._thread = None
+
+    def notify(self, session, events: list):
+        for evt in events:
+            payload = json.dumps({"origin": EventBus.origin, **evt}, default=str)
+            if len(payload.encode()) > NOTIFY_MAX_BYTES:
+                payload = json.dumps({"origin": EventBus.origin, **evt, "data": {"truncated": True}}, default=str)
+            session.execute(text("SELECT pg_notify(:channel, :payload)"),
+                            {"channel": NOTIFY_CHANNEL, "payload": payload})
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._listen_loop, name="event-broker", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def _listen_loop(self):
+        while not self._stop.is_set():
+            try:
+                self._listen()
+            except Exception:
+                logger.exception("Event broker connection lost, reconnecting")
+                self._stop.wait(2)
+
+    def _listen(self):
+        # A dedicated connection, detached from the pool: it sits in LISTEN for the worker's lifetime
+        pooled = self.engine.raw_connection()
+        pooled.detach()
+        conn = pooled.driver_connection
+        try:
+            conn.autocommit = True
+            conn.cursor().execute(f"LISTEN {NOTIFY_CHANNEL}")
+            while not self._stop.is_set():
+                if select.select([conn], [], [], 1.0) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    self._received(conn.notifies.pop(0).payload)
+        finally:
+            pooled.close()
+
+    @staticmethod
+    def _received(payload: str):
+        try:
+            evt = json.loads(payload)
+        except ValueError:
+            return
+        if evt.pop("origin", None) == EventBus.origin:
+            return  # Already delivered locally on commit
+        EventBus.deliver(evt)
+
+
+class EventContextMiddleware:
+    """Pure ASGI: tags events raised during a request with its X-Station header."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        station = dict(scope["headers"]).get(b"x-station")
+        token = current_station.set(station.decode("latin-1") if station else None)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current_station.reset(token)
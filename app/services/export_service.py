@@ -0,0 +1,168 @@
+import csv
+import io
+from datetime import datetime
+from sqlalchemy import Boolean, Date, DateTime, Float, Integer, Numeric, cast, select
+from fastapi import HTTPException
+from app.database import read_session
+from app.models.battery import BatteryPack, PackTestResult, PDIChecklist, pack_cell_mapping
+from app.models.cell import Cell
+
+# Rows per server-side cursor fetch; also the CSV flush size and Parquet row-group size
+EXPORT_CHUNK = 20_000
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file for ParquetWriter that hands out what was written so far."""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        # Parquet records absolute offsets in the footer, so this keeps counting after drain()
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _cells_query(model_name):
+    columns = [Cell.cell_id, Cell.grading_date, Cell.actual_cap_ah, Cell.ocv_volts,
+               Cell.cut_off_voltage, Cell.capacity_group, Cell.is_used]
+    stmt = select(*columns)
+    if model_name:
+        stmt = (
+            stmt.join(pack_cell_mapping, pack_cell_mapping.c.cell_id == Cell.cell_id)
+            .join(BatteryPack, BatteryPack.battery_id == pack_cell_mapping.c.battery_id)
+            .where(BatteryPack.model_name == model_name)
+        )
+    return stmt, columns, Cell.grading_date, Cell.cell_id
+
+
+def _pack_rows_query(model, date_column):
+    def build(model_name):
+        columns = [c for c in model.__table__.columns] + [BatteryPack.model_name]
+        stmt = select(*columns).join(BatteryPack, BatteryPack.battery_id == model.battery_id)
+        if model_name:
+            stmt = stmt.where(BatteryPack.model_name == model_name)
+        return stmt, columns, date_column, model.__table__.primary_key.columns[0]
+    return build
+
+
+# dataset -> builder(model_name) returning (select, columns, date column, order column)
+EXPORTS = {
+    "cells": _cells_query,
+    "pack_test_results": _pack_rows_query(PackTestResult, PackTestResult.tested_at),
+    "pdi_checklists": _pack_rows_query(PDIChecklist, PDIChecklist.inspection_timestamp),
+}
+
+
+class ExportService:
+    """
+    Streams whole tables out as CSV or Parquet. Rows come off a server-side
+    cursor EXPORT_CHUNK at a time and each chunk is encoded and yielded before
+    the next is fetched, so memory stays flat and the first bytes go out
+    as soon as the first chunk is read.
+    """
+
+    @staticmethod
+    def build_query(dataset: str, date_from: datetime = None, date_to: datetime = None, model_name: str = None):
+        stmt, columns, date_column, order_column = EXPORTS[dataset](model_name)
+        if date_from is not None:
+            stmt = stmt.where(date_column >= date_from)
+        if date_to is not None:
+            stmt = stmt.where(date_column < date_to)
+        return stmt.order_by(order_column), columns
+
+    @staticmethod
+    def _rows(stmt):
+        """
+        Runs on its own (replica) session: the response body is produced after
+        the request's session has already been closed.
+        """
+        db = read_session()
+        try:
+            result = db.execute(stmt.execution_options(yield_per=EXPORT_CHUNK))
+            for chunk in result.partitions():
+                yield chunk
+        finally:
+            db.close()
+
+    @staticmethod
+    def stream_csv(stmt, columns):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow([c.key for c in columns])
+        yield buffer.getvalue().encode()
+        for chunk in ExportService._rows(stmt):
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerows(chunk)
+            yield buffer.getvalue().encode()
+
+    @staticmethod
+    def parquet_schema(columns):
+        import pyarrow as pa
+
+        def arrow_type(column):
+            if isinstance(column.type, Boolean):
+                return pa.bool_()
+            if isinstance(column.type, Integer):
+                return pa.int64()
+            if isinstance(column.type, Numeric):
+                return pa.float64()
+            if isinstance(column.type, DateTime):
+                return pa.timestamp("us")
+            if isinstance(column.type, Date):
+                return pa.date32()
+            return pa.string()
+        return pa.schema([(c.key, arrow_type(c)) for c in columns])
+
+    @staticmethod
+    def stream_parquet(stmt, columns):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        schema = ExportService.parquet_schema(columns)
+        # Numeric columns arrive as floats so they map straight onto float64 arrays
+        stmt = stmt.with_only_columns(
+            *[cast(c, Float).label(c.key) if isinstance(c.type, Numeric) else c for c in columns]
+        )
+        sink = _ChunkSink()
+        writer = pq.ParquetWriter(sink, schema, compression="snappy")
+        try:
+            for chunk in ExportService._rows(stmt):
+                batch = pa.RecordBatch.from_arrays(
+                    [pa.array(values, type=field.type) for values, field in zip(zip(*chunk), schema)],
+                    schema=schema,
+                )
+                writer.write_batch(batch, row_group_size=len(chunk))
+                yield sink.drain()
+        finally:
+            writer.close()
+        yield sink.drain()
+
+    @staticmethod
+    def stream(dataset: str, fmt: str, **filters):
+        """Returns (byte iterator, media type, file name); validation errors surface before streaming starts."""
+        if fmt == "parquet":
+            try:
+                import pyarrow  # noqa: F401
+            except ImportError:
+                raise HTTPException(status_code=501, detail="Parquet export requires the optional 'pyarrow' package")
+
+        stmt, columns = ExportService.build_query(dataset, **filters)
+        file_name = f"{dataset}_{datetime.now():%Y%m%d_%H%M%S}.{fmt}"
+        if fmt == "parquet":
+            return ExportService.stream_parquet(stmt, columns), "application/vnd.apache.parquet", file_name
+        return ExportService.stream_csv(stmt, columns), "text/csv", file_name
@@ -0,0 +1,106 @@
+import os
+import threading
+from dataclasses import asdict
+from collections import OrderedDict
+from decimal import Decimal
+from sqlalchemy.orm import Session, selectinload, joinedload
+from app.models.battery import BatteryPack, PDIChecklist
+from app.models.cell import Cell
+from app.models.dispatch import BatteryDispatch
+from app.services.template_cache import TemplateCache
+from fastapi import HTTPException
+
+
+def _plain(value):
+    return float(value) if isinstance(value, Decimal) else value
+
+
+def _columns(obj, *names) -> dict:
+    return {name: _plain(getattr(obj, name)) for name in names}
+
+
+class GenealogyService:
+    """
+    Full traceability tree for a pack in a fixed number of queries
+    (pack + PDI + BMS joined, then cells, grading steps, test results and
+    dispatch), independent of the pack's cell count.
+
+    Dispatched packs no longer change (test, PDI, grading, cell and BMS
+    writes to them are rejected with a 409), so their tree is kept in a
+    bounded process-local LRU. The template is not part of the cached tree:
+    it can be edited, and is attached from TemplateCache on every read.
+    """
+    _cache = OrderedDict()
+    _lock = threading.Lock()
+    max_entries = int(os.getenv("GENEALOGY_CACHE_SIZE", "2048"))
+
+    @staticmethod
+    def build(db: Session, battery_id: str) -> dict:
+        pack = (
+            db.query(BatteryPack)
+            .options(
+                joinedload(BatteryPack.bms_unit),
+                selectinload(BatteryPack.cells).selectinload(Cell.grading_results),
+                selectinload(BatteryPack.test_results),
+            )
+            .filter(BatteryPack.battery_id == battery_id)
+            .first()
+        )
+        if not pack:
+            raise HTTPException(status_code=404, detail="Battery Pack not found")
+        dispatch = db.query(BatteryDispatch).filter_by(battery_id=battery_id).first()
+        # A re-inspected pack has several checklists; the latest one is its PDI
+        pdi = (
+            db.query(PDIChecklist)
+            .filter_by(battery_id=battery_id)
+            .order_by(PDIChecklist.inspection_timestamp.desc(), PDIChecklist.id.desc())
+            .first()
+        )
+        return {
+            "battery_id": pack.battery_id,
+            "model_name": pack.model_name,
+            "assembly_date": pack.assembly_date,
+            "final_status": pack.final_status,
+            "template": None,  # Attached per read by get()
+            "bms": _columns(pack.bms_unit, "bms_id", "bms_model") if pack.bms_unit else None,
+            "cells": [
+                {
+                    **_columns(cell, "cell_id", "grading_date", "actual_cap_ah", "ocv_volts",
+                               "cut_off_voltage", "capacity_group"),
+                    "grading_steps": [
+                        _columns(step, "step_number", "step_type", "end_v", "end_cap", "time_min")
+                        for step in sorted(cell.grading_results, key=lambda s: s.step_number or 0)
+                    ],
+                }
+                for cell in sorted(pack.cells, key=lambda c: c.cell_id)
+            ],
+            "test_results": [
+                _columns(t, "test_id", "working_mode", "cap_ah", "end_v", "end_a", "energy_wh",
+                         "test_duration_min", "avg_voltage", "status")
+                for t in sorted(pack.test_results, key=lambda t: t.test_id)
+            ],
+            "pdi": {
+                column.key: _plain(getattr(pdi, column.key))
+                for column in pdi.__table__.columns
+                if column.key not in ("battery_id",)
+            } if pdi else None,
+            "dispatch": _columns(dispatch, "sale_id", "customer_name", "invoice_number", "sale_date",
+                                 "sales_executive_signature") if dispatch else None,
+        }
+
+    @staticmethod
+    def get(db: Session, battery_id: str) -> dict:
+        with GenealogyService._lock:
+            tree = GenealogyService._cache.get(battery_id)
+            if tree is not None:
+                GenealogyService._cache.move_to_end(battery_id)
+
+        if tree is None:
+            tree = GenealogyService.build(db, battery_id)
+            if tree["dispatch"] is not None:
+                with GenealogyService._lock:
+                    GenealogyService._cache[battery_id] = tree
+                    if len(GenealogyService._cache) > GenealogyService.max_entries:
+                        GenealogyService._cache.popitem(last=False)
+        template = TemplateCache.get(db, tree["model_name"]) if tree["model_name"] else None
+        return {**tree, "template": asdict(template) if template else None}
@@ -0,0 +1,252 @@
+import hashlib
+import os
+from datetime import datetime, timedelta
+from sqlalchemy import delete, update
+from sqlalchemy.orm import Session
+from fastapi import HTTPException
+from app.database import insert_for
+from app.models.ingest_ledger import IngestLedger
+from app.services.uploads import iter_chunks
+
+# A PROCESSING claim older than this is assumed abandoned (worker crashed) and can be taken over
+LEDGER_STALE_SECONDS = int(os.getenv("LEDGER_STALE_SECONDS", "600"))
+
+LEDGER_KEY = [IngestLedger.kind, IngestLedger.content_sha256, IngestLedger.scope]
+
+
+def fingerprint(content) -> str:
+    """sha256 of the upload; spooled files are hashed in chunks, never loaded whole."""
+    digest = hashlib.sha256()
+    for chunk in iter_chunks(content):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+class IngestLedgerService:
+    """
+    Makes uploads idempotent by content. Before parsing, the (kind, sha256, scope)
+    key is claimed with INSERT ... ON CONFLICT DO NOTHING; a repeat upload of a
+    file that was already ingested gets the recorded response back without any
+    parse or write, and an identical upload still in flight gets a 409.
+    `force=True` reprocesses a file that is already DONE.
+    """
+
+    @staticmethod
+    def replay(entry: IngestLedger) -> dict:
+        finished = entry.finished_at.isoformat() if entry.finished_at else None
+        return {**(entry.result or {}), "duplicate": True, "first_ingested_at": finished}
+
+    @staticmethod
+    def _entry(db: Session, kind: str, digest: str, scope: str):
+        return db.query(IngestLedger).filter_by(kind=kind, content_sha256=digest, scope=scope).first()
+
+    @staticmethod
+    def seen(db: Session, kind: str, content, scope: str = ""):
+        """Recorded response for an already ingested upload, else None (no claim is taken)."""
+        entry = IngestLedgerService._entry(db, kind, fingerprint(content), scope)
+        if entry is None or entry.status != "DONE":
+            return None
+        entry.hits += 1
+        db.commit()
+        return IngestLedgerService.replay(entry)
+
+    @staticmethod
+    def claim(db: Session, kind: str, digest: str, scope: str = "", file_name: str = None, force: bool = False):
+        """Returns None when this caller owns the claim, or the recorded response for a duplicate."""
+        now = datetime.now()
+        dialect_insert = insert_for(db)
+        inserted = db.execute(
+            dialect_insert(IngestLedger)
+            .values(kind=kind, content_sha256=digest, scope=scope, status="PROCESSING",
+                    file_name=file_name, hits=0, claimed_at=now)
+            .on_conflict_do_nothing(index_elements=LEDGER_KEY)
+        ).rowcount
+        db.commit()
+        if inserted:
+            return None
+
+        entry = IngestLedgerService._entry(db, kind, digest, scope)
+        if entry is None:
+            # Released by a failed attempt in between; complete() upserts the row
+            return None
+        if entry.status == "DONE" and not force:
+            entry.hits += 1
+            db.commit()
+            return IngestLedgerService.replay(entry)
+        if entry.status == "PROCESSING" and entry.claimed_at > now - timedelta(seconds=LEDGER_STALE_SECONDS):
+            raise HTTPException(status_code=409, detail="An identical upload is being processed right now")
+
+        # Forced reprocess, or a stale claim: take it over unless someone else just did
+        taken = db.execute(
+            update(IngestLedger)
+            .where(IngestLedger.id == entry.id, IngestLedger.claimed_at == entry.claimed_at)
+            .values(status="PROCESSING", claimed_at=now, file_name=file_name)
+        ).rowcount
+        db.commit()
+        if not taken:
+            raise HTTPException(status_code=409, detail="An identical upload is being processed right now")
+        return None
+
+    @staticmethod
+    def complete(db: Session, kind: str, digest: str, result: dict, scope: str = "", file_name: str = None):
+        dialect_insert = insert_for(db)
+        stmt = dialect_insert(IngestLedger).values(
+            kind=kind, content_sha256=digest, scope=scope, status="DONE", file_name=file_name,
+            result=result, hits=0, claimed_at=datetime.now(), finished_at=datetime.now()
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=LEDGER_KEY,
+            set_={"status": "DONE", "result": stmt.excluded.result, "finished_at": stmt.excluded.finished_at}
+        )
+        db.execute(stmt)
+        db.commit()
+
+    @staticmethod
+    def release(db: Session, kind: str, digest: str, scope: str = ""):
+        """Drops a failed attempt's claim so the same file can be uploaded again."""
+        db.rollback()
+        db.execute(delete(IngestLedger).where(
+            IngestLedger.kind == kind, IngestLedger.content_sha256 == digest,
+            IngestLedger.scope == scope, IngestLedger.status == "PROCESSING"
+        ))
+        db.commit()
+
+    @staticmethod
+    def process(db: Session, kind: str, content, handler, scope: str = "",
+                file_name: str = None, force: bool = False) -> dict:
+        """Runs handler() (parse + write + commit) at most once per distinct upload."""
+        digest = fingerprint(content)
+        recorded = IngestLedgerService.claim(db, kind, digest, scope, file_name, force)
+        if recorded is not None:
+            return recorded
+        try:
+            result = handler()
+        except Exception:
+            IngestLedgerService.release(db, kind, digest, scope)
+            raise
+        IngestLedgerService.complete(db, kind, digest, result, scope, file_name)
+        return result
+
+    # --- BATCH FORM (grading and pack-test batch endpoints) ---
+
+    @staticmethod
+    def claim_many(db: Session, kind: str, names: dict, force: bool = False):
+        """
+        claim() for a whole batch. names: {digest: file_name}. One INSERT ... ON
+        CONFLICT DO NOTHING RETURNING takes every new digest; the rest are looked
+        up in one query. Returns (owned digests, {digest: recorded response},
+        digests being processed by another request right now).
+        """
+        if not names:
+            return set(), {}, set()
+        now = datetime.now()
+        dialect_insert = insert_for(db)
+        owned = set(db.execute(
+            dialect_insert(IngestLedger)
+            .values([
+                {"kind": kind, "content_sha256": digest, "scope": "", "status": "PROCESSING",
+                 "file_name": file_name, "hits": 0, "claimed_at": now}
+                for digest, file_name in names.items()
+            ])
+            .on_conflict_do_nothing(index_elements=LEDGER_KEY)
+            .returning(IngestLedger.content_sha256)
+        ).scalars())
+
+        recorded, busy = {}, set()
+        rest = set(names) - owned
+        if rest:
+            entries = db.query(IngestLedger).filter(
+                IngestLedger.kind == kind, IngestLedger.scope == "", IngestLedger.content_sha256.in_(list(rest))
+            ).all()
+            for entry in entries:
+                digest = entry.content_sha256
+                if entry.status == "DONE" and not force:
+                    entry.hits += 1
+                    recorded[digest] = IngestLedgerService.replay(entry)
+                elif entry.status == "PROCESSING" and entry.claimed_at > now - timedelta(seconds=LEDGER_STALE_SECONDS):
+                    busy.add(digest)
+                else:
+                    # Forced reprocess, or a stale claim: take it over unless someone else just did
+                    taken = db.execute(
+                        update(IngestLedger)
+                        .where(IngestLedger.id == entry.id, IngestLedger.claimed_at == entry.claimed_at)
+                        .values(status="PROCESSING", claimed_at=now, file_name=names[digest])
+                    ).rowcount
+                    (owned if taken else busy).add(digest)
+            # Released by a failed attempt in between; complete_many() upserts the row
+            owned |= rest - {e.content_sha256 for e in entries}
+        db.commit()
+        return owned, recorded, busy
+
+    @staticmethod
+    def release_many(db: Session, kind: str, digests):
+        """Drops this batch's claims on files that failed, so they can be uploaded again."""
+        digests = list(digests)
+        if not digests:
+            return
+        db.rollback()
+        db.execute(delete(IngestLedger).where(
+            IngestLedger.kind == kind, IngestLedger.content_sha256.in_(digests),
+            IngestLedger.scope == "", IngestLedger.status == "PROCESSING"
+        ))
+        db.commit()
+
+    @staticmethod
+    def claim_batch(db: Session, kind: str, files: list, force: bool = False):
+        """
+        Fingerprints (file_name, content) uploads, folds identical content and
+        claims every distinct digest. Returns ([(digest, file_name, content)] to
+        parse, {digest: report entry} for files answered without parsing, and
+        [(file_name, digest)] for copies of a file earlier in the batch).
+        """
+        unique, copies = {}, []
+        for file_name, content in files:
+            digest = fingerprint(content)
+            if digest in unique:
+                copies.append((file_name, digest))
+            else:
+                unique[digest] = (file_name, content)
+        owned, recorded, busy = IngestLedgerService.claim_many(
+            db, kind, {digest: item[0] for digest, item in unique.items()}, force
+        )
+        answered = {}
+        for digest, (file_name, _) in unique.items():
+            if digest in recorded:
+                answered[digest] = {"file": file_name, **recorded[digest], "status": "Duplicate"}
+            elif digest in busy:
+                answered[digest] = {"file": file_name, "status": "Error",
+                                    "detail": "An identical upload is being processed right now"}
+        claimed = [(digest, *unique[digest]) for digest in unique if digest in owned]
+        return claimed, answered, copies
+
+    @staticmethod
+    def copies_report(by_digest: dict, copies: list) -> list:
+        """Report entries for in-batch copies: they share the outcome of the first file."""
+        report = []
+        for file_name, digest in copies:
+            first = by_digest[digest]
+            if first["status"] == "Error":
+                report.append({**first, "file": file_name})
+            else:
+                report.append({**first, "file": file_name, "status": "Duplicate", "duplicate_of": first["file"]})
+        return report
+
+    @staticmethod
+    def complete_many(db: Session, kind: str, outcomes: list):
+        """outcomes: [(digest, file_name, result)] recorded in one multi-row upsert."""
+        if not outcomes:
+            return
+        now = datetime.now()
+        rows = {
+            digest: {"kind": kind, "content_sha256": digest, "scope": "", "status": "DONE", "file_name": file_name,
+                     "result": result, "hits": 0, "claimed_at": now, "finished_at": now}
+            for digest, file_name, result in outcomes
+        }
+        dialect_insert = insert_for(db)
+        stmt = dialect_insert(IngestLedger).values(list(rows.values()))
+        stmt = stmt.on_conflict_do_update(
+            index_elements=LEDGER_KEY,
+            set_={"status": "DONE", "result": stmt.excluded.result, "finished_at": stmt.excluded.finished_at}
+        )
+        db.execute(stmt)
+        db.commit()
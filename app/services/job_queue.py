@@ -0,0 +1,288 @@
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from fastapi import HTTPException
+from sqlalchemy import and_, or_, update
+from sqlalchemy.orm import Session
+from app.database import SessionLocal
+from app.models.job import IngestJob
+from app.services.battery_service import BatteryService
+from app.services.cell_service import CellService
+from app.services.dispatch_service import PackDispatched
+from app.services.ingest_ledger import IngestLedgerService
+from app.services.metrics import StageTimer, record_parse_failure
+from app.services.parser_registry import parse_upload
+from app.services.process_pool import run_parse
+
+
+logger = logging.getLogger(__name__)
+
+# A RUNNING job untouched this long is assumed orphaned by a crashed worker
+JOB_STALE_SECONDS = int(os.getenv("JOB_STALE_SECONDS", "600"))
+# How often each process sweeps for orphaned jobs
+JOB_SWEEP_SECONDS = float(os.getenv("JOB_SWEEP_SECONDS", "60"))
+
+
+class ParseError(ValueError):
+    """Raised from the parse pool; the upload itself is bad, so the job is not retried."""
+
+
+def _parse_pdi(content: bytes, params: dict) -> dict:
+    return parse_upload("pdi", content)
+
+
+def _parse_grading(content: bytes, params: dict) -> dict:
+    return CellService.parse_grading_excel(content)
+
+
+def _parse_pack_test(content: bytes, params: dict) -> dict:
+    return parse_upload("pack_test", content)
+
+
+def _parse_pdi_batch(content: bytes, params: dict) -> dict:
+    return parse_upload("pdi_batch", content)
+
+
+# kind -> (parse in a worker process, write with a DB session)
+JOB_HANDLERS = {
+    "grading": (_parse_grading, lambda db, parsed, params: CellService.save_grading(db, parsed)),
+    "pack_test": (_parse_pack_test, lambda db, parsed, params: BatteryService.save_pack_test(db, parsed)),
+    "pdi": (_parse_pdi, lambda db, parsed, params: BatteryService.save_pdi(db, params["battery_id"], parsed)),
+    "pdi_batch": (_parse_pdi_batch, lambda db, parsed, params: BatteryService.save_pdi_batch(db, parsed)),
+}
+
+JOB_STATUSES = ("QUEUED", "RUNNING", "SUCCEEDED", "FAILED")
+
+
+def _parse_job(kind: str, content: bytes, params: dict) -> dict:
+    """Runs in a pool worker. HTTPException does not pickle, so errors cross back as ParseError."""
+    parse, _ = JOB_HANDLERS[kind]
+    try:
+        return parse(content, params)
+    except HTTPException as e:
+        raise ParseError(e.detail)
+    except Exception as e:
+        raise ParseError(f"{type(e).__name__}: {e}")
+
+
+class JobQueue:
+    """
+    Persistent upload queue. Uploads are stored in `ingest_jobs` and drained by
+    a pool of worker threads; the CPU-bound parse runs in the shared process pool.
+    """
+    _wakeup = threading.Event()
+    _stop = threading.Event()
+    _threads = []
+    _sweep_lock = threading.Lock()
+    _swept_at = None
+
+    @staticmethod
+    def enqueue(db: Session, kind: str, file_name: str, content: bytes, params: dict = None) -> IngestJob:
+        if kind not in JOB_HANDLERS:
+            raise HTTPException(status_code=400, detail=f"Unknown job kind: {kind}")
+        job = IngestJob(
+            kind=kind,
+            status="QUEUED",
+            progress="QUEUED",
+            file_name=file_name,
+            payload=content,
+            params=params or {},
+            max_attempts=int(os.getenv("JOB_MAX_ATTEMPTS", "3")),
+        )
+        db.add(job)
+        db.commit()
+        db.refresh(job)
+        JobQueue._wakeup.set()
+        return job
+
+    @staticmethod
+    def accepted(job: IngestJob) -> dict:
+        """Response body for an upload that was queued instead of processed inline."""
+        return {"status": "Accepted", "job_id": job.job_id, "kind": job.kind, "status_url": f"/jobs/{job.job_id}"}
+
+    @staticmethod
+    def to_dict(job: IngestJob) -> dict:
+        return {
+            "job_id": job.job_id,
+            "kind": job.kind,
+            "status": job.status,
+            "progress": job.progress,
+            "file_name": job.file_name,
+            "params": job.params,
+            "attempts": job.attempts,
+            "max_attempts": job.max_attempts,
+            "result": job.result,
+            "error": job.error,
+            "created_at": job.created_at,
+            "started_at": job.started_at,
+            "finished_at": job.finished_at,
+        }
+
+    # --- WORKER SIDE ---
+
+    @staticmethod
+    def _claim(db: Session):
+        """Picks the oldest runnable job. SKIP LOCKED lets many workers claim in parallel."""
+        job = (
+            db.query(IngestJob)
+            .filter(IngestJob.status == "QUEUED", IngestJob.available_at <= datetime.now(),
+                    IngestJob.attempts < IngestJob.max_attempts)
+            .order_by(IngestJob.available_at, IngestJob.job_id)
+            .with_for_update(skip_locked=True)
+            .first()
+        )
+        if job is None:
+            db.rollback()
+            return None
+        # Conditional update keeps the claim safe on backends without row locks
+        claimed = db.execute(
+            update(IngestJob)
+            .where(IngestJob.job_id == job.job_id, IngestJob.status == "QUEUED")
+            .values(status="RUNNING", progress="PARSING", attempts=IngestJob.attempts + 1,
+                    started_at=datetime.now(), error=None)
+        ).rowcount
+        db.commit()
+        if not claimed:
+            return None
+        db.refresh(job)
+        return job
+
+    @staticmethod
+    def _run(db: Session, job: IngestJob):
+        _, save = JOB_HANDLERS[job.kind]
+        params = job.params or {}
+
+        def ingest():
+            timer = StageTimer(job.kind)
+            try:
+                parsed = run_parse(_parse_job, job.kind, job.payload, params)
+            except ParseError as e:
+                record_parse_failure(job.kind, e)
+                raise
+            finally:
+                timer.lap("parse")
+            job.progress = "WRITING"
+            db.commit()
+            return save(db, parsed, params)
+
+        try:
+            # Same ledger as inline uploads: a file ingested meanwhile is answered from it
+            result = IngestLedgerService.process(
+                db, job.kind, job.payload, ingest, scope=params.get("battery_id", ""),
+                file_name=job.file_name, force=params.get("force", False)
+            )
+        except Exception as e:
+            db.rollback()
+            job = db.get(IngestJob, job.job_id)
+            # 4xx means the file itself is bad; retrying will not help (409: identical upload in flight, retry)
+            permanent = isinstance(e, (ParseError, PackDispatched)) or (
+                isinstance(e, HTTPException) and e.status_code < 500 and e.status_code != 409
+            )
+            if isinstance(e, HTTPException):
+                job.error = e.detail
+            elif isinstance(e, ParseError):
+                job.error = str(e)
+            else:
+                job.error = f"{type(e).__name__}: {e}"
+            if permanent or job.attempts >= job.max_attempts:
+                job.status = "FAILED"
+                job.progress = "DONE"
+                job.finished_at = datetime.now()
+                job.payload = None
+            else:
+                job.status = "QUEUED"
+                job.progress = "RETRY_WAIT"
+                job.available_at = datetime.now() + timedelta(seconds=2 ** job.attempts)
+            if not permanent:
+                logger.exception("Ingest job %s failed (attempt %s/%s)", job.job_id, job.attempts, job.max_attempts)
+            db.commit()
+            return
+
+        job.status = "SUCCEEDED"
+        job.progress = "DONE"
+        job.result = result
+        job.finished_at = datetime.now()
+        job.payload = None
+        db.commit()
+
+    @staticmethod
+    def _sweep(db: Session):
+        """One thread per process, every JOB_SWEEP_SECONDS, hands orphaned jobs back to the queue."""
+        now = time.monotonic()
+        if JobQueue._swept_at is not None and now - JobQueue._swept_at < JOB_SWEEP_SECONDS:
+            return
+        if not JobQueue._sweep_lock.acquire(blocking=False):
+            return
+        try:
+            JobQueue._swept_at = now
+            JobQueue.requeue_stale(db, JOB_STALE_SECONDS)
+        finally:
+            JobQueue._sweep_lock.release()
+
+    @staticmethod
+    def _worker_loop(poll_seconds: float):
+        # First sweep and claim one poll after start-up (or on the first local enqueue), so a
+        # restarting worker answers requests before it touches the queue
+        JobQueue._wakeup.wait(poll_seconds)
+        while not JobQueue._stop.is_set():
+            db = SessionLocal()
+            try:
+                JobQueue._sweep(db)
+                job = JobQueue._claim(db)
+                if job is not None:
+                    JobQueue._run(db, job)
+                    continue
+            except Exception:
+                db.rollback()
+                logger.exception("Job worker error")
+            finally:
+                db.close()
+            # Idle: sleep until a local enqueue or the next poll (jobs queued by other workers)
+            JobQueue._wakeup.wait(poll_seconds)
+            JobQueue._wakeup.clear()
+
+    @staticmethod
+    def requeue_stale(db: Session, stale_after_seconds: int) -> int:
+        """
+        Jobs left RUNNING by a crashed worker go back on the queue, unless they
+        have used up their attempts: a file that kills its worker every time is
+        failed instead of being reclaimed forever.
+        """
+        now = datetime.now()
+        orphaned = and_(IngestJob.status == "RUNNING", IngestJob.started_at < now - timedelta(seconds=stale_after_seconds))
+        failed = db.execute(
+            update(IngestJob)
+            .where(IngestJob.attempts >= IngestJob.max_attempts, or_(orphaned, IngestJob.status == "QUEUED"))
+            .values(status="FAILED", progress="DONE", finished_at=now, payload=None,
+                    error="Worker stopped while processing this job; no attempts left")
+        ).rowcount
+        requeued = db.execute(
+            update(IngestJob).where(orphaned).values(status="QUEUED", progress="QUEUED", available_at=now)
+        ).rowcount
+        db.commit()
+        return failed + requeued
+
+    @staticmethod
+    def start_workers(count: int = None, poll_seconds: float = None):
+        """JOB_WORKERS=0 disables draining in this process (e.g. API-only replicas)."""
+        count = count if count is not None else int(os.getenv("JOB_WORKERS", str(os.cpu_count() or 1)))
+        if count <= 0:
+            return
+        poll_seconds = poll_seconds or float(os.getenv("JOB_POLL_SECONDS", "1.0"))
+        # Orphaned jobs are swept by the workers themselves (first pass one poll in), not on the start-up path
+        JobQueue._swept_at = None
+        JobQueue._stop.clear()
+        for i in range(count):
+            t = threading.Thread(target=JobQueue._worker_loop, args=(poll_seconds,), name=f"ingest-worker-{i}", daemon=True)
+            t.start()
+            JobQueue._threads.append(t)
+
+    @staticmethod
+    def stop_workers():
+        JobQueue._stop.set()
+        JobQueue._wakeup.set()
+        for t in JobQueue._threads:
+            t.join(timeout=5)
+        JobQueue._threads.clear()
@@ -0,0 +1,203 @@
+import re
+import threading
+import time
+from bisect import bisect_left
+
+# Seconds; covers single-cell lookups up to large batch uploads
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_text(names, values, extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labelnames: tuple = ()):
+        self.name, self.help_text, self.labelnames = name, help_text, labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(labels[n] for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        lines += [f"{self.name}{_label_text(self.labelnames, key)} {value}" for key, value in items]
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name, self.help_text, self.labelnames = name, help_text, labelnames
+        self.buckets = tuple(buckets)
+        self._series = {}  # labels -> [per-bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels[n] for n in self.labelnames)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((key, list(series)) for key, series in self._series.items())
+        for key, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series[:-1]):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_label_text(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_label_text(self.labelnames, key)} {series[-1]}")
+            lines.append(f"{self.name}_count{_label_text(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Process-local metrics in Prometheus text format. With several uvicorn
+    workers each one keeps its own numbers, so scrape every worker (or run
+    one worker per container) and aggregate in Prometheus.
+    """
+
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, *args, **kwargs) -> Counter:
+        metric = Counter(*args, **kwargs)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, *args, **kwargs) -> Histogram:
+        metric = Histogram(*args, **kwargs)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(line for metric in self._metrics for line in metric.render()) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+HTTP_LATENCY = REGISTRY.histogram(
+    "http_request_duration_seconds", "Request latency by route template.", ("method", "route", "status"))
+INGEST_STAGE = REGISTRY.histogram(
+    "ingest_stage_duration_seconds", "Upload time per stage: read, parse, db_write, commit.", ("kind", "stage"))
+INGEST_FILES = REGISTRY.counter(
+    "ingest_files_total", "Uploaded workbooks by outcome.", ("kind", "outcome"))
+INGEST_ROWS = REGISTRY.counter(
+    "ingest_rows_total", "Rows written by ingestion, per table.", ("kind", "table"))
+PARSE_FAILURES = REGISTRY.counter(
+    "ingest_parse_failures_total", "Rejected workbooks by reason.", ("kind", "reason"))
+
+# Error text -> bounded reason label (first match wins)
+FAILURE_REASONS = (
+    (re.compile(r"worksheet", re.I), "missing_sheet"),
+    (re.compile(r"cell id|barcode|battery id", re.I), "missing_id"),
+    (re.compile(r"discharge|cc-d", re.I), "missing_discharge_step"),
+    (re.compile(r"not registered|not found", re.I), "unknown_record"),
+    (re.compile(r"keyerror|column|checkpoint", re.I), "missing_column"),
+    (re.compile(r"invalid excel|zip|not a valid|unsupported format|badzipfile|xlrderror", re.I), "invalid_file"),
+    (re.compile(r"could not convert|valueerror|invalid literal", re.I), "bad_value"),
+)
+
+
+def failure_reason(error) -> str:
+    if isinstance(error, Exception):
+        text = str(getattr(error, "detail", None) or f"{type(error).__name__}: {error}")
+    else:
+        text = str(error)
+    for pattern, reason in FAILURE_REASONS:
+        if pattern.search(text):
+            return reason
+    return "other"
+
+
+def record_parse_failure(kind: str, error):
+    PARSE_FAILURES.inc(kind=kind, reason=failure_reason(error))
+    INGEST_FILES.inc(kind=kind, outcome="failed")
+
+
+def record_ingested(kind: str, files: int = 1, **rows_per_table):
+    """Successful ingest: file count plus rows written, e.g. record_ingested('grading', cells=1, grading_step_results=9)."""
+    INGEST_FILES.inc(files, kind=kind, outcome="ok")
+    for table, rows in rows_per_table.items():
+        if rows:
+            INGEST_ROWS.inc(rows, kind=kind, table=table)
+
+
+class StageTimer:
+    """Records the time since the previous lap (or creation) under the given stage name."""
+
+    def __init__(self, kind: str):
+        self.kind = kind
+        self._last = time.perf_counter()
+
+    def lap(self, stage: str):
+        now = time.perf_counter()
+        INGEST_STAGE.observe(now - self._last, kind=self.kind, stage=stage)
+        self._last = now
+
+
+def timed_parse(kind: str, parse, *args):
+    """Runs a parser, recording its duration as the 'parse' stage and any failure by reason."""
+    timer = StageTimer(kind)
+    try:
+        return parse(*args)
+    except Exception as e:
+        record_parse_failure(kind, e)
+        raise
+    finally:
+        timer.lap("parse")
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware (works with StreamingResponse): latency runs until the
+    last body chunk is sent and is labelled with the route template, not the raw path.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._routes = None
+
+    def _route_of(self, scope) -> str:
+        if self._routes is None and "app" in scope:
+            self._routes = {getattr(r, "endpoint", None): r.path for r in scope["app"].routes}
+        return (self._routes or {}).get(scope.get("endpoint"), "unmatched")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        start = time.perf_counter()
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_LATENCY.observe(
+                time.perf_counter() - start,
+                method=scope["method"], route=self._route_of(scope), status=status[0]
+            )
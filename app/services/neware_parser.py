@@ -0,0 +1,252 @@
+import csv
+import io
+from datetime import time, timedelta
+from app.services.parser_registry import CSV_HEAD_BYTES, parse_upload, register_parser, sniff_delimiter
+from app.services.uploads import open_source, read_all
+
+# Labels in the 'Basic data' sheet -> key in the parsed metadata.
+# The value always sits in the cell to the right of the label.
+BASIC_DATA_KEYWORDS = {
+    "Battery code:": "cell_id",
+    "Start time:": "start_time",
+    "Work step Schedule name:": "schedule_name",
+}
+
+BASIC_SHEET = "Basic data"
+STAT_SHEET = "Statistical data"
+
+
+def _is_blank(value) -> bool:
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+def _read_xlsx_sheets(source):
+    """Streams only the two sheets we need; 'Detail data' etc. are never parsed."""
+    # Imported here so workers that never parse an upload skip loading openpyxl
+    from openpyxl import load_workbook
+
+    wb = load_workbook(open_source(source), read_only=True, data_only=True)
+    try:
+        missing = [name for name in (BASIC_SHEET, STAT_SHEET) if name not in wb.sheetnames]
+        if missing:
+            raise ValueError(f"Worksheet named '{missing[0]}' not found")
+        basic_rows = list(wb[BASIC_SHEET].iter_rows(values_only=True))
+        stat_rows = list(wb[STAT_SHEET].iter_rows(values_only=True))
+    finally:
+        wb.close()
+    return basic_rows, stat_rows
+
+
+def _read_xls_sheets(source):
+    """Legacy .xls exports; xlrd on_demand also skips unused sheets (but needs the bytes)."""
+    import xlrd
+
+    book = xlrd.open_workbook(file_contents=read_all(source), on_demand=True)
+    try:
+        sheets = []
+        for name in (BASIC_SHEET, STAT_SHEET):
+            try:
+                sheet = book.sheet_by_name(name)
+            except xlrd.biffh.XLRDError:
+                raise ValueError(f"Worksheet named '{name}' not found")
+            sheets.append([tuple(sheet.row_values(i)) for i in range(sheet.nrows)])
+    finally:
+        book.release_resources()
+    return sheets[0], sheets[1]
+
+
+def extract_basic_metadata(rows) -> dict:
+    """
+    Single keyword-indexed pass over the 'Basic data' rows.
+    Stops as soon as every label has been found.
+    """
+    metadata = {key: None for key in BASIC_DATA_KEYWORDS.values()}
+    remaining = len(BASIC_DATA_KEYWORDS)
+    for row in rows:
+        for col_idx, value in enumerate(row):
+            if not isinstance(value, str):
+                continue
+            for label, key in BASIC_DATA_KEYWORDS.items():
+                if label in value and metadata[key] is None:
+                    nxt = row[col_idx + 1] if col_idx + 1 < len(row) else None
+                    metadata[key] = None if _is_blank(nxt) else str(nxt).strip()
+                    remaining -= 1
+        if remaining == 0:
+            break
+    return metadata
+
+
+def extract_step_rows(rows) -> list:
+    """Turns the 'Statistical data' sheet into dicts keyed by the stripped header names."""
+    rows = iter(rows)
+    header = next(rows, None)
+    if header is None:
+        return []
+    columns = [str(c).strip() if c is not None else "" for c in header]
+    steps = []
+    for row in rows:
+        if all(_is_blank(v) for v in row):
+            continue
+        steps.append(dict(zip(columns, row)))
+    return steps
+
+
+def find_column(steps: list, *fragments: str):
+    """Fuzzy header lookup, e.g. find_column(steps, 'Cut-off', 'Voltage') for 'Cut-off  Voltage(V)'."""
+    if not steps:
+        return None
+    for col in steps[0]:
+        if all(f in col for f in fragments):
+            return col
+    return None
+
+
+def step_number(step: dict):
+    try:
+        return float(step.get("Work Step Number"))
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_float(value):
+    try:
+        return None if _is_blank(value) else float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_minutes(value):
+    """Step time arrives as minutes, a timedelta/time, or an 'h:mm:ss(.ms)' string."""
+    if _is_blank(value):
+        return None
+    if isinstance(value, timedelta):
+        return value.total_seconds() / 60
+    if isinstance(value, time):
+        return value.hour * 60 + value.minute + value.second / 60
+    if isinstance(value, str) and ":" in value:
+        try:
+            parts = [float(p) for p in value.strip().split(":")]
+        except ValueError:
+            return None
+        while len(parts) < 3:
+            parts.insert(0, 0.0)
+        hours, minutes, seconds = parts[-3:]
+        return hours * 60 + minutes + seconds / 60
+    return _to_float(value)
+
+
+def step_records(steps: list) -> list:
+    """Maps 'Statistical data' rows onto GradingStepResult columns (minus cell_id)."""
+    cutoff_col = find_column(steps, "Cut-off", "Voltage") or find_column(steps, "End Voltage")
+    time_col = find_column(steps, "Step Time") or find_column(steps, "Time")
+    records = []
+    for step in steps:
+        number = step_number(step)
+        if number is None:
+            continue
+        records.append({
+            "step_number": int(number),
+            "step_type": str(step.get("Work Step Name") or "").strip() or None,
+            "end_v": _to_float(step.get(cutoff_col)) if cutoff_col else None,
+            "end_cap": _to_float(step.get("Capacity(Ah)")),
+            "time_min": _to_minutes(step.get(time_col)) if time_col else None,
+        })
+    return records
+
+
+# --- REGISTERED GRADING PARSERS ---
+# Each returns {"cell_id", "start_time", "schedule_name", "steps": [row dicts]}.
+
+def _is_neware_workbook(signature) -> bool:
+    return signature.has_sheets(BASIC_SHEET, STAT_SHEET)
+
+
+def _is_neware_csv(signature) -> bool:
+    return signature.header_line("Work Step Number", "Capacity(Ah)") is not None
+
+
+def _workbook_result(basic_rows, stat_rows) -> dict:
+    metadata = extract_basic_metadata(basic_rows)
+    metadata["steps"] = extract_step_rows(stat_rows)
+    return metadata
+
+
+@register_parser("grading", "neware_xlsx", formats=("xlsx",), detect=_is_neware_workbook)
+def parse_neware_xlsx(source) -> dict:
+    return _workbook_result(*_read_xlsx_sheets(source))
+
+
+@register_parser("grading", "neware_xls", formats=("xls",), detect=_is_neware_workbook)
+def parse_neware_xls(source) -> dict:
+    return _workbook_result(*_read_xls_sheets(source))
+
+
+def _csv_value(value: str):
+    """CSV cells are text; give numbers back their type so rows look like workbook rows."""
+    value = value.strip()
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+
+def _scan_csv_sections(source):
+    """
+    Neware CSV export: 'Basic data' label/value lines, then the 'Statistical
+    data' table up to the first blank line. One pass over raw lines (no field
+    splitting) finds the table; returns (delimiter, basic_rows, header line,
+    data row count).
+    """
+    text = io.TextIOWrapper(open_source(source), encoding="utf-8-sig", errors="replace", newline="")
+    try:
+        delimiter = sniff_delimiter(text.read(CSV_HEAD_BYTES)) or ","
+        text.seek(0)
+        basic_lines, header_line, nrows = [], None, 0
+        for i, line in enumerate(text):
+            if header_line is not None:
+                if not line.replace(delimiter, "").strip():
+                    break
+                nrows += 1
+            elif "Work Step Number" in line:
+                header_line = i
+            else:
+                basic_lines.append(line)
+    finally:
+        # Leave the upload's own handle open for the caller
+        text.detach()
+    basic_rows = [tuple(_csv_value(v) for v in row) for row in csv.reader(basic_lines, delimiter=delimiter)]
+    return delimiter, basic_rows, header_line, nrows
+
+
+def _read_csv_steps(source, delimiter: str, header_line: int, nrows: int) -> list:
+    """The 'Statistical data' block through pandas' C reader, as the same row dicts extract_step_rows builds."""
+    import pandas as pd
+
+    df = pd.read_csv(
+        open_source(source), sep=delimiter, skiprows=header_line, nrows=nrows, encoding="utf-8-sig",
+        engine="c", skipinitialspace=True
+    )
+    df = df.rename(columns=lambda c: str(c).strip()).dropna(how="all")
+    # Blank cells come back as NaN; workbook rows carry None there
+    df = df.astype(object).where(df.notna(), None)
+    columns = list(df.columns)
+    # Column-wise tolist() + zip is several times faster than DataFrame.to_dict("records")
+    return [dict(zip(columns, row)) for row in zip(*(df[c].tolist() for c in columns))]
+
+
+@register_parser("grading", "neware_csv", formats=("csv",), detect=_is_neware_csv)
+def parse_neware_csv(source) -> dict:
+    delimiter, basic_rows, header_line, nrows = _scan_csv_sections(source)
+    metadata = extract_basic_metadata(basic_rows)
+    metadata["steps"] = _read_csv_steps(source, delimiter, header_line, nrows) if header_line is not None else []
+    return metadata
+
+
+def parse_neware_workbook(source) -> dict:
+    """
+    Reads a Neware grading export (xlsx, legacy xls or CSV; bytes or a binary
+    file handle) through the parser registry.
+    """
+    return parse_upload("grading", source)
@@ -0,0 +1,75 @@
+import base64
+import json
+from datetime import datetime
+from decimal import Decimal
+from sqlalchemy import DateTime, Numeric, and_, false, or_, tuple_
+from fastapi import HTTPException
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+def encode_cursor(values: list) -> str:
+    """Opaque cursor for the last row's key values; a NULL key round-trips as JSON null."""
+    raw = json.dumps([v.isoformat() if isinstance(v, datetime) else str(v) if isinstance(v, Decimal) else v
+                      for v in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, columns: list) -> list:
+    """Turns an opaque cursor back into typed key values for `columns`."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(values, list) or len(values) != len(columns):
+            raise ValueError("wrong key length")
+        typed = []
+        for col, value in zip(columns, values):
+            if value is not None and isinstance(col.type, DateTime):
+                value = datetime.fromisoformat(value)
+            elif value is not None and isinstance(col.type, Numeric):
+                value = Decimal(value)
+            typed.append(value)
+        return typed
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _seek(columns: list, last: list, descending: bool):
+    """
+    Rows after `last` in the keyset order. NOT NULL keys use one row-value
+    comparison, which the index serves; with a nullable key the comparison is
+    spelled out column by column, NULLs sorting after every value.
+    """
+    if not any(c.nullable for c in columns):
+        key = tuple_(*columns)
+        return key < tuple_(*last) if descending else key > tuple_(*last)
+    branches, equal = [], []
+    for col, value in zip(columns, last):
+        if value is not None:
+            past = col < value if descending else col > value
+            branches.append(and_(*equal, or_(past, col.is_(None)) if col.nullable else past))
+        equal.append(col.is_(None) if value is None else col == value)
+    return or_(*branches) if branches else false()
+
+
+def keyset_page(query, columns: list, cursor: str = None, limit: int = DEFAULT_PAGE_SIZE, descending: bool = False) -> dict:
+    """
+    Keyset (seek) pagination: WHERE (k1, k2) > (:last_k1, :last_k2) ORDER BY k1, k2 LIMIT n.
+    Cost per page stays flat no matter how deep the client pages, as long as an
+    index ends in the same key columns. Keep keys NOT NULL where possible:
+    NULLs in a nullable key are paged last, which an index in the default
+    order cannot serve.
+    """
+    if cursor:
+        query = query.filter(_seek(columns, decode_cursor(cursor, columns), descending))
+    order = [c.desc() if descending else c.asc() for c in columns]
+    order = [o.nulls_last() if c.nullable else o for c, o in zip(columns, order)]
+    rows = query.order_by(*order).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last_row = rows[-1]
+        next_cursor = encode_cursor([getattr(last_row, c.key) for c in columns])
+    return {"items": rows, "next_cursor": next_cursor, "limit": limit}
@@ -0,0 +1,163 @@
+import codecs
+import importlib
+import os
+import re
+import zipfile
+from dataclasses import dataclass
+from app.services.uploads import open_source, read_all, read_head
+
+# Modules whose import registers parsers. Extra vendors: PARSER_PLUGINS=pkg.module,other.module
+BUILTIN_PARSER_MODULES = ("app.services.neware_parser", "app.services.tester_parsers")
+
+XLSX_MAGIC = b"PK\x03\x04"
+XLS_MAGIC = b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"  # OLE2 compound document (legacy .xls)
+
+# Enough of a CSV export to see its preamble and table header
+CSV_HEAD_BYTES = 64 * 1024
+CSV_HEAD_LINES = 64
+
+_SHEET_NAME = re.compile(rb'<sheet\b[^>]*?\bname="([^"]*)"')
+
+
+@dataclass(frozen=True)
+class UploadSignature:
+    """What an upload looks like, gathered without parsing its data."""
+    format: str                                  # "xlsx", "xls", "csv" or "unknown"
+    sheets: frozenset = frozenset()              # workbook formats
+    lines: tuple = ()                            # csv: first lines of text
+    delimiter: str = ","
+
+    def has_sheets(self, *names: str) -> bool:
+        return all(name in self.sheets for name in names)
+
+    def header_line(self, *labels: str):
+        """Index of the first CSV line holding every label (a table header), else None."""
+        for index, line in enumerate(self.lines):
+            if all(label in line for label in labels):
+                return index
+        return None
+
+
+@dataclass(frozen=True)
+class ParserSpec:
+    kind: str
+    name: str
+    formats: tuple
+    parse: object
+    detect: object = None
+    priority: int = 0
+
+
+_PARSERS = {}   # kind -> [ParserSpec], highest priority first
+_loaded = False
+
+
+def register_parser(kind: str, name: str, formats: tuple, detect=None, priority: int = 0):
+    """
+    Decorator for a parser `fn(source) -> dict` of one upload kind. `detect(signature)`
+    decides whether it understands a file; without it, any file of `formats` is accepted.
+    """
+    def decorator(parse):
+        specs = [s for s in _PARSERS.get(kind, []) if s.name != name]
+        specs.append(ParserSpec(kind, name, tuple(formats), parse, detect, priority))
+        specs.sort(key=lambda s: -s.priority)
+        _PARSERS[kind] = specs
+        return parse
+    return decorator
+
+
+def _load_parsers():
+    global _loaded
+    if _loaded:
+        return
+    plugins = [m.strip() for m in os.getenv("PARSER_PLUGINS", "").split(",") if m.strip()]
+    for module in (*BUILTIN_PARSER_MODULES, *plugins):
+        importlib.import_module(module)
+    _loaded = True
+
+
+def registered_parsers(kind: str = None) -> list:
+    _load_parsers()
+    if kind is not None:
+        return list(_PARSERS.get(kind, []))
+    return [spec for specs in _PARSERS.values() for spec in specs]
+
+
+# --- FORMAT DETECTION ---
+
+def _xlsx_sheets(source) -> frozenset:
+    """Sheet names from xl/workbook.xml; the worksheets themselves are not opened."""
+    try:
+        with zipfile.ZipFile(open_source(source)) as archive:
+            return frozenset(name.decode("utf-8", "replace") for name in _SHEET_NAME.findall(archive.read("xl/workbook.xml")))
+    except (zipfile.BadZipFile, KeyError):
+        return frozenset()
+
+
+def _xls_sheets(source) -> frozenset:
+    import xlrd
+
+    try:
+        book = xlrd.open_workbook(file_contents=read_all(source), on_demand=True)
+    except xlrd.biffh.XLRDError:
+        return frozenset()
+    try:
+        return frozenset(book.sheet_names())
+    finally:
+        book.release_resources()
+
+
+def decode_text(raw: bytes) -> str:
+    if raw.startswith(codecs.BOM_UTF8):
+        raw = raw[len(codecs.BOM_UTF8):]
+    try:
+        return raw.decode("utf-8")
+    except UnicodeDecodeError as e:
+        if e.start >= len(raw) - 3:
+            # The head cut a multi-byte character in half
+            return raw[:e.start].decode("utf-8")
+        return raw.decode("latin-1")
+
+
+def sniff_delimiter(sample: str):
+    """Most frequent of , ; and tab in the sample (European exports use ';'), or None."""
+    counts = {d: sample.count(d) for d in (",", ";", "\t")}
+    delimiter = max(counts, key=counts.get)
+    return delimiter if counts[delimiter] else None
+
+
+def _csv_signature(head: bytes) -> UploadSignature:
+    if b"\0" in head:
+        return UploadSignature("unknown")
+    lines = tuple(decode_text(head).splitlines()[:CSV_HEAD_LINES])
+    delimiter = sniff_delimiter("\n".join(lines))
+    if delimiter is None:
+        return UploadSignature("unknown", lines=lines)
+    return UploadSignature("csv", lines=lines, delimiter=delimiter)
+
+
+def inspect_upload(source) -> UploadSignature:
+    """Magic bytes first, then sheet names (workbooks) or the leading lines (CSV)."""
+    head = read_head(source, CSV_HEAD_BYTES)
+    if head.startswith(XLSX_MAGIC):
+        return UploadSignature("xlsx", sheets=_xlsx_sheets(source))
+    if head.startswith(XLS_MAGIC):
+        return UploadSignature("xls", sheets=_xls_sheets(source))
+    return _csv_signature(head)
+
+
+# --- DISPATCH ---
+
+def parse_upload(kind: str, source) -> dict:
+    """
+    Parses an upload (bytes or a binary file handle) with the first registered
+    parser of `kind` that recognises it. Raises ValueError for unknown formats.
+    """
+    _load_parsers()
+    signature = inspect_upload(source)
+    for spec in _PARSERS.get(kind, ()):
+        if signature.format in spec.formats and (spec.detect is None or spec.detect(signature)):
+            return spec.parse(source)
+    seen = f"sheets: {', '.join(sorted(signature.sheets))}" if signature.sheets else f"{signature.format} file"
+    known = ", ".join(spec.name for spec in _PARSERS.get(kind, ())) or "none"
+    raise ValueError(f"Unsupported format for a {kind} upload ({seen}); known parsers: {known}")
@@ -0,0 +1,94 @@
+import logging
+import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from fastapi import HTTPException
+
+logger = logging.getLogger(__name__)
+
+# Shared pool for CPU-bound workbook parsing. Created on first use so
+# lookup-only workers never fork.
+_parse_pool = None
+_pool_lock = threading.Lock()
+
+
+class ParsePoolBroken(HTTPException):
+    """A parse worker died twice in a row (e.g. killed for memory); the work can be retried later."""
+
+    def __init__(self):
+        super().__init__(status_code=503, detail="Parser process crashed, retry shortly", headers={"Retry-After": "5"})
+
+
+def parse_workers() -> int:
+    # GRADING_PARSE_WORKERS is the older name, from when only grading batches used the pool
+    return int(os.getenv("PARSE_WORKERS") or os.getenv("GRADING_PARSE_WORKERS") or "0") or os.cpu_count() or 1
+
+
+def get_parse_pool() -> ProcessPoolExecutor:
+    global _parse_pool
+    with _pool_lock:
+        if _parse_pool is None:
+            _parse_pool = ProcessPoolExecutor(max_workers=parse_workers())
+        return _parse_pool
+
+
+def _replace_broken(pool: ProcessPoolExecutor):
+    """Drops a pool whose worker died; the next get_parse_pool() forks a fresh one."""
+    global _parse_pool
+    with _pool_lock:
+        if _parse_pool is pool:
+            _parse_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _with_pool(work):
+    """
+    Runs work(pool). A dead worker breaks the whole executor (every pending and
+    later future fails with BrokenProcessPool), so the pool is replaced and the
+    work tried once more on a fresh one before giving up with a 503.
+    """
+    for attempt in (1, 2):
+        pool = get_parse_pool()
+        try:
+            return work(pool)
+        except BrokenProcessPool:
+            logger.warning("Parse pool broken (attempt %s), replacing it", attempt)
+            _replace_broken(pool)
+    raise ParsePoolBroken()
+
+
+def run_parse(fn, *args):
+    """fn(*args) in a pool worker, blocking until it returns."""
+    return _with_pool(lambda pool: pool.submit(fn, *args).result())
+
+
+def map_parse(fn, items: list, load=None, in_flight: int = 0) -> list:
+    """
+    [fn(load(item)) for item in items] across the pool, in order. At most
+    in_flight (default: two per worker) are submitted at a time and load()
+    runs only as each item is submitted, so a ZIP of a whole shift is
+    decompressed a few workbooks at a time instead of held in memory whole.
+    """
+    load = load or (lambda item: item)
+    limit = in_flight or 2 * parse_workers()
+
+    def work(pool):
+        results, pending = [], deque()
+        for item in items:
+            if len(pending) >= limit:
+                results.append(pending.popleft().result())
+            pending.append(pool.submit(fn, load(item)))
+        results += [future.result() for future in pending]
+        return results
+
+    return _with_pool(work)
+
+
+def shutdown_parse_pool():
+    global _parse_pool
+    with _pool_lock:
+        pool, _parse_pool = _parse_pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
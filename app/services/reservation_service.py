@@ -0,0 +1,78 @@
+from sqlalchemy import update, insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app.models.battery import BatteryPack, BMSInventory, pack_cell_mapping
+from app.models.cell import Cell
+from fastapi import HTTPException
+
+
+class ReservationService:
+    """
+    Claims shared stock (cells, BMS units, pack slots) safely when many assembly
+    stations write at once. Every claim is a guarded UPDATE (`... AND is_used = false`)
+    whose rowcount tells us whether we won; pack rows are locked FOR UPDATE only
+    while slots are counted, so different packs never wait on each other.
+    """
+
+    @staticmethod
+    def lock_pack(db: Session, battery_id: str) -> BatteryPack:
+        """Row lock on the pack: serialises slot counting for this pack only."""
+        pack = db.query(BatteryPack).filter_by(battery_id=battery_id).with_for_update().first()
+        if not pack:
+            raise HTTPException(status_code=404, detail="Battery Pack not found")
+        return pack
+
+    @staticmethod
+    def claim_cells(db: Session, cell_ids: list) -> int:
+        """Returns how many of `cell_ids` this transaction claimed."""
+        return db.execute(
+            update(Cell)
+            .where(Cell.cell_id.in_(cell_ids), Cell.is_used == False)
+            .values(is_used=True)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+
+    @staticmethod
+    def reserve_and_link(db: Session, battery_id: str, cell_ids: list) -> int:
+        """
+        Marks cells used and inserts their mapping rows in the caller's transaction.
+        Returns the rows claimed; anything short of len(cell_ids) means another
+        station won a cell and the caller must roll back.
+        """
+        claimed = ReservationService.claim_cells(db, cell_ids)
+        if claimed != len(cell_ids):
+            return claimed
+        db.execute(insert(pack_cell_mapping), [{"battery_id": battery_id, "cell_id": c} for c in cell_ids])
+        return claimed
+
+    @staticmethod
+    def claim_bms(db: Session, battery_id: str, bms_id: str):
+        """Mounts a BMS on a pack; both sides are guarded so two stations cannot double-mount."""
+        bms_claimed = db.execute(
+            update(BMSInventory)
+            .where(BMSInventory.bms_id == bms_id, BMSInventory.is_used == False)
+            .values(is_used=True)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if not bms_claimed:
+            db.rollback()
+            raise HTTPException(status_code=409, detail="This BMS is already assigned to another pack")
+
+        pack_updated = db.execute(
+            update(BatteryPack)
+            .where(BatteryPack.battery_id == battery_id, BatteryPack.bms_id.is_(None))
+            .values(bms_id=bms_id)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if not pack_updated:
+            db.rollback()
+            raise HTTPException(status_code=409, detail="This pack already has a BMS mounted")
+
+    @staticmethod
+    def commit_or_conflict(db: Session, detail: str):
+        """Commit, turning a unique/PK violation from a concurrent writer into a 409."""
+        try:
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+            raise HTTPException(status_code=409, detail=detail)
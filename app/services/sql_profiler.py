@@ -0,0 +1,153 @@
+import logging
+import os
+import time
+from collections import Counter
+from contextvars import ContextVar
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+_current = ContextVar("sql_profile", default=None)
+
+
+class QueryProfile:
+    """Queries issued while handling one request (shared with its threadpool calls)."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = Counter()   # identical SQL text -> executions
+        self.lazy_loads = Counter()   # 'BatteryPack.cells' -> lazy loads triggered
+
+    def repeated(self, threshold: int) -> list:
+        return [(sql, n) for sql, n in self.statements.most_common() if n >= threshold]
+
+
+class SQLProfiler:
+    """
+    Opt-in query profiling (SQL_PROFILE=1), attached through engine and
+    session events so no query site has to change:
+
+    - every statement is counted against the current request;
+    - statements slower than SQL_SLOW_MS are logged with their EXPLAIN plan;
+    - SQL text executed SQL_REPEAT_THRESHOLD+ times in one request, and the
+      lazy-loaded relationships behind it, are logged as N+1 suspects;
+    - SQLProfilerMiddleware returns X-Query-Count / X-Query-Time-Ms headers.
+    """
+    slow_seconds = float(os.getenv("SQL_SLOW_MS", "100")) / 1000
+    repeat_threshold = int(os.getenv("SQL_REPEAT_THRESHOLD", "5"))
+    explain = os.getenv("SQL_EXPLAIN", "1") == "1"
+
+    @staticmethod
+    def enabled() -> bool:
+        return os.getenv("SQL_PROFILE") == "1"
+
+    @staticmethod
+    def install(engine, session_factory):
+        event.listen(engine, "before_cursor_execute", SQLProfiler._before_execute)
+        event.listen(engine, "after_cursor_execute", SQLProfiler._after_execute)
+        event.listen(session_factory, "do_orm_execute", SQLProfiler._orm_execute)
+
+    # --- EVENT HOOKS ---
+
+    @staticmethod
+    def _before_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @staticmethod
+    def _after_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        profile = _current.get()
+        if profile is not None:
+            profile.count += 1
+            profile.seconds += elapsed
+            profile.statements[statement] += 1
+        if elapsed >= SQLProfiler.slow_seconds:
+            plan = None
+            if SQLProfiler.explain and not executemany:
+                plan = SQLProfiler._explain(conn, statement, parameters)
+            logger.warning("Slow query (%.1f ms): %s\nparams: %r%s", elapsed * 1000, statement, parameters,
+                           f"\nplan:\n{plan}" if plan else "")
+
+    @staticmethod
+    def _orm_execute(orm_execute_state):
+        profile = _current.get()
+        if profile is not None and orm_execute_state.is_relationship_load and orm_execute_state.lazy_loaded_from is not None:
+            path = orm_execute_state.loader_strategy_path
+            profile.lazy_loads[str(path[-1]) if path else "?"] += 1
+
+    @staticmethod
+    def _explain(conn, statement, parameters):
+        """Plan of an already-executed statement; runs on a raw DBAPI cursor so it is not profiled itself."""
+        if not statement.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE", "INSERT", "WITH")):
+            return None
+        prefix = "EXPLAIN QUERY PLAN " if conn.dialect.name == "sqlite" else "EXPLAIN "
+        # On PostgreSQL any error aborts the request's open transaction, so the
+        # EXPLAIN gets its own savepoint and a failure is rolled back to it
+        savepoint = conn.dialect.name == "postgresql"
+        cursor = conn.connection.cursor()
+        try:
+            if savepoint:
+                cursor.execute("SAVEPOINT sql_profiler_explain")
+            try:
+                cursor.execute(prefix + statement, parameters)
+                return "\n".join(" ".join(str(col) for col in row) for row in cursor.fetchall())
+            except Exception as e:
+                if savepoint:
+                    cursor.execute("ROLLBACK TO SAVEPOINT sql_profiler_explain")
+                return f"(EXPLAIN failed: {e})"
+            finally:
+                if savepoint:
+                    cursor.execute("RELEASE SAVEPOINT sql_profiler_explain")
+        except Exception as e:
+            return f"(EXPLAIN skipped: {e})"
+        finally:
+            cursor.close()
+
+    # --- REQUEST SCOPE ---
+
+    @staticmethod
+    def start() -> QueryProfile:
+        profile = QueryProfile()
+        _current.set(profile)
+        return profile
+
+    @staticmethod
+    def report(profile: QueryProfile, label: str):
+        repeated = profile.repeated(SQLProfiler.repeat_threshold)
+        if repeated:
+            lazy = ", ".join(f"{name} x{n}" for name, n in profile.lazy_loads.most_common())
+            logger.warning(
+                "Possible N+1 in %s: %d queries; repeated statements:\n%s%s",
+                label, profile.count,
+                "\n".join(f"  {n}x {sql}" for sql, n in repeated),
+                f"\nlazy loads: {lazy}" if lazy else "",
+            )
+
+
+class SQLProfilerMiddleware:
+    """Pure ASGI: opens a QueryProfile per request and adds the debug headers."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        profile = SQLProfiler.start()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                # Streamed bodies keep querying after this point; their header shows the count so far
+                headers = list(message.get("headers", []))
+                headers.append((b"x-query-count", str(profile.count).encode()))
+                headers.append((b"x-query-time-ms", f"{profile.seconds * 1000:.1f}".encode()))
+                headers.append((b"x-query-repeated", str(len(profile.repeated(SQLProfiler.repeat_threshold))).encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            SQLProfiler.report(profile, f"{scope['method']} {scope['path']}")
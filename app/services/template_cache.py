@@ -0,0 +1,138 @@
+import os
+import threading
+import time
+from dataclasses import dataclass
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+from app.database import SessionLocal, insert_for
+from app.models.cache_version import CacheVersion
+from app.models.template import BatteryTemplate
+
+CACHE_NAME = "battery_templates"
+# Session.info flag set by invalidate(); the local copy is dropped once that session commits
+STALE_FLAG = "template_cache_stale"
+
+
+@dataclass(frozen=True)
+class TemplateSpec:
+    """Detached, read-only copy of a BatteryTemplate row (safe to share across sessions)."""
+    model_name: str
+    target_capacity_ah: float
+    tolerance_ah: float
+    cell_count_required: int
+    series_count: int
+    parallel_count: int
+
+    @classmethod
+    def from_row(cls, row: BatteryTemplate) -> "TemplateSpec":
+        return cls(
+            model_name=row.model_name,
+            target_capacity_ah=float(row.target_capacity_ah),
+            tolerance_ah=float(row.tolerance_ah if row.tolerance_ah is not None else 0.05),
+            cell_count_required=row.cell_count_required,
+            series_count=row.series_count or 0,
+            parallel_count=row.parallel_count or 0,
+        )
+
+
+class TemplateCache:
+    """
+    Process-local BatteryTemplate cache.
+
+    Writes call invalidate(), which bumps the 'battery_templates' row in
+    cache_versions; this process drops its copy once that write commits.
+    Other workers compare the version at most every
+    TEMPLATE_CACHE_CHECK_SECONDS and drop their copy when it moved, so a
+    hot path costs no query between checks.
+    """
+    _lock = threading.Lock()
+    _entries = {}
+    _version = None
+    _checked_at = 0.0
+    _hits = 0
+    _misses = 0
+    _invalidations = 0
+    check_seconds = float(os.getenv("TEMPLATE_CACHE_CHECK_SECONDS", "5"))
+
+    @staticmethod
+    def _current_version(db: Session) -> int:
+        return db.execute(select(CacheVersion.version).where(CacheVersion.name == CACHE_NAME)).scalar() or 0
+
+    @staticmethod
+    def _sync(db: Session):
+        now = time.monotonic()
+        if now - TemplateCache._checked_at < TemplateCache.check_seconds:
+            return
+        version = TemplateCache._current_version(db)
+        with TemplateCache._lock:
+            if version != TemplateCache._version:
+                TemplateCache._entries.clear()
+                TemplateCache._version = version
+            TemplateCache._checked_at = now
+
+    @staticmethod
+    def get(db: Session, model_name: str):
+        """Returns a TemplateSpec, or None if the model does not exist (misses are not cached)."""
+        TemplateCache._sync(db)
+        spec = TemplateCache._entries.get(model_name)
+        if spec is not None:
+            TemplateCache._hits += 1
+            return spec
+
+        TemplateCache._misses += 1
+        row = db.query(BatteryTemplate).filter_by(model_name=model_name).first()
+        if row is None:
+            return None
+        spec = TemplateSpec.from_row(row)
+        with TemplateCache._lock:
+            TemplateCache._entries[model_name] = spec
+        return spec
+
+    @staticmethod
+    def invalidate(db: Session):
+        """
+        Call inside the transaction that changes battery_templates, before commit:
+        the version bump then becomes visible to other workers together with the change.
+        This process drops its copy after the commit (clearing earlier would let a
+        concurrent read cache the old row again before the change is visible).
+        """
+        dialect_insert = insert_for(db)
+        stmt = dialect_insert(CacheVersion).values(name=CACHE_NAME, version=1)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[CacheVersion.name],
+            set_={"version": CacheVersion.version + 1}
+        )
+        db.execute(stmt)
+        db.info[STALE_FLAG] = True
+
+    @staticmethod
+    def clear():
+        with TemplateCache._lock:
+            TemplateCache._entries.clear()
+            TemplateCache._version = None
+            TemplateCache._checked_at = 0.0
+            TemplateCache._invalidations += 1
+
+    @staticmethod
+    def stats() -> dict:
+        lookups = TemplateCache._hits + TemplateCache._misses
+        return {
+            "hits": TemplateCache._hits,
+            "misses": TemplateCache._misses,
+            "hit_ratio": round(TemplateCache._hits / lookups, 4) if lookups else None,
+            "entries": len(TemplateCache._entries),
+            "invalidations": TemplateCache._invalidations,
+            "version": TemplateCache._version,
+            "check_seconds": TemplateCache.check_seconds,
+        }
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _clear_after_commit(session):
+    if session.info.pop(STALE_FLAG, False):
+        TemplateCache.clear()
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _discard_on_rollback(session):
+    session.info.pop(STALE_FLAG, None)
@@ -0,0 +1,364 @@
+"""
+Pack tester and PDI checklist parsers, registered for the "pack_test", "pdi"
+and "pdi_batch" (pallet sign-off) upload kinds. Workbooks and CSV exports of
+the same table share one extraction step, so both formats yield identical results.
+"""
+import csv
+import io
+import re
+from app.services.parser_registry import CSV_HEAD_BYTES, CSV_HEAD_LINES, register_parser, sniff_delimiter
+from app.services.uploads import open_source, read_all, read_head
+
+PACK_INFO_SHEET = "Template Info"
+PACK_STEP_SHEET = "Step Layer"
+
+
+def _read_head_lines(source) -> list:
+    text = io.TextIOWrapper(open_source(source), encoding="utf-8-sig", errors="replace", newline="")
+    try:
+        return text.read(CSV_HEAD_BYTES).splitlines()
+    finally:
+        text.detach()
+
+
+def _read_csv_table(source, header_line: int, delimiter: str):
+    """pandas' C reader from the table header on; rows of other widths (trailing sections) are skipped."""
+    import pandas as pd
+
+    return pd.read_csv(
+        open_source(source), sep=delimiter, skiprows=header_line, encoding="utf-8-sig",
+        on_bad_lines="skip", skip_blank_lines=True
+    )
+
+
+# --- PACK TEST ---
+
+# Multi-channel exports carry one Step Layer row set per channel, tagged with the pack barcode
+BARCODE_COLUMNS = ("Barcode", "Battery ID", "Battery Code")
+PACK_TEST_FIELDS = (
+    # (result key, Step Layer column, required)
+    ("cap_ah", "Discharge Capacity(Ah)", True),
+    ("end_v", "End Volt(V)", True),
+    ("end_a", "Set Current(A)", True),
+    ("energy_wh", "Discharge Energy(Wh)", False),
+    ("test_duration_min", "Step Time(Min)", False),
+    ("avg_voltage", "Discharge Mid Volt(V)", False),
+)
+
+
+def _pack_tests(step_df, battery_id: str = None) -> list:
+    """
+    First 'Discharge' row per pack of the Step Layer -> result dicts. With a
+    barcode column every channel in the sheet is extracted at once; without
+    one the sheet is a single pack, identified by `battery_id`.
+    """
+    step_df.columns = [str(c).strip() for c in step_df.columns]
+    discharge = step_df[step_df['Process'] == 'Discharge']
+    id_col = next((c for c in BARCODE_COLUMNS if c in step_df.columns), None)
+    if id_col is not None:
+        discharge = discharge[discharge[id_col].notna()].drop_duplicates(subset=[id_col], keep="first")
+    else:
+        discharge = discharge.head(1)
+    if discharge.empty:
+        raise ValueError("No 'Discharge' step found in file")
+
+    columns = {}
+    for key, column, required in PACK_TEST_FIELDS:
+        if column in discharge.columns:
+            columns[key] = discharge[column].astype(float).fillna(0.0).tolist()
+        elif required:
+            raise ValueError(f"Step Layer column '{column}' not found")
+        else:
+            columns[key] = [0.0] * len(discharge)
+    ids = [_barcode(v) for v in discharge[id_col]] if id_col is not None else [battery_id]
+    return [
+        {"battery_id": bid, **{key: values[i] for key, values in columns.items()}}
+        for i, bid in enumerate(ids)
+    ]
+
+
+def _barcode(value) -> str:
+    return str(value).replace("Barcode:", "").strip()
+
+
+def _csv_barcode(lines: list, header: int, delimiter: str):
+    """'Barcode: P1' in one field, or 'Barcode:' followed by the id in the next, above the table."""
+    line = next((line for line in lines[:header] if "Barcode" in line), None)
+    if line is None:
+        return None
+    fields = [f.strip().strip('"') for f in line.split(delimiter)]
+    return _barcode(fields[0]) or next((f for f in fields[1:] if f), "")
+
+
+def _pack_test_workbook_tests(source) -> list:
+    import pandas as pd
+
+    excel_data = pd.ExcelFile(open_source(source))
+    step_df = excel_data.parse(PACK_STEP_SHEET)
+    if any(c in step_df.columns for c in BARCODE_COLUMNS):
+        return _pack_tests(step_df)
+    info_df = excel_data.parse(PACK_INFO_SHEET, header=None, nrows=1)
+    return _pack_tests(step_df, _barcode(info_df.iloc[0, 0]))
+
+
+def _pack_test_csv_tests(source) -> list:
+    lines = _read_head_lines(source)
+    delimiter = sniff_delimiter("\n".join(lines)) or ","
+    header = next(i for i, line in enumerate(lines) if "Process" in line and "Discharge Capacity(Ah)" in line)
+    step_df = _read_csv_table(source, header, delimiter)
+    if any(c in [str(col).strip() for col in step_df.columns] for c in BARCODE_COLUMNS):
+        return _pack_tests(step_df)
+    battery_id = _csv_barcode(lines, header, delimiter)
+    if battery_id is None:
+        raise ValueError("Barcode line not found above the Step Layer table")
+    return _pack_tests(step_df, battery_id)
+
+
+def _single_pack(tests: list) -> dict:
+    if len(tests) > 1:
+        raise ValueError(f"Multi-channel export with {len(tests)} packs; upload it to /battery-packs/upload-pack-test/batch")
+    return tests[0]
+
+
+def _is_pack_test_workbook(signature) -> bool:
+    return signature.has_sheets(PACK_INFO_SHEET, PACK_STEP_SHEET)
+
+
+def _is_multichannel_workbook(signature) -> bool:
+    return signature.has_sheets(PACK_STEP_SHEET)
+
+
+def _is_pack_test_csv(signature) -> bool:
+    return signature.header_line("Process", "Discharge Capacity(Ah)") is not None
+
+
+@register_parser("pack_test", "pack_tester_excel", formats=("xlsx", "xls"), detect=_is_pack_test_workbook)
+def parse_pack_test_workbook(source) -> dict:
+    """Pack tester export: barcode in 'Template Info' A1, metrics in 'Step Layer'."""
+    return _single_pack(_pack_test_workbook_tests(source))
+
+
+@register_parser("pack_test", "pack_tester_csv", formats=("csv",), detect=_is_pack_test_csv)
+def parse_pack_test_csv(source) -> dict:
+    """CSV export of the Step Layer, preceded by the 'Barcode: ...' line."""
+    return _single_pack(_pack_test_csv_tests(source))
+
+
+@register_parser("pack_test_batch", "pack_tester_multichannel_excel", formats=("xlsx", "xls"),
+                 detect=_is_multichannel_workbook)
+def parse_pack_test_channels_workbook(source) -> dict:
+    """Multi-channel export (barcode column in 'Step Layer') or a single-channel file."""
+    return {"tests": _pack_test_workbook_tests(source)}
+
+
+@register_parser("pack_test_batch", "pack_tester_multichannel_csv", formats=("csv",), detect=_is_pack_test_csv)
+def parse_pack_test_channels_csv(source) -> dict:
+    return {"tests": _pack_test_csv_tests(source)}
+
+
+# --- PDI CHECKLIST ---
+# One compiled alternation classifies each checklist row (or pallet-sheet column)
+# in a single regex pass, instead of a str.contains scan of the sheet per checkpoint.
+# Every keyword in a label counts, as with the per-checkpoint scan: "Terminal label"
+# answers both the terminal and the label checkpoints.
+
+# PDIChecklist column -> keywords of the checklist's 'Checkpoint' text
+PDI_KEYWORDS = (
+    ("visual_finish_ok", ("visual",)),
+    ("terminal_tightness_ok", ("terminal",)),
+    ("internal_wiring_routing_ok", ("wiring",)),
+    ("handle_secure_ok", ("handle",)),
+    ("sticker_labeling_ok", ("label",)),
+    ("bms_communication_ok", ("bms",)),
+    ("short_circuit_test_ok", ("short",)),
+    ("polarity_check_ok", ("polarity",)),
+    ("warranty_seal_applied", ("warranty",)),
+    ("accessories_included", ("accessor",)),
+    ("final_ocv_v", ("ocv",)),
+)
+PDI_BOOL_COLUMNS = tuple(col for col, _ in PDI_KEYWORDS if col != "final_ocv_v")
+_PDI_PATTERN = re.compile(
+    "|".join(f"(?P<{col}>{'|'.join(map(re.escape, words))})" for col, words in PDI_KEYWORDS), re.IGNORECASE
+)
+PASS_VALUES = frozenset(("pass", "ok", "yes", "true", "1", "1.0", "y"))
+BATTERY_ID_LABELS = ("battery id", "battery code", "battery_id", "barcode", "pack id")
+
+
+def classify_checkpoint(text) -> tuple:
+    """PDIChecklist columns a checkpoint label answers, in order; empty when no keyword matches."""
+    return tuple(dict.fromkeys(match.lastgroup for match in _PDI_PATTERN.finditer(str(text))))
+
+
+def _passed(status) -> bool:
+    return str(status).strip().lower() in PASS_VALUES
+
+
+def _ocv(value) -> float:
+    """A recorded OCV must be a number; a typo must not pass inspection as 0 V."""
+    try:
+        return float(str(value).strip())
+    except (TypeError, ValueError):
+        raise ValueError(f"OCV reading {value!r} is not a number")
+
+
+def _blank(value) -> bool:
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+def checklist_from_pairs(pairs) -> dict:
+    """
+    (checkpoint label, status) pairs -> PDIChecklist values. The first row per
+    column wins and a missing checkpoint counts as failed. Labels that match no
+    column are kept under 'other_checkpoints' for the PDICheckpoint master list.
+    """
+    results = {col: False for col in PDI_BOOL_COLUMNS}
+    results["final_ocv_v"] = 0.0
+    found, other = set(), {}
+    for label, status in pairs:
+        if _blank(label):
+            continue
+        columns = classify_checkpoint(label)
+        if not columns:
+            other.setdefault(str(label).strip(), _passed(status))
+        for column in columns:
+            if column not in found:
+                found.add(column)
+                results[column] = _ocv(status) if column == "final_ocv_v" else _passed(status)
+    if other:
+        results["other_checkpoints"] = other
+    return results
+
+
+def _workbook_rows(source):
+    """Rows of the first worksheet, streamed (openpyxl read-only / xlrd)."""
+    if read_head(source, 4) == b"PK\x03\x04":
+        from openpyxl import load_workbook
+
+        wb = load_workbook(open_source(source), read_only=True, data_only=True)
+        try:
+            yield from wb.worksheets[0].iter_rows(values_only=True)
+        finally:
+            wb.close()
+    else:
+        import xlrd
+
+        book = xlrd.open_workbook(file_contents=read_all(source), on_demand=True)
+        try:
+            sheet = book.sheet_by_index(0)
+            for i in range(sheet.nrows):
+                yield tuple(sheet.row_values(i))
+        finally:
+            book.release_resources()
+
+
+def _csv_rows(source):
+    text = io.TextIOWrapper(open_source(source), encoding="utf-8-sig", errors="replace", newline="")
+    try:
+        delimiter = sniff_delimiter(text.read(CSV_HEAD_BYTES)) or ","
+        text.seek(0)
+        yield from csv.reader(text, delimiter=delimiter)
+    finally:
+        text.detach()
+
+
+def _header(rows, required):
+    """Advances `rows` past the first row holding every required label; returns {label: index}."""
+    for row in rows:
+        labels = {str(v).strip().lower(): i for i, v in enumerate(row) if not _blank(v)}
+        if all(any(name in labels for name in group) for group in required):
+            return labels
+    return None
+
+
+def _column(labels: dict, names: tuple):
+    return next((labels[name] for name in names if name in labels), None)
+
+
+def _cell(row, index):
+    return row[index] if index is not None and index < len(row) else None
+
+
+def pdi_from_rows(rows) -> dict:
+    """Single-pack checklist: 'Checkpoint' / 'Status' rows."""
+    rows = iter(rows)
+    labels = _header(rows, (("checkpoint",), ("status",)))
+    if labels is None:
+        raise ValueError("Checklist needs 'Checkpoint' and 'Status' columns")
+    name_col, status_col = labels["checkpoint"], labels["status"]
+    return checklist_from_pairs((_cell(row, name_col), _cell(row, status_col)) for row in rows)
+
+
+def pallet_from_rows(rows) -> dict:
+    """
+    PDI sign-off for many packs, keyed by battery ID. Either one row per pack
+    with a column per checkpoint, or long form: Battery ID / Checkpoint / Status.
+    """
+    rows = iter(rows)
+    labels = _header(rows, (BATTERY_ID_LABELS,))
+    if labels is None:
+        raise ValueError("Pallet checklist needs a 'Battery ID' column")
+    id_col = _column(labels, BATTERY_ID_LABELS)
+
+    if "checkpoint" in labels and "status" in labels:
+        name_col, status_col = labels["checkpoint"], labels["status"]
+        pairs_by_pack = {}
+        for row in rows:
+            battery_id = _cell(row, id_col)
+            if not _blank(battery_id):
+                pairs_by_pack.setdefault(str(battery_id).strip(), []).append(
+                    (_cell(row, name_col), _cell(row, status_col))
+                )
+        packs = {}
+        for battery_id, pairs in pairs_by_pack.items():
+            try:
+                packs[battery_id] = checklist_from_pairs(pairs)
+            except ValueError as e:
+                raise ValueError(f"Battery {battery_id}: {e}")
+    else:
+        # Wide form: each header is classified once, then every row is a pack
+        checkpoint_cols = [(label, i) for label, i in labels.items() if i != id_col and label != "remarks"]
+        packs = {}
+        for row in rows:
+            battery_id = _cell(row, id_col)
+            if _blank(battery_id):
+                continue
+            battery_id = str(battery_id).strip()
+            if battery_id in packs:
+                raise ValueError(f"Battery {battery_id} appears more than once in the checklist")
+            try:
+                packs[battery_id] = checklist_from_pairs((label, _cell(row, i)) for label, i in checkpoint_cols)
+            except ValueError as e:
+                raise ValueError(f"Battery {battery_id}: {e}")
+
+    if not packs:
+        raise ValueError("No battery IDs found in the pallet checklist")
+    return {"packs": packs}
+
+
+def _is_pdi_csv(signature) -> bool:
+    return signature.header_line("Checkpoint", "Status") is not None
+
+
+def _is_pallet_csv(signature) -> bool:
+    return any(label in line.lower() for line in signature.lines[:CSV_HEAD_LINES] for label in BATTERY_ID_LABELS)
+
+
+@register_parser("pdi", "pdi_excel", formats=("xlsx", "xls"))
+def parse_pdi_workbook(source) -> dict:
+    """Checklist on the first sheet: 'Checkpoint' / 'Status' columns."""
+    return pdi_from_rows(_workbook_rows(source))
+
+
+@register_parser("pdi", "pdi_csv", formats=("csv",), detect=_is_pdi_csv)
+def parse_pdi_csv(source) -> dict:
+    return pdi_from_rows(_csv_rows(source))
+
+
+@register_parser("pdi_batch", "pdi_pallet_excel", formats=("xlsx", "xls"))
+def parse_pdi_pallet_workbook(source) -> dict:
+    return pallet_from_rows(_workbook_rows(source))
+
+
+@register_parser("pdi_batch", "pdi_pallet_csv", formats=("csv",), detect=_is_pallet_csv)
+def parse_pdi_pallet_csv(source) -> dict:
+    return pallet_from_rows(_csv_rows(source))
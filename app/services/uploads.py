@@ -0,0 +1,164 @@
+import io
+import os
+import threading
+import zipfile
+from contextlib import contextmanager
+from fastapi import HTTPException, UploadFile
+
+# Whole request body (a batch upload counts all its files); rejected with 413 beyond this
+MAX_UPLOAD_BYTES = int(float(os.getenv("MAX_UPLOAD_MB", "100")) * 1024 * 1024)
+# Uncompressed total of the workbooks inside one ZIP batch (guards against zip bombs).
+# Workbooks are already compressed, so a real shift ZIP unpacks to about its upload size.
+MAX_UNZIPPED_BYTES = int(float(os.getenv("MAX_UNZIPPED_MB", os.getenv("MAX_UPLOAD_MB", "100"))) * 1024 * 1024)
+# Workbooks parsed at once by this worker process; later uploads wait for a slot
+PARSE_CONCURRENCY = int(os.getenv("PARSE_CONCURRENCY", "0")) or os.cpu_count() or 1
+PARSE_WAIT_SECONDS = float(os.getenv("PARSE_WAIT_SECONDS", "30"))
+
+CHUNK_BYTES = 1024 * 1024
+
+_parse_slots = threading.BoundedSemaphore(PARSE_CONCURRENCY)
+
+
+class UploadTooLarge(HTTPException):
+    def __init__(self, limit: int = MAX_UPLOAD_BYTES):
+        super().__init__(status_code=413, detail=f"Upload exceeds the {limit // (1024 * 1024)} MB limit")
+
+
+class ParserBusy(HTTPException):
+    def __init__(self):
+        super().__init__(
+            status_code=503, detail="Too many uploads are being parsed, retry shortly",
+            headers={"Retry-After": str(int(PARSE_WAIT_SECONDS) or 1)}
+        )
+
+
+# --- FILE SOURCES (parsers accept bytes or a binary file handle) ---
+
+class ZipMember:
+    """A workbook inside an uploaded ZIP; decompressed only when it is read."""
+
+    def __init__(self, archive: zipfile.ZipFile, info: zipfile.ZipInfo):
+        self.archive = archive
+        self.info = info
+
+    def open(self):
+        return self.archive.open(self.info)
+
+
+def spooled(file: UploadFile):
+    """
+    The handle Starlette already streamed the upload into (a SpooledTemporaryFile:
+    memory up to 1 MiB, disk beyond), rewound for parsing instead of read into RAM.
+    """
+    if file.size is not None and file.size > MAX_UPLOAD_BYTES:
+        raise UploadTooLarge()
+    file.file.seek(0)
+    return file.file
+
+
+def open_source(source):
+    """Binary file object positioned at the start, for openpyxl / pandas / zipfile."""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return io.BytesIO(source)
+    source.seek(0)
+    return source
+
+
+def read_head(source, size: int) -> bytes:
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return bytes(source[:size])
+    source.seek(0)
+    head = source.read(size)
+    source.seek(0)
+    return head
+
+
+def read_all(source) -> bytes:
+    """Full content, for the few consumers that need bytes (xlrd, job payloads, pool workers)."""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return bytes(source)
+    if isinstance(source, ZipMember):
+        with source.open() as member:
+            return member.read()
+    source.seek(0)
+    content = source.read()
+    source.seek(0)
+    return content
+
+
+def load_named(item):
+    """(file_name, source) -> (file_name, bytes), the form pool workers receive."""
+    file_name, source = item
+    return file_name, read_all(source)
+
+
+def iter_chunks(source):
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        yield source
+        return
+    if isinstance(source, ZipMember):
+        with source.open() as member:
+            yield from iter(lambda: member.read(CHUNK_BYTES), b"")
+        return
+    source.seek(0)
+    for chunk in iter(lambda: source.read(CHUNK_BYTES), b""):
+        yield chunk
+    source.seek(0)
+
+
+# --- PARSE CONCURRENCY ---
+
+@contextmanager
+def parse_slot():
+    """Caps concurrent in-process parses so a burst of uploads cannot hold N DataFrames at once."""
+    if not _parse_slots.acquire(timeout=PARSE_WAIT_SECONDS):
+        raise ParserBusy()
+    try:
+        yield
+    finally:
+        _parse_slots.release()
+
+
+# --- REQUEST SIZE LIMIT ---
+
+class UploadLimitMiddleware:
+    """
+    Pure ASGI: refuses bodies over MAX_UPLOAD_BYTES before they are spooled.
+    A declared Content-Length is rejected up front; chunked bodies are counted
+    as they stream in and cut off with 413 once they cross the limit.
+    """
+
+    def __init__(self, app, max_bytes: int = MAX_UPLOAD_BYTES):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("POST", "PUT", "PATCH"):
+            return await self.app(scope, receive, send)
+
+        length = dict(scope["headers"]).get(b"content-length")
+        if length is not None and length.isdigit() and int(length) > self.max_bytes:
+            return await self._reject(send)
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    # An HTTPException, so FastAPI's body parsing passes it through as a 413
+                    raise UploadTooLarge(self.max_bytes)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+    async def _reject(self, send):
+        body = f'{{"detail":"Upload exceeds the {self.max_bytes // (1024 * 1024)} MB limit"}}'.encode()
+        await send({
+            "type": "http.response.start", "status": 413,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()),
+                        (b"connection", b"close")],
+        })
+        await send({"type": "http.response.body", "body": body})
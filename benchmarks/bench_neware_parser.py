@@ -0,0 +1,70 @@
+"""
+Per-file parse time of a Neware grading export: legacy pandas/iloc scan vs the
+streaming xlsx parser in app/services/neware_parser.py, and the CSV export of
+the same run through the parser registry.
+
+Run from the repo root:
+    python -m benchmarks.bench_neware_parser --files 20 --detail-rows 5000
+"""
+import argparse
+import io
+import statistics
+import time
+
+import pandas as pd
+
+from app.services.neware_parser import parse_neware_workbook
+from benchmarks.workbooks import grading_csv, grading_workbook
+
+
+def legacy_parse(file_content: bytes) -> dict:
+    """The pre-streaming implementation: full ExcelFile load plus a cell-by-cell iloc scan."""
+    excel_file = pd.ExcelFile(io.BytesIO(file_content))
+    df_basic = excel_file.parse("Basic data", header=None)
+    cell_id = None
+    for row_idx in range(len(df_basic)):
+        for col_idx in range(len(df_basic.columns)):
+            val = str(df_basic.iloc[row_idx, col_idx])
+            if "Battery code:" in val:
+                cell_id = str(df_basic.iloc[row_idx, col_idx + 1]).strip()
+                break
+    df_stat = excel_file.parse("Statistical data")
+    df_stat.columns = df_stat.columns.str.strip()
+    row = df_stat[df_stat["Work Step Number"] == 3.0].iloc[0]
+    return {"cell_id": cell_id, "capacity": float(row["Capacity(Ah)"])}
+
+
+def time_parser(fn, workbooks) -> list:
+    fn(workbooks[0])  # warm-up: imports and first-call caches
+    timings = []
+    for content in workbooks:
+        start = time.perf_counter()
+        fn(content)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--files", type=int, default=20)
+    parser.add_argument("--detail-rows", type=int, default=5000)
+    args = parser.parse_args()
+
+    workbooks = [grading_workbook(f"CELL{i:05d}", 100 + i * 0.01, detail_rows=args.detail_rows) for i in range(args.files)]
+    csvs = [grading_csv(f"CELL{i:05d}", 100 + i * 0.01, detail_rows=args.detail_rows) for i in range(args.files)]
+    size_kb = statistics.mean(len(w) for w in workbooks) / 1024
+    csv_kb = statistics.mean(len(c) for c in csvs) / 1024
+    print(f"{args.files} files, {args.detail_rows} detail rows, ~{size_kb:.0f} KiB xlsx / ~{csv_kb:.0f} KiB csv each")
+
+    for name, fn, files in (
+        ("legacy (pd.ExcelFile + iloc)", legacy_parse, workbooks),
+        ("streaming xlsx (neware_parser)", parse_neware_workbook, workbooks),
+        ("csv export (neware_parser)", parse_neware_workbook, csvs),
+    ):
+        timings = time_parser(fn, files)
+        print(f"{name:32s} mean {statistics.mean(timings):8.1f} ms/file   "
+              f"median {statistics.median(timings):8.1f} ms   max {max(timings):8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""
+Synthetic factory workbooks shaped like the real exports, for benchmarks and
+local experiments (production files cannot leave the plant).
+
+    grading_workbook   Neware grading export: 'Basic data', 'Statistical data', 'Detail data'
+    pack_test_workbook pack tester export:    'Template Info', 'Step Layer'
+    pdi_workbook       PDI checklist:         one sheet of Checkpoint / Status rows
+    grading_csv        the same grading run as the cycler's native CSV export
+    pdi_pallet_workbook pallet sign-off:      a row per Battery ID, a column per checkpoint
+    multichannel_pack_test_workbook  one tester export for many channels, barcode per 'Step Layer' row
+
+Sizes are driven by `detail_rows` / `records`. Sheets are written in normal
+(not write-only) mode on purpose: like Excel and the tester software, that
+records each sheet's <dimension>, without which openpyxl's read-only loader
+has to scan every sheet just to size it and parse timings become unrealistic.
+"""
+import csv
+import io
+import random
+from openpyxl import Workbook
+
+# Neware schedule used on the grading line: CC-D is always work step 3
+GRADING_STEPS = (
+    # (step, name, minutes, capacity factor, open V, cut-off V)
+    (1.0, "Rest", 10.0, 0.0, 3.301, 3.301),
+    (2.0, "CC-C", 125.0, 1.002, 3.312, 3.650),
+    (3.0, "CC-D", 118.5, 1.000, 3.390, 2.492),
+    (4.0, "Rest", 5.0, 0.0, 2.601, 2.601),
+)
+
+PDI_CHECKPOINTS = (
+    "Visual finish", "Terminal tightness", "Internal wiring routing", "Handle secure",
+    "Sticker labeling", "BMS communication", "Short circuit test", "Polarity check",
+    "Warranty seal", "Accessories included",
+)
+
+
+def _minutes_to_hms(minutes: float) -> str:
+    seconds = int(round(minutes * 60))
+    return f"{seconds // 3600}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+def _new_workbook() -> Workbook:
+    wb = Workbook()
+    wb.remove(wb.active)
+    return wb
+
+
+def _save(wb: Workbook) -> bytes:
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    return buffer.getvalue()
+
+
+def grading_workbook(cell_id: str, capacity: float = 102.3, ocv: float = 3.390,
+                     detail_rows: int = 5000, rng: random.Random = None) -> bytes:
+    """One cell's grading run; 'Detail data' (1 s records) dominates the file size, as on the line."""
+    rng = rng or random.Random(cell_id)
+    wb = _new_workbook()
+
+    basic = wb.create_sheet("Basic data")
+    basic.append(["Device:", "BTS-4000", "Channel:", f"{rng.randint(1, 8)}-{rng.randint(1, 32)}"])
+    basic.append(["Battery code:", cell_id, "Start time:", "2026-10-01 08:00:00"])
+    basic.append(["Work step Schedule name:", "Grading_0.5C_105Ah", "Creator:", "line1"])
+    basic.append(["Remarks:", None, "Barcode rule:", "MV-LFP"])
+
+    stat = wb.create_sheet("Statistical data")
+    stat.append(["Cycle Index", "Work Step Number", "Work Step Name", "Step Time",
+                 "Capacity(Ah)", "Energy(Wh)", "Open Voltage(V)", "Cut-off  Voltage(V)"])
+    for step, name, minutes, factor, open_v, cutoff_v in GRADING_STEPS:
+        cap = round(capacity * factor, 3)
+        if step == 3.0:
+            open_v = ocv
+        stat.append([1, step, name, _minutes_to_hms(minutes), cap, round(cap * 3.2, 2), open_v, cutoff_v])
+
+    detail = wb.create_sheet("Detail data")
+    detail.append(["Record Index", "Work Step Number", "Voltage(V)", "Current(A)", "Capacity(Ah)", "Temperature(C)"])
+    for i in range(detail_rows):
+        step = 3.0 if i > detail_rows // 2 else 2.0
+        detail.append([i + 1, step, round(3.2 + rng.random() * 0.2, 4),
+                       -52.5 if step == 3.0 else 52.5, round(capacity * i / detail_rows, 4),
+                       round(25 + rng.random() * 3, 1)])
+    return _save(wb)
+
+
+def grading_csv(cell_id: str, capacity: float = 102.3, ocv: float = 3.390,
+                detail_rows: int = 5000, rng: random.Random = None) -> bytes:
+    """CSV export: 'Basic data' label/value lines, the step table, then the detail records after a blank line."""
+    rng = rng or random.Random(cell_id)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(["Device:", "BTS-4000", "Channel:", f"{rng.randint(1, 8)}-{rng.randint(1, 32)}"])
+    writer.writerow(["Battery code:", cell_id, "Start time:", "2026-10-01 08:00:00"])
+    writer.writerow(["Work step Schedule name:", "Grading_0.5C_105Ah", "Creator:", "line1"])
+    writer.writerow(["Cycle Index", "Work Step Number", "Work Step Name", "Step Time",
+                     "Capacity(Ah)", "Energy(Wh)", "Open Voltage(V)", "Cut-off  Voltage(V)"])
+    for step, name, minutes, factor, open_v, cutoff_v in GRADING_STEPS:
+        cap = round(capacity * factor, 3)
+        if step == 3.0:
+            open_v = ocv
+        writer.writerow([1, step, name, _minutes_to_hms(minutes), cap, round(cap * 3.2, 2), open_v, cutoff_v])
+    writer.writerow([])
+    writer.writerow(["Record Index", "Work Step Number", "Voltage(V)", "Current(A)", "Capacity(Ah)", "Temperature(C)"])
+    for i in range(detail_rows):
+        step = 3.0 if i > detail_rows // 2 else 2.0
+        writer.writerow([i + 1, step, round(3.2 + rng.random() * 0.2, 4), -52.5 if step == 3.0 else 52.5,
+                         round(capacity * i / detail_rows, 4), round(25 + rng.random() * 3, 1)])
+    return buffer.getvalue().encode()
+
+
+def pack_test_workbook(battery_id: str, capacity: float = 100.0, nominal_v: float = 51.2,
+                       records: int = 200, rng: random.Random = None) -> bytes:
+    """Pack tester export: barcode header plus the 'Step Layer' process table."""
+    rng = rng or random.Random(battery_id)
+    wb = _new_workbook()
+
+    info = wb.create_sheet("Template Info")
+    info.append([f"Barcode: {battery_id}"])
+    info.append(["Template:", "LFP_16S_Discharge"])
+    info.append(["Operator:", "QC1"])
+
+    steps = wb.create_sheet("Step Layer")
+    steps.append(["Step", "Process", "Set Current(A)", "End Volt(V)", "Discharge Capacity(Ah)",
+                  "Discharge Energy(Wh)", "Step Time(Min)", "Discharge Mid Volt(V)"])
+    steps.append([1, "Rest", 0, round(nominal_v + 2, 2), 0, 0, 5, 0])
+    steps.append([2, "Charge", 50, round(nominal_v * 1.13, 2), 0, 0, 120, 0])
+    steps.append([3, "Discharge", 50, round(nominal_v * 0.82, 2), round(capacity, 3),
+                  round(capacity * nominal_v, 1), round(capacity / 50 * 60, 1), nominal_v])
+
+    # Record-level trace, like the tester's 'Record Layer' sheet
+    trace = wb.create_sheet("Record Layer")
+    trace.append(["Record", "Voltage(V)", "Current(A)"])
+    for i in range(records):
+        trace.append([i + 1, round(nominal_v + rng.uniform(-3, 3), 3), 50])
+    return _save(wb)
+
+
+def multichannel_pack_test_workbook(capacities: dict, nominal_v: float = 51.2) -> bytes:
+    """`capacities` maps battery_id -> discharge Ah; one channel (three steps) per pack."""
+    wb = _new_workbook()
+    info = wb.create_sheet("Template Info")
+    info.append([f"Channels: {len(capacities)}"])
+    info.append(["Template:", "LFP_16S_Discharge"])
+
+    steps = wb.create_sheet("Step Layer")
+    steps.append(["Channel", "Barcode", "Step", "Process", "Set Current(A)", "End Volt(V)",
+                  "Discharge Capacity(Ah)", "Discharge Energy(Wh)", "Step Time(Min)", "Discharge Mid Volt(V)"])
+    for channel, (battery_id, capacity) in enumerate(capacities.items(), start=1):
+        steps.append([channel, battery_id, 1, "Rest", 0, round(nominal_v + 2, 2), 0, 0, 5, 0])
+        steps.append([channel, battery_id, 2, "Charge", 50, round(nominal_v * 1.13, 2), 0, 0, 120, 0])
+        steps.append([channel, battery_id, 3, "Discharge", 50, round(nominal_v * 0.82, 2), round(capacity, 3),
+                      round(capacity * nominal_v, 1), round(capacity / 50 * 60, 1), nominal_v])
+    return _save(wb)
+
+
+def pdi_workbook(failing: tuple = (), final_ocv: float = 53.1) -> bytes:
+    """PDI checklist; checkpoints named in `failing` are marked 'Fail'."""
+    wb = _new_workbook()
+    sheet = wb.create_sheet("PDI")
+    sheet.append(["Checkpoint", "Status", "Remarks"])
+    for name in PDI_CHECKPOINTS:
+        sheet.append([name, "Fail" if name in failing else "OK", None])
+    sheet.append(["Final OCV (V)", final_ocv, None])
+    return _save(wb)
+
+
+def pdi_pallet_workbook(battery_ids: list, failing: dict = None, final_ocv: float = 53.1) -> bytes:
+    """One sheet for a whole pallet; `failing` maps battery_id -> checkpoint names marked 'Fail'."""
+    failing = failing or {}
+    wb = _new_workbook()
+    sheet = wb.create_sheet("Pallet PDI")
+    sheet.append(["Battery ID", *PDI_CHECKPOINTS, "Final OCV (V)", "Remarks"])
+    for battery_id in battery_ids:
+        failed = failing.get(battery_id, ())
+        sheet.append([battery_id, *("Fail" if name in failed else "OK" for name in PDI_CHECKPOINTS), final_ocv, None])
+    return _save(wb)
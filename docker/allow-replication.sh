@@ -0,0 +1,4 @@
+#!/bin/bash
+# Primary side of the local read replica (docker-compose profile "replica")
+set -e
+echo "host replication all all scram-sha-256" >> "$PGDATA/pg_hba.conf"